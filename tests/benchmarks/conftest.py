@@ -0,0 +1,72 @@
+"""Timing helpers for the benchmark suite
+
+Budgets are deliberately loose so they only catch real regressions, such as an
+accidental quadratic loop. Benchmarks are skipped unless selected with
+-m benchmark. Set $BENCH_SLACK to scale every budget on slow machines, e.g.
+BENCH_SLACK=3 pytest tests/ -m benchmark
+"""
+
+import os
+import time
+import statistics
+from typing import Any, Callable
+
+import pytest
+
+SLACK = float(os.environ.get("BENCH_SLACK", 1))
+
+_results: list[tuple[str, dict[str, float]]] = []
+
+
+def pytest_collection_modifyitems(items):
+    for item in items:
+        if "benchmarks" in str(item.fspath):
+            item.add_marker(pytest.mark.benchmark)
+
+
+def pytest_terminal_summary(terminalreporter):
+    if not _results:
+        return
+
+    terminalreporter.section("benchmarks")
+    width = max(len(name) for name, _ in _results)
+    for name, stats in _results:
+        terminalreporter.write_line(
+            f"{name:<{width}}  "
+            + "  ".join(f"{k} {v * 1000:9.3f}ms" for k, v in stats.items())
+        )
+
+
+class Bench:
+    """Times a function over several rounds and records the result"""
+
+    def __call__(
+        self, name: str, fn: Callable[[], Any], rounds: int = 20, warmup: int = 2
+    ) -> dict[str, float]:
+        for _ in range(warmup):
+            fn()
+
+        times = []
+        for _ in range(rounds):
+            start = time.perf_counter()
+            fn()
+            times.append(time.perf_counter() - start)
+
+        times.sort()
+        stats = {
+            "min": times[0],
+            "median": statistics.median(times),
+            "p95": times[min(len(times) - 1, int(len(times) * 0.95))],
+        }
+        _results.append((name, stats))
+        return stats
+
+
+@pytest.fixture
+def bench():
+    return Bench()
+
+
+def budget(seconds: float) -> float:
+    """Scales a time budget by $BENCH_SLACK"""
+    return seconds * SLACK
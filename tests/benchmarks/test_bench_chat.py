@@ -0,0 +1,127 @@
+"""End to end benchmarks of the chat request path against MockOpenAI"""
+
+import io
+import asyncio
+import contextlib
+
+import pytest
+
+from xontrib_chatgpt.chatgpt import ChatGPT
+from xontrib_chatgpt.chatmanager import ChatManager
+from xontrib_chatgpt.tokens import TokenLedger
+from xontrib_chatgpt import transport as tp
+from tests.benchmarks.conftest import budget
+
+WORDS = "lorem ipsum dolor sit amet consectetur adipiscing elit "
+
+
+def prefill(chat: ChatGPT, n: int) -> None:
+    """Gives chat a history of n messages, as if loaded from a saved file"""
+    for i in range(n):
+        role = "user" if i % 2 == 0 else "assistant"
+        chat.messages.append({"role": role, "content": f"{i} {WORDS}"})
+        chat._tokens.append(len(WORDS.split()) + 4)
+
+    chat.chat_idx = -n
+    chat.trim_convo()
+
+
+@pytest.fixture
+def quiet():
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+
+@pytest.fixture
+def transport(xession):
+    yield tp.open_transport()
+    tp.close_transport()
+
+
+def test_single_chat_latency(bench, mock_openai, transport, quiet):
+    chat = ChatGPT()
+    stats = bench("single chat: send and print", lambda: chat._send(WORDS * 4))
+
+    assert len(mock_openai.requests) == 22
+    assert stats["median"] < budget(0.02)
+
+
+def test_single_chat_latency_overhead(bench, mock_openai, transport, quiet):
+    mock_openai.latency = 0.02
+    chat = ChatGPT()
+    stats = bench("single chat: 20ms server", lambda: chat._send(WORDS), rounds=10)
+
+    # Everything on top of the server's latency is client side overhead
+    assert stats["median"] - 0.02 < budget(0.02)
+
+
+def test_many_chat_throughput(bench, mock_openai, transport, quiet):
+    mock_openai.latency = 0.02
+    cm = ChatManager()
+    chats = [{"name": str(i), "inst": ChatGPT()} for i in range(32)]
+
+    stats = bench(
+        "32 chats: broadcast, 8 workers",
+        lambda: asyncio.run(cm._broadcast(WORDS, chats, 8)),
+        rounds=5,
+        warmup=1,
+    )
+
+    # 32 requests in 4 waves of 8, instead of 32 sequential round trips
+    assert stats["median"] < budget(32 * 0.02 / 2)
+    assert all(len(c["inst"].messages) == 12 for c in chats)
+
+
+@pytest.mark.parametrize("n", [100, 1000, 5000])
+def test_long_convo_turn(bench, mock_openai, transport, quiet, n):
+    chat = ChatGPT()
+    prefill(chat, n)
+    stats = bench(f"long convo: turn with {n} messages", lambda: chat.chat(WORDS))
+
+    assert chat.tokens <= chat._max_tokens
+    # Only the trimmed window is sent, so a turn must not grow with the history
+    assert stats["median"] < budget(0.02)
+
+
+def test_long_convo_scaling(bench, mock_openai, transport, quiet):
+    medians = {}
+    for n in (500, 5000):
+        chat = ChatGPT()
+        prefill(chat, n)
+        medians[n] = bench(
+            f"long convo: turn and trim at {n}", lambda: chat.chat(WORDS)
+        )["median"]
+
+    assert medians[5000] < medians[500] * 3 * budget(1)
+
+
+def test_trim_loaded_history(bench):
+    counts = [len(WORDS.split()) + 4] * 100000
+    chat = ChatGPT()
+
+    def trim():
+        chat._tokens = TokenLedger(counts)
+        chat.chat_idx = -len(counts)
+        chat.trim_convo()
+
+    stats = bench("trim 100000 loaded messages", trim, rounds=5, warmup=1)
+    assert chat.tokens <= chat._max_tokens
+    # Building the ledger is linear, the trim itself is a single bisect
+    assert stats["median"] < budget(0.1)
+
+
+@pytest.mark.parametrize("n", [1000, 10000])
+def test_long_convo_save(bench, mock_openai, tmpdir, quiet, n):
+    chat = ChatGPT()
+    prefill(chat, n)
+    path = str(tmpdir / "convo.txt")
+
+    stats = bench(
+        f"long convo: save {n} messages",
+        lambda: chat.save_convo(path, mode="text", override=True),
+        rounds=5,
+        warmup=1,
+    )
+
+    # Saving is linear in the number of messages
+    assert stats["median"] / n < budget(50e-6)
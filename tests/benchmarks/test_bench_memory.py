@@ -0,0 +1,31 @@
+"""Benchmarks of the memory held by long-lived conversations"""
+
+import json
+import tracemalloc
+
+from xontrib_chatgpt.messages import to_messages
+
+
+def _allocated(build):
+    tracemalloc.start()
+    try:
+        kept = build()
+        size, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del kept
+    return size
+
+
+def test_message_records_memory():
+    # 50 chats of 1000 short messages, as they come back from a saved file
+    text = json.dumps(
+        [
+            {"role": "user" if i % 2 == 0 else "assistant", "content": str(i)}
+            for i in range(1000)
+        ]
+    )
+
+    as_dicts = _allocated(lambda: [json.loads(text) for _ in range(50)])
+    as_records = _allocated(lambda: [to_messages(json.loads(text)) for _ in range(50)])
+    assert as_records < as_dicts * 0.6
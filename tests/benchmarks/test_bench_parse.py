@@ -0,0 +1,18 @@
+"""Benchmarks of parsing large saved conversations"""
+
+from xontrib_chatgpt.utils import parse_convo
+from tests.benchmarks.conftest import budget
+
+LINE = "    The quick brown fox jumps over the lazy dog.\n"
+
+
+def test_parse_large_text_convo(bench):
+    # About 4 MB, with long messages that used to be rescanned line by line
+    convo = "".join(
+        f"{'user' if i % 2 == 0 else 'assistant'}:\n{LINE * 400}\n" for i in range(200)
+    )
+    stats = bench("parse 4MB text convo", lambda: parse_convo(convo), rounds=3)
+
+    messages, _ = parse_convo(convo)
+    assert len(messages) == 200
+    assert stats["median"] < budget(1.0)
@@ -0,0 +1,82 @@
+"""Benchmarks of highlighting conversations for printing"""
+
+import re
+
+from xontrib_chatgpt import utils
+from xontrib_chatgpt.chatgpt import ChatGPT
+from xontrib_chatgpt.render import RenderCache, render_markdown
+from tests.benchmarks.conftest import budget
+
+RESPONSE = """\
+Here is how to **read** a file:
+```python
+with open('file.txt') as f:
+    print(f.read())
+```
+Use `open` with a `with` block so the file is closed.
+"""
+
+
+def test_reprint_unchanged_convo(bench, xession, monkeypatch):
+    chat = ChatGPT()
+    for i in range(300):
+        role = "user" if i % 2 == 0 else "assistant"
+        chat.messages.append({"role": role, "content": f"{i} {RESPONSE}"})
+
+    monkeypatch.setattr(utils, "render_cache", RenderCache(max_entries=1000))
+    cold = bench(
+        "print 300 messages: uncached",
+        lambda: utils.render_cache.clear() or chat._get_printed_convo(0),
+        rounds=3,
+        warmup=1,
+    )
+    warm = bench(
+        "print 300 messages: cached", lambda: chat._get_printed_convo(0), rounds=3
+    )
+
+    assert warm["median"] < cold["median"] * budget(0.2)
+
+
+CODE = """\
+```{lang}
+def fib(n):
+    a, b = 0, 1
+    for _ in range(n):
+        a, b = b, a + b
+    return a
+```
+"""
+
+
+def markdown_only(text: str) -> str:
+    """How responses were highlighted before, with the generic markdown lexer"""
+    from pygments import highlight
+    from pygments.lexers.markup import MarkdownLexer
+    from pygments.formatters import Terminal256Formatter
+    from pygments.styles.gh_dark import GhDarkStyle
+
+    text = highlight(text, MarkdownLexer(), Terminal256Formatter(style=GhDarkStyle))
+    text = re.sub(r"```.*?\n", "", text, flags=re.DOTALL)
+    return re.sub(r"`(.*?)`", r"\1", text)
+
+
+def test_code_heavy_response(bench):
+    langs = ["python", "bash", "js", "rust", "xonsh", "python"]
+    response = "".join(
+        f"Step {i}, call `fib`:\n" + CODE.format(lang=langs[i % len(langs)])
+        for i in range(60)
+    )
+
+    before = bench(
+        "highlight code-heavy response: markdown lexer",
+        lambda: markdown_only(response),
+        rounds=5,
+    )
+    after = bench(
+        "highlight code-heavy response: per-fence lexers",
+        lambda: render_markdown(response),
+        rounds=5,
+    )
+
+    assert "```" not in render_markdown(response)
+    assert after["median"] < before["median"] * budget(1.0)
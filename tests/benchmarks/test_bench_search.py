@@ -0,0 +1,24 @@
+"""Benchmarks of searching saved conversations"""
+
+import random
+
+from xontrib_chatgpt.catalog import Catalog
+from tests.benchmarks.conftest import budget
+
+WORDS = "server config python error deploy query index cache thread socket".split()
+
+
+def test_search_thousands_of_chats(bench, tmp_path):
+    rng = random.Random(0)
+    for i in range(2000):
+        text = " ".join(rng.choice(WORDS) for _ in range(200))
+        (tmp_path / f"user_chat{i}_2023-01-01.txt").write_text(
+            f"user:\n    {text}\n\nassistant:\n    {text}\n"
+        )
+
+    catalog = Catalog(str(tmp_path))
+    catalog.search("server")  # builds the index
+    stats = bench("search 2000 chats", lambda: catalog.search("server config"))
+
+    assert len(catalog.search("server config")) == 10
+    assert stats["median"] < budget(0.05)
@@ -0,0 +1,48 @@
+"""Benchmarks of tokenizing large conversations"""
+
+import pytest
+
+from xontrib_chatgpt import tokens
+from xontrib_chatgpt.tokens import TokenCache
+from tests.benchmarks.conftest import budget
+
+TEXT = "The quick brown fox jumps over the lazy dog. " * 40
+
+
+@pytest.fixture(scope="module")
+def encoder():
+    try:
+        tokens.tiktoken.encode("warm up")
+    except Exception as e:
+        pytest.skip(f"tiktoken encoding unavailable: {e}")
+
+
+@pytest.fixture
+def convo():
+    roles = ["user", "assistant"]
+    return [{"role": roles[i % 2], "content": f"{i} {TEXT}"} for i in range(2000)]
+
+
+def test_tokenize_serial_vs_batched(bench, encoder, convo):
+    serial = bench(
+        "tokenize 2000 messages: 1 thread",
+        lambda: TokenCache(threads=1).get_token_list(convo),
+        rounds=3,
+        warmup=1,
+    )
+    batched = bench(
+        "tokenize 2000 messages: batched",
+        lambda: TokenCache().get_token_list(convo),
+        rounds=3,
+        warmup=1,
+    )
+
+    assert batched["median"] < serial["median"] * budget(1.5)
+
+
+def test_tokenize_cached(bench, encoder, convo):
+    cache = TokenCache()
+    cache.get_token_list(convo)
+    stats = bench("tokenize 2000 messages: cached", lambda: cache.get_token_list(convo))
+
+    assert stats["median"] < budget(0.05)
@@ -0,0 +1,24 @@
+from collections import OrderedDict
+
+import openai
+import pytest
+
+from xontrib_chatgpt import tokens
+from tests.mock_openai import MockOpenAI, WordEncoder
+
+
+@pytest.fixture
+def mock_openai(xession, monkeypatch):
+    """Points openai at a local MockOpenAI server for the test, and counts
+    tokens with a WordEncoder instead of downloading the real encoding"""
+    encoder = WordEncoder()
+    monkeypatch.setattr(tokens, "tiktoken", encoder)
+    # Counts from the stand-in must not leak into later tests
+    monkeypatch.setattr(tokens.token_cache, "_counts", OrderedDict())
+
+    with MockOpenAI() as server:
+        monkeypatch.setattr(openai, "api_base", server.url)
+        monkeypatch.setattr(openai, "api_key", "test")
+        xession.env["OPENAI_API_KEY"] = "test"
+        xession.env["OPENAI_CHAT_MODEL"] = "gpt-3.5-turbo"
+        yield server
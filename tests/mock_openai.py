@@ -0,0 +1,268 @@
+"""Local stand-in for the OpenAI ChatCompletion API
+
+Speaks enough of the wire protocol for openai<1 to talk to it, including
+streamed responses and usage fields, so the full request path can be tested
+and benchmarked without network access or an API key.
+
+Usage
+-----
+    >>> with MockOpenAI(latency=0.05, tokens_per_second=200) as server:
+    ...     openai.api_base = server.url
+    ...     server.inject(429, retry_after=0)  # next request is rate limited
+"""
+
+import json
+import time
+import threading
+from collections import deque
+from typing import Callable, Optional
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ERROR_TYPES = {
+    400: "invalid_request_error",
+    401: "invalid_request_error",
+    429: "rate_limit_error",
+    500: "server_error",
+    503: "server_error",
+}
+
+
+def count_tokens(text: str) -> int:
+    """Rough token count, one per whitespace separated word"""
+    return len(text.split())
+
+
+def split_tokens(text: str) -> list[str]:
+    """Splits text into word pieces that join back into the original text"""
+    pieces, start = [], 0
+
+    for idx in range(1, len(text)):
+        if text[idx].isspace() and not text[idx - 1].isspace():
+            pieces.append(text[start:idx])
+            start = idx
+
+    if start < len(text):
+        pieces.append(text[start:])
+
+    return pieces
+
+
+class WordEncoder:
+    """Offline stand-in for the tiktoken encoding, with the same word pieces
+    as split_tokens, so tests never download cl100k_base"""
+
+    def encode(self, text: str) -> list[str]:
+        return split_tokens(text)
+
+    def encode_batch(self, texts: list[str], num_threads: int = 8) -> list[list[str]]:
+        return [split_tokens(t) for t in texts]
+
+    def decode(self, tokens: list[str]) -> str:
+        return "".join(tokens)
+
+
+class _Server(ThreadingHTTPServer):
+    # The default backlog of 5 drops connections from bursts of concurrent
+    # requests, which then wait a second before connecting again
+    request_queue_size = 128
+
+
+class MockOpenAI:
+    """Threaded HTTP server answering /v1/chat/completions
+
+    Parameters
+    ----------
+    latency : float, optional
+        Seconds before the first byte of every response, by default 0
+    tokens_per_second : float, optional
+        Rate completion tokens are generated at, by default None (instant)
+    reply : Callable[[list[dict]], str], optional
+        Returns the response for the messages sent, by default None
+        Defaults to echoing the last message.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        tokens_per_second: Optional[float] = None,
+        reply: Optional[Callable[[list[dict]], str]] = None,
+    ):
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.reply = reply or (lambda messages: messages[-1]["content"])
+        self.requests: list[dict] = []
+        self._errors: deque = deque()
+        self._lock = threading.Lock()
+        self._httpd: Optional[_Server] = None
+
+    @property
+    def url(self) -> str:
+        """Value for openai.api_base"""
+        return f"http://127.0.0.1:{self._httpd.server_address[1]}/v1"
+
+    def start(self) -> "MockOpenAI":
+        self._httpd = _Server(("127.0.0.1", 0), self._handler())
+        self._httpd.daemon_threads = True
+        threading.Thread(
+            target=self._httpd.serve_forever, args=(0.01,), daemon=True
+        ).start()
+        return self
+
+    def stop(self) -> None:
+        if self._httpd is not None:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._httpd = None
+
+    def __enter__(self) -> "MockOpenAI":
+        return self.start()
+
+    def __exit__(self, *_) -> None:
+        self.stop()
+
+    def inject(
+        self, status: int, count: int = 1, retry_after: Optional[float] = None
+    ) -> None:
+        """Fails the next count requests with an OpenAI style error"""
+        with self._lock:
+            self._errors.extend([(status, retry_after)] * count)
+
+    def reset(self) -> None:
+        """Forgets recorded requests and pending errors"""
+        with self._lock:
+            self.requests.clear()
+            self._errors.clear()
+
+    def _next_error(self) -> Optional[tuple[int, Optional[float]]]:
+        with self._lock:
+            return self._errors.popleft() if self._errors else None
+
+    def _generate_delay(self, tokens: int) -> float:
+        if not self.tokens_per_second:
+            return 0.0
+        return tokens / self.tokens_per_second
+
+    def _handler(self) -> type:
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+
+                with server._lock:
+                    server.requests.append(body)
+
+                if server.latency:
+                    time.sleep(server.latency)
+
+                if not self.path.endswith("/chat/completions"):
+                    return self._send_error(404, None)
+
+                error = server._next_error()
+                if error is not None:
+                    return self._send_error(*error)
+
+                content = server.reply(body["messages"])
+                prompt = 3 + sum(
+                    3 + count_tokens(m["content"]) for m in body["messages"]
+                )
+                completion = count_tokens(content)
+                usage = {
+                    "prompt_tokens": prompt,
+                    "completion_tokens": completion,
+                    "total_tokens": prompt + completion,
+                }
+
+                if body.get("stream"):
+                    self._send_stream(body["model"], content)
+                else:
+                    time.sleep(server._generate_delay(completion))
+                    self._send_json(
+                        200,
+                        {
+                            "id": "chatcmpl-mock",
+                            "object": "chat.completion",
+                            "created": int(time.time()),
+                            "model": body["model"],
+                            "choices": [
+                                {
+                                    "index": 0,
+                                    "message": {
+                                        "role": "assistant",
+                                        "content": content,
+                                    },
+                                    "finish_reason": "stop",
+                                }
+                            ],
+                            "usage": usage,
+                        },
+                    )
+
+            def _send_json(
+                self, status: int, data: dict, headers: Optional[dict] = None
+            ):
+                payload = json.dumps(data).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                for k, v in (headers or {}).items():
+                    self.send_header(k, v)
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def _send_error(self, status: int, retry_after: Optional[float]):
+                headers = {}
+                if retry_after is not None:
+                    headers["Retry-After"] = str(retry_after)
+
+                self._send_json(
+                    status,
+                    {
+                        "error": {
+                            "message": f"Mock error {status}",
+                            "type": ERROR_TYPES.get(status, "server_error"),
+                            "param": None,
+                            "code": None,
+                        }
+                    },
+                    headers,
+                )
+
+            def _send_stream(self, model: str, content: str):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+
+                def event(delta: dict, finish_reason: Optional[str] = None):
+                    data = {
+                        "id": "chatcmpl-mock",
+                        "object": "chat.completion.chunk",
+                        "created": int(time.time()),
+                        "model": model,
+                        "choices": [
+                            {"index": 0, "delta": delta, "finish_reason": finish_reason}
+                        ],
+                    }
+                    self._write_chunk(f"data: {json.dumps(data)}\n\n")
+
+                event({"role": "assistant"})
+                for piece in split_tokens(content):
+                    time.sleep(server._generate_delay(1))
+                    event({"content": piece})
+                event({}, "stop")
+                self._write_chunk("data: [DONE]\n\n")
+                self._write_chunk("")
+
+            def _write_chunk(self, text: str):
+                data = text.encode()
+                self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+                self.wfile.flush()
+
+            def log_message(self, *_):
+                pass
+
+        return Handler
@@ -1,5 +1,6 @@
 import pytest
 from xonsh.xontribs import xontribs_unload, xontribs_load
+from xontrib_chatgpt.transport import get_transport
 
 
 @pytest.fixture
@@ -13,6 +14,7 @@ def test_it_loads(loaded_session):
     assert "chatgpt" in loaded_session.aliases
     assert "chatgpt?" in loaded_session.aliases
     assert "chat-manager" in loaded_session.aliases
+    assert get_transport() is not None
 
 
 def test_it_unloads(loaded_session):
@@ -20,3 +22,4 @@ def test_it_unloads(loaded_session):
     assert "chatgpt" not in loaded_session.aliases
     assert "chatgpt?" not in loaded_session.aliases
     assert "chat-manager" not in loaded_session.aliases
+    assert get_transport() is None
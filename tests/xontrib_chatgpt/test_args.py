@@ -19,6 +19,10 @@ def default_namespace_dict():
         "name": "",
         "path": "",
         "n": 10,
+        "stream": None,
+        "jobs": None,
+        "output": "",
+        "retries": None,
     }
 
 
@@ -27,6 +31,19 @@ def default_namespace_dict():
     [
         ("something else", {"cmd": "send", "text": ["something", "else"]}),
         ("-p", {"cmd": "print", "text": []}),
+        ("--stream hi", {"cmd": "send", "text": ["hi"], "stream": True}),
+        ("--no-stream hi", {"cmd": "send", "text": ["hi"], "stream": False}),
+        ("--batch", {"cmd": "batch", "text": []}),
+        (
+            "-b -j 8 -o out.jsonl --retries 1 in.txt",
+            {
+                "cmd": "batch",
+                "text": ["in.txt"],
+                "jobs": 8,
+                "output": "out.jsonl",
+                "retries": 1,
+            },
+        ),
         ("-s", {"cmd": "save", "text": []}),
         ("-P path", {"cmd": "send", "text": [], "path": "path"}),
         ("-P path -s", {"cmd": "save", "text": [], "path": "path"}),
@@ -0,0 +1,73 @@
+import io
+import json
+import random
+import asyncio
+from openai.error import InvalidRequestError
+
+from xontrib_chatgpt.batch import BatchRunner, read_prompts
+
+
+def test_read_prompts():
+    lines = [
+        "plain text line\n",
+        "\n",
+        '{"prompt": "from json", "id": 7}\n',
+        '"json string"\n',
+        '{"no_prompt": 1}\n',
+    ]
+    assert read_prompts(lines) == [
+        {"prompt": "plain text line"},
+        {"prompt": "from json", "id": 7},
+        {"prompt": "json string"},
+        {"prompt": '{"no_prompt": 1}'},
+    ]
+
+
+def test_runs_in_order_with_bounded_jobs():
+    in_flight, max_in_flight = 0, 0
+
+    async def send(text):
+        nonlocal in_flight, max_in_flight
+        in_flight += 1
+        max_in_flight = max(in_flight, max_in_flight)
+        await asyncio.sleep(random.random() / 100)
+        in_flight -= 1
+        return text.upper()
+
+    records = [{"prompt": f"p{i}"} for i in range(20)]
+    out = io.StringIO()
+    failed = asyncio.run(BatchRunner(send, jobs=3).arun(records, out))
+
+    res = [json.loads(line) for line in out.getvalue().splitlines()]
+    assert failed == 0
+    assert max_in_flight <= 3
+    assert [r["index"] for r in res] == list(range(20))
+    assert [r["response"] for r in res] == [f"P{i}" for i in range(20)]
+
+
+def test_records_errors():
+    async def send(text):
+        raise InvalidRequestError("bad request", None)
+
+    out = io.StringIO()
+    failed = asyncio.run(BatchRunner(send).arun([{"prompt": "hi", "id": 1}], out))
+    res = json.loads(out.getvalue())
+    assert failed == 1
+    assert res["id"] == 1
+    assert "InvalidRequestError" in res["error"]
+
+
+def test_transport_errors_only_fail_their_record():
+    async def send(text):
+        if text == "bad":
+            raise asyncio.TimeoutError()
+        return text
+
+    records = [{"prompt": "ok"}, {"prompt": "bad"}, {"prompt": "fine"}]
+    out = io.StringIO()
+    failed = asyncio.run(BatchRunner(send, jobs=2).arun(records, out))
+
+    res = [json.loads(line) for line in out.getvalue().splitlines()]
+    assert failed == 1
+    assert [r.get("response") for r in res] == ["ok", None, "fine"]
+    assert "TimeoutError" in res[1]["error"]
@@ -0,0 +1,81 @@
+import os
+import time
+import pytest
+
+from xontrib_chatgpt import cache as cache_mod
+from xontrib_chatgpt.cache import ResponseCache
+
+MSG = {"role": "assistant", "content": "test"}
+USAGE = {"prompt_tokens": 5, "completion_tokens": 1}
+
+
+@pytest.fixture
+def cache(xession, tmp_path):
+    return ResponseCache(cache_dir=str(tmp_path), max_entries=2, ttl=60)
+
+
+def test_key_is_stable():
+    msgs = [{"role": "user", "content": "hi"}]
+    key = ResponseCache.key("gpt-4", msgs)
+    assert key == ResponseCache.key("gpt-4", [{"content": "hi", "role": "user"}])
+    assert key != ResponseCache.key("gpt-3.5-turbo", msgs)
+    assert key != ResponseCache.key("gpt-4", [{"role": "user", "content": "ho"}])
+
+
+def test_get_and_set(cache):
+    assert cache.get("a") is None
+    cache.set("a", MSG, USAGE)
+    entry = cache.get("a")
+    assert entry["message"] == MSG
+    assert entry["usage"] == USAGE
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_expires(cache):
+    cache.set("a", MSG, USAGE)
+    cache._ttl = -1
+    assert cache.get("a") is None
+    assert not os.path.exists(cache._path("a"))
+
+
+def test_evicts_least_recently_used(cache):
+    cache.set("a", MSG, USAGE)
+    cache.set("b", MSG, USAGE)
+    past = time.time() - 10
+    os.utime(cache._path("b"), (past, past))
+    # Reading "a" keeps it fresh, so "b" is the oldest when "c" is added
+    cache.get("a")
+    cache.set("c", MSG, USAGE)
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.get("c") is not None
+
+
+def test_only_scans_when_full(xession, tmp_path, monkeypatch):
+    scans = 0
+    scandir = os.scandir
+
+    def counting_scandir(path):
+        nonlocal scans
+        scans += 1
+        return scandir(path)
+
+    monkeypatch.setattr(cache_mod.os, "scandir", counting_scandir)
+    cache = ResponseCache(cache_dir=str(tmp_path), max_entries=10, ttl=60)
+    for key in "abcdefghij":
+        cache.set(key, MSG, USAGE)
+        cache.set(key, MSG, USAGE)
+    # Only the first write scans, to count what is already there
+    assert scans == 1
+
+    cache.set("k", MSG, USAGE)
+    assert scans == 2
+    assert len(os.listdir(tmp_path)) == 10
+
+
+def test_clear(cache):
+    cache.set("a", MSG, USAGE)
+    cache.get("a")
+    cache.clear()
+    assert cache.get("a") is None
+    assert (cache.hits, cache.misses) == (0, 1)
@@ -0,0 +1,159 @@
+import os
+import json
+import pytest
+
+from xontrib_chatgpt import catalog as catalog_mod
+from xontrib_chatgpt.catalog import Catalog, get_catalog
+from xontrib_chatgpt.exceptions import SearchUnavailableError
+
+
+@pytest.fixture
+def chat_dir(tmp_path):
+    chat_dir = tmp_path / "chatgpt"
+    chat_dir.mkdir()
+    (chat_dir / "user_test_2023-01-01.txt").touch()
+    (chat_dir / "user_test_2023-01-02.json").touch()
+    (chat_dir / "other.jsonl").touch()
+    (chat_dir / ".other.jsonl.tokens").touch()
+    (chat_dir / "subdir").mkdir()
+    return chat_dir
+
+
+def test_indexes_directory(chat_dir):
+    catalog = Catalog(str(chat_dir))
+    assert catalog.files() == [
+        "other.jsonl",
+        "user_test_2023-01-01.txt",
+        "user_test_2023-01-02.json",
+    ]
+    assert catalog.find("test") == [
+        ("test", "user_test_2023-01-01.txt"),
+        ("test", "user_test_2023-01-02.json"),
+    ]
+    assert catalog.find("other.jsonl") == [("other", "other.jsonl")]
+
+    entry = catalog.entries()[0]
+    assert entry["format"] == "jsonl"
+    assert entry["messages"] is None
+
+
+def test_only_rescans_on_change(chat_dir):
+    catalog = Catalog(str(chat_dir))
+    assert catalog.refresh()
+    assert not catalog.refresh()
+
+    # Files added or removed outside the xontrib
+    (chat_dir / "new.txt").touch()
+    (chat_dir / "other.jsonl").unlink()
+    assert catalog.refresh()
+    assert "new.txt" in catalog.files()
+    assert "other.jsonl" not in catalog.files()
+
+
+def test_record(chat_dir, tmp_path):
+    catalog = Catalog(str(chat_dir))
+    path = chat_dir / "user_gpt_2023-01-03.jsonl"
+    path.write_text("{}\n")
+    catalog.record(str(path), "gpt", 2, 100)
+
+    (entry,) = [e for e in catalog.entries() if e["file"] == path.name]
+    assert entry["name"] == "gpt"
+    assert entry["alias"] == "gpt"
+    assert entry["messages"] == 2
+    assert entry["tokens"] == 100
+
+    # Survives a rescan as long as the file is unchanged
+    (chat_dir / "new.txt").touch()
+    assert catalog.refresh()
+    assert catalog.find("gpt")[0] == ("gpt", path.name)
+
+    # A file changed outside the xontrib keeps what was recorded for it
+    with open(path, "a") as f:
+        f.write("{}\n")
+    os.utime(path, ns=(os.stat(path).st_mtime_ns + 10**9,) * 2)
+    (chat_dir / "newer.txt").touch()
+    assert catalog.refresh()
+    (entry,) = [e for e in catalog.entries() if e["file"] == path.name]
+    assert (entry["alias"], entry["messages"], entry["tokens"]) == ("gpt", 2, 100)
+    assert entry["mtime"] == os.stat(path).st_mtime_ns
+
+    # Unknown counts, i.e. of a lazily loaded chat, keep the recorded ones
+    catalog.record(str(path), "other")
+    (entry,) = [e for e in catalog.entries() if e["file"] == path.name]
+    assert (entry["alias"], entry["messages"], entry["tokens"]) == ("other", 2, 100)
+
+    # Chats saved elsewhere are not indexed
+    catalog.record(str(tmp_path / "elsewhere.txt"), "gpt", 2, 100)
+    assert "elsewhere.txt" not in catalog.files()
+
+
+def test_compressed_formats(chat_dir):
+    (chat_dir / "user_test_2023-01-03_1.json.gz").touch()
+    (chat_dir / "user_test_2023-01-04.txt.xz").touch()
+    catalog = Catalog(str(chat_dir))
+
+    formats = {e["file"]: (e["name"], e["format"]) for e in catalog.entries()}
+    assert formats["user_test_2023-01-03_1.json.gz"] == ("test", "json.gz")
+    assert formats["user_test_2023-01-04.txt.xz"] == ("test", "text.xz")
+
+
+def test_search(chat_dir):
+    (chat_dir / "user_nginx_2023-01-05.json").write_text(
+        json.dumps(
+            [
+                {"role": "user", "content": "How do I fix my nginx config?"},
+                {"role": "assistant", "content": "Check the server block."},
+            ]
+        )
+    )
+    (chat_dir / "user_py_2023-01-06.txt").write_text(
+        "user:\n    nginx or apache for python?\n\nassistant:\n    Either works\n"
+    )
+    catalog = Catalog(str(chat_dir))
+
+    assert {r["file"] for r in catalog.search("nginx")} == {
+        "user_nginx_2023-01-05.json",
+        "user_py_2023-01-06.txt",
+    }
+    (res,) = catalog.search("nginx configs")
+    assert res["name"] == "nginx"
+    assert "[nginx] [config]" in res["snippet"]
+    assert catalog.search("missing") == []
+    assert catalog.search('"') == []
+
+    # Files changed in place are reindexed, without a change to the directory
+    path = chat_dir / "user_py_2023-01-06.txt"
+    path.write_text("user:\n    unrelated\n")
+    os.utime(path, ns=(0, 10**9))
+    assert [r["file"] for r in catalog.search("nginx")] == [
+        "user_nginx_2023-01-05.json"
+    ]
+
+    path.unlink()
+    assert catalog.search("unrelated") == []
+
+
+def test_search_without_fts5(chat_dir, monkeypatch):
+    # The error an SQLite built without FTS5 gives for the virtual table
+    monkeypatch.setattr(
+        catalog_mod,
+        "SEARCH_SCHEMA",
+        "CREATE VIRTUAL TABLE IF NOT EXISTS chat_text USING no_fts5 (content);",
+    )
+    catalog = Catalog(str(chat_dir))
+
+    with pytest.raises(SearchUnavailableError, match="no such module"):
+        catalog.search("nginx")
+    assert "other.jsonl" in catalog.files()
+
+
+def test_missing_directory(tmp_path):
+    catalog = Catalog(str(tmp_path / "missing"))
+    assert catalog.files() == []
+    assert not os.path.exists(tmp_path / "missing")
+
+
+def test_get_catalog(xession, tmp_path):
+    xession.env["XONSH_DATA_DIR"] = str(tmp_path)
+    assert get_catalog() is get_catalog()
+    assert get_catalog().chat_dir == str(tmp_path / "chatgpt")
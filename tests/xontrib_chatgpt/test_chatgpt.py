@@ -1,18 +1,26 @@
 import io
+import gzip
 import json
+import lzma
+import random
+import asyncio
+import threading
 import shutil
 import pytest
 from datetime import datetime
 from openai.error import RateLimitError
-from xontrib_chatgpt.chatgpt import ChatGPT, parse_convo, get_token_list
+from xontrib_chatgpt.chatgpt import ChatGPT, _on_exit, get_token_list, journaled
+from xontrib_chatgpt.utils import parse_convo
+from xontrib_chatgpt.tokens import TokenCache, TokenLedger
+from xontrib_chatgpt.writer import writer
 from xontrib_chatgpt.exceptions import (
     NoApiKeyError,
     UnsupportedModelError,
     NoConversationsError,
     InvalidConversationsTypeError,
+    PromptTooLongError,
 )
 
-
 MARKDOWN_BLOCK = """\
 Hello!
 ```python
@@ -33,12 +41,30 @@ class DummyAI:
     def __init__(self):
         self.api_key = None
 
-    def create(self, **_):
+    def create(self, stream=False, **_):
+        if stream:
+            return iter(
+                [
+                    {"choices": [{"delta": {"role": "assistant"}}]},
+                    {"choices": [{"delta": {"content": "te"}}]},
+                    {"choices": [{"delta": {"content": "st"}}]},
+                    {"choices": [{"delta": {}}]},
+                ]
+            )
         return {
             "choices": [{"message": {"content": "test", "role": "assistant"}}],
             "usage": {"prompt_tokens": 1, "completion_tokens": 1},
         }
 
+    async def acreate(self, messages=None, **_):
+        await asyncio.sleep(0)
+        return {
+            "choices": [
+                {"message": {"content": messages[-1]["content"], "role": "assistant"}}
+            ],
+            "usage": {"prompt_tokens": 1, "completion_tokens": 1},
+        }
+
 
 @pytest.fixture(scope="module")
 def temp_home(tmpdir_factory):
@@ -70,6 +96,20 @@ def monkeypatch_openai(monkeypatch):
     monkeypatch.setattr("xontrib_chatgpt.chatgpt.openai", dummy_ai)
 
 
+@pytest.fixture
+def monkeypatch_tokens(monkeypatch):
+    monkeypatch.setattr(
+        "xontrib_chatgpt.chatgpt.get_token_list", lambda msgs: [1] * len(msgs)
+    )
+    monkeypatch.setattr("xontrib_chatgpt.chatgpt.count_tokens", lambda text: 1)
+    monkeypatch.setattr("xontrib_chatgpt.chatgpt.count_message", lambda msg: 1)
+
+    async def aget_token_list(msgs):
+        return [1] * len(msgs)
+
+    monkeypatch.setattr("xontrib_chatgpt.chatgpt.aget_token_list", aget_token_list)
+
+
 @pytest.fixture
 def chat(xession):
     return ChatGPT()
@@ -105,8 +145,10 @@ def test_defualt_attribs(xession, chat):
 
 
 def test_tokens(xession, chat):
-    chat._tokens = [1, 2, 3]
+    chat._tokens = TokenLedger([1, 2, 3])
     assert chat.tokens == 59
+    chat.chat_idx = -2
+    assert chat.tokens == 58
 
 
 def test_chat_raises_error_with_no_api_key(xession, chat, monkeypatch_openai):
@@ -125,6 +167,7 @@ def test_chat_raises_error_with_no_chat_model(xession, chat, monkeypatch_openai)
 def test_chat_catches_openai_errors(xession, chat, monkeypatch):
     xession.env["OPENAI_API_KEY"] = "test"
     xession.env["OPENAI_CHAT_MODEL"] = "gpt-3.5-turbo"
+    xession.env["CHATGPT_MAX_RETRIES"] = 0
 
     def raise_it(*_, **__):
         raise RateLimitError("test")
@@ -136,6 +179,24 @@ def test_chat_catches_openai_errors(xession, chat, monkeypatch):
         chat.chat("test")
 
 
+def test_chat_retries_rate_limits(xession, chat, monkeypatch, monkeypatch_openai):
+    xession.env["OPENAI_API_KEY"] = "test"
+    monkeypatch.setattr("xontrib_chatgpt.chatgpt.rate_limiter.backoff", 0.001)
+    calls = []
+    create = DummyAI.create
+
+    def flaky(self, **kw):
+        calls.append(kw)
+        if len(calls) == 1:
+            raise RateLimitError("test")
+        return create(self, **kw)
+
+    monkeypatch.setattr(DummyAI, "create", flaky)
+    assert chat.chat("test") == "test"
+    assert len(calls) == 2
+    assert len(chat.messages) == 2
+
+
 def test_chat_convo(xession, chat):
     assert chat.chat_convo == chat.base
     chat.messages = [
@@ -146,7 +207,7 @@ def test_chat_convo(xession, chat):
     assert chat.chat_convo == chat.base + chat.messages
 
 
-def test_chat_response(xession, monkeypatch_openai, chat):
+def test_chat_response(xession, monkeypatch_openai, monkeypatch_tokens, chat):
     xession.env["OPENAI_API_KEY"] = "test"
     assert chat.chat_idx == 0
     chat.chat("test") == "test"
@@ -159,6 +220,183 @@ def test_chat_response(xession, monkeypatch_openai, chat):
     assert chat.chat_idx == -2
 
 
+def test_chat_stream(xession, monkeypatch_openai, monkeypatch_tokens, chat):
+    xession.env["OPENAI_API_KEY"] = "test"
+    res = chat.chat_stream("test")
+    assert chat.messages == []
+    assert list(res) == ["te", "st"]
+    assert chat.messages == [
+        {"role": "user", "content": "test"},
+        {"role": "assistant", "content": "test"},
+    ]
+    assert chat._tokens == [1, 1]
+    assert chat.chat_idx == -2
+
+
+def test_chat_stream_without_encoding(xession, monkeypatch_openai, monkeypatch, chat):
+    xession.env["OPENAI_API_KEY"] = "test"
+
+    def offline(*_):
+        raise OSError("offline")
+
+    for name in ("get_token_list", "count_tokens", "count_message"):
+        monkeypatch.setattr(f"xontrib_chatgpt.chatgpt.{name}", offline)
+
+    assert list(chat.chat_stream("test")) == ["te", "st"]
+    assert chat.messages == [
+        {"role": "user", "content": "test"},
+        {"role": "assistant", "content": "test"},
+    ]
+    assert chat._tokens[-1] == 1
+
+
+def test_chat_uses_cache(
+    xession, monkeypatch, monkeypatch_openai, monkeypatch_tokens, chat, tmp_path
+):
+    xession.env["OPENAI_API_KEY"] = "test"
+    xession.env["CHATGPT_CACHE"] = True
+    monkeypatch.setattr("xontrib_chatgpt.chatgpt.response_cache._cache_dir", tmp_path)
+    calls = []
+    create = DummyAI.create
+    monkeypatch.setattr(
+        DummyAI, "create", lambda self, **kw: calls.append(kw) or create(self, **kw)
+    )
+
+    assert chat.chat("test") == "test"
+    other = ChatGPT()
+    assert other.chat("test") == "test"
+    assert len(calls) == 1
+    assert other.messages == chat.messages
+    assert other._tokens == [1, 1]
+    assert "Cache:" in other.stats()
+
+
+def test_achat(xession, monkeypatch_openai, monkeypatch_tokens):
+    xession.env["OPENAI_API_KEY"] = "test"
+    chats = [ChatGPT() for _ in range(3)]
+
+    async def run():
+        return await asyncio.gather(*[c.achat(f"test{i}") for i, c in enumerate(chats)])
+
+    res = asyncio.run(run())
+    assert res == ["test0", "test1", "test2"]
+    for i, c in enumerate(chats):
+        assert c.messages == [
+            {"role": "user", "content": f"test{i}"},
+            {"role": "assistant", "content": f"test{i}"},
+        ]
+        assert c._tokens == [1, 1]
+        assert c.chat_idx == -2
+
+
+def test_achat_counts_off_the_event_loop(xession, monkeypatch_openai, monkeypatch):
+    xession.env["OPENAI_API_KEY"] = "test"
+    threads = []
+
+    def count_message(msg):
+        threads.append(threading.current_thread())
+        return 1
+
+    monkeypatch.setattr("xontrib_chatgpt.chatgpt.count_message", count_message)
+    assert asyncio.run(ChatGPT().achat("test")) == "test"
+    assert threads and threading.main_thread() not in threads
+
+
+def test_achat_raises_openai_errors(xession, chat, monkeypatch):
+    xession.env["OPENAI_API_KEY"] = "test"
+    xession.env["OPENAI_CHAT_MODEL"] = "gpt-3.5-turbo"
+    xession.env["CHATGPT_MAX_RETRIES"] = 0
+
+    async def raise_it(*_, **__):
+        raise RateLimitError("test")
+
+    monkeypatch.setattr(
+        "xontrib_chatgpt.chatgpt.openai.ChatCompletion.acreate", raise_it
+    )
+    with pytest.raises(RateLimitError):
+        asyncio.run(chat.achat("test"))
+    assert chat.messages == []
+    assert chat.chat_idx == 0
+
+
+def test_fit_prompt_trims_history(xession, chat, monkeypatch):
+    monkeypatch.setattr("xontrib_chatgpt.chatgpt.count_message", lambda msg: 10)
+    xession.env["CHATGPT_COMPLETION_RESERVE"] = 4096 - chat._base_tokens - 30
+    for i in range(4):
+        chat.messages.append({"role": "user", "content": str(i)})
+        chat._tokens.append(10)
+    chat.chat_idx = -4
+
+    user_msg = {"role": "user", "content": "test"}
+    convo, msg, toks = chat._fit_prompt("gpt-3.5-turbo", user_msg)
+    assert convo == chat.base + chat.messages[-2:] + [user_msg]
+    assert msg == user_msg
+    assert toks == 10
+    assert chat.chat_idx == -4
+
+
+def test_fit_prompt_rejects_oversized(xession, chat, monkeypatch):
+    monkeypatch.setattr("xontrib_chatgpt.chatgpt.count_message", lambda msg: 4000)
+    sent = []
+    monkeypatch.setattr(
+        "xontrib_chatgpt.chatgpt.openai.ChatCompletion.create",
+        lambda **kw: sent.append(kw),
+    )
+    xession.env["OPENAI_API_KEY"] = "test"
+    with pytest.raises(PromptTooLongError):
+        chat.chat("test")
+    assert sent == []
+    assert chat.messages == []
+
+
+def test_fit_prompt_truncates(xession, chat, monkeypatch):
+    xession.env["CHATGPT_TRUNCATE_PROMPT"] = True
+    monkeypatch.setattr(
+        "xontrib_chatgpt.chatgpt.count_message", lambda msg: len(msg["content"])
+    )
+    monkeypatch.setattr(
+        "xontrib_chatgpt.chatgpt.truncate_tokens", lambda text, n: text[:-n]
+    )
+    budget = 4096 - 1000 - chat._base_tokens
+    _, msg, toks = chat._fit_prompt(
+        "gpt-3.5-turbo", {"role": "user", "content": "a" * (budget + 50)}
+    )
+    assert msg["content"] == "a" * budget
+    assert toks == budget
+
+
+def test_trim_compacts_history(xession, chat, monkeypatch):
+    xession.env["CHATGPT_COMPACT"] = True
+    monkeypatch.setattr("xontrib_chatgpt.compaction.count_message", lambda msg: 20)
+    summarized = []
+    monkeypatch.setattr(
+        chat._compactor,
+        "summarize",
+        lambda convo: summarized.append(convo[1]["content"]) or "summary",
+    )
+    chat._max_tokens = chat._base_tokens + 100
+    for i in range(6):
+        chat.messages.append({"role": "user", "content": str(i)})
+        chat._tokens.append(30)
+    chat.chat_idx = -6
+
+    chat.trim_convo()
+    chat._compactor.wait(5)
+    assert chat.chat_idx == -3
+    assert summarized == ["user: 0\n\nuser: 1\n\nuser: 2"]
+    assert chat.chat_convo[len(chat.base)]["content"].endswith("summary")
+    assert chat.tokens == chat._base_tokens + 20 + 90
+
+    # The summary now takes up part of the budget
+    chat.messages.append({"role": "user", "content": "6"})
+    chat._tokens.append(30)
+    chat.chat_idx -= 1
+    chat.trim_convo()
+    chat._compactor.wait(5)
+    assert chat.chat_idx == -2
+    assert summarized[1].endswith("user: 3\n\nuser: 4")
+
+
 @pytest.mark.skip()
 def test_trim(xession, chat):
     chat._tokens = [1000, 1000, 900]
@@ -173,24 +411,72 @@ def test_trim(xession, chat):
 
 
 def test_trim_convo(xession, chat):
-    toks = chat._tokens = [1000, 1000, 900]
+    chat._tokens = TokenLedger([1000, 1000, 900])
     idx = chat.chat_idx = -3
     chat.trim_convo()
-    assert chat._tokens == toks
+    assert chat._tokens == [1000, 1000, 900]
     assert chat.chat_idx == idx
     chat._tokens.append(1000)
     chat.chat_idx -= 1
     chat.trim_convo()
-    assert chat._tokens == toks
+    assert chat._tokens == [1000, 1000, 900, 1000]
     assert chat.chat_idx == idx
 
 
+def test_trim_convo_keeps_last_message(xession, chat):
+    chat._tokens = TokenLedger([1000, 1000, 5000])
+    chat.chat_idx = -3
+    chat.trim_convo()
+    assert chat.chat_idx == -1
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_trim_convo_matches_linear_scan(xession, chat, seed):
+    rng = random.Random(seed)
+    counts = [rng.randint(0, 400) for _ in range(200)]
+    chat._tokens = TokenLedger(counts)
+    chat.chat_idx = -rng.randint(2, 200)
+
+    expected = chat.chat_idx
+    while expected < -1 and 53 + sum(counts[expected:]) > chat._max_tokens:
+        expected += 1
+
+    chat.trim_convo()
+    assert chat.chat_idx == expected
+
+
 def test_set_base_msgs(xession, chat):
     assert chat._base_tokens == 53
     chat.base = [{"role": "system", "content": "test"}]
     assert chat._base_tokens == 8
 
 
+def test_base_msgs_are_shared(xession, monkeypatch):
+    calls = []
+
+    def get_token_list(msgs):
+        calls.append(msgs)
+        return [3] + [5] * len(msgs)
+
+    monkeypatch.setattr("xontrib_chatgpt.chatgpt.get_token_list", get_token_list)
+    chats = [ChatGPT() for _ in range(3)]
+    assert chats[0].base is chats[1].base
+
+    for chat in chats:
+        chat.base = [{"role": "system", "content": "shared base"}]
+    assert len(calls) == 1
+    assert chats[0].base is chats[2].base
+    assert chats[2]._base_tokens == 8
+
+    with pytest.raises(TypeError):
+        chats[0].base.append({"role": "system", "content": "more"})
+
+    # Copied on write, the other chats keep the shared base
+    chats[0].base = chats[0].base + [{"role": "system", "content": "more"}]
+    assert len(chats[0].base) == 2
+    assert len(chats[1].base) == 1
+
+
 def test__get_json_convo(xession, chat):
     chat.messages.append({"role": "user", "content": "test"})
     res = chat._get_json_convo(n=1)
@@ -255,6 +541,183 @@ def test_saves_convo(xession, chat, temp_home, mode, file, monkeypatch):
     assert res == expected
 
 
+def test_asaves_convo(xession, chat, temp_home, monkeypatch):
+    monkeypatch.setenv("USER", "user")
+    chat.messages.extend(
+        [
+            {"role": "user", "content": "Please write me a hello world function"},
+            {"role": "assistant", "content": MARKDOWN_BLOCK_2},
+        ]
+    )
+    asyncio.run(chat.asave_convo(temp_home / "saved" / "async.json", mode="json"))
+    with open(temp_home / "saved" / "async.json", "r") as f:
+        res = f.read().strip()
+    with open(temp_home / "expected" / "convo.json", "r") as f:
+        expected = f.read().strip()
+    assert res == expected
+
+
+def test_asave_never_prompts(xession, chat, tmp_path, monkeypatch):
+    def no_input(*_):
+        raise AssertionError("prompted on the event loop")
+
+    monkeypatch.setattr("builtins.input", no_input)
+    chat.messages.append({"role": "user", "content": "Hello"})
+    path = tmp_path / "async.json"
+    path.write_text("[]")
+
+    with pytest.raises(FileExistsError):
+        asyncio.run(chat.asave_convo(path, mode="json"))
+    assert path.read_text() == "[]"
+
+    asyncio.run(chat.asave_convo(path, mode="json", override=True))
+    assert json.loads(path.read_text()) == [
+        *chat.base,
+        {"role": "user", "content": "Hello"},
+    ]
+
+
+def test_saves_and_loads_token_counts(xession, chat, temp_home, monkeypatch):
+    class Encoder:
+        calls = 0
+
+        def encode(self, text):
+            Encoder.calls += 1
+            return text.split()
+
+    monkeypatch.setattr("xontrib_chatgpt.tokens.tiktoken", Encoder())
+    monkeypatch.setattr("xontrib_chatgpt.chatgpt.token_cache", TokenCache())
+    xession.env["CHATGPT_TOKEN_CACHE_PERSIST"] = True
+    chat.messages.extend(
+        [
+            {"role": "user", "content": "Please write me a hello world function"},
+            {"role": "assistant", "content": MARKDOWN_BLOCK_2},
+        ]
+    )
+    path = temp_home / "saved" / "tokens.json"
+    chat.save_convo(path, mode="json")
+    assert (temp_home / "saved" / ".tokens.json.tokens").exists()
+
+    # A fresh cache, as in a new shell, is filled from the sidecar
+    cache = TokenCache()
+    monkeypatch.setattr("xontrib_chatgpt.chatgpt.token_cache", cache)
+    monkeypatch.setattr("xontrib_chatgpt.utils.token_cache", cache)
+    Encoder.calls = 0
+    new_chat = ChatGPT.fromconvo(path)
+    assert Encoder.calls == 0
+    assert new_chat._tokens == [3, 11, 17]
+
+
+def test_saves_journal(xession, chat, monkeypatch_openai, monkeypatch_tokens, tmp_path):
+    xession.env["OPENAI_API_KEY"] = "test"
+    path = tmp_path / "convo.jsonl"
+    chat.chat("first")
+    chat.save_convo(path, mode="jsonl")
+    assert len(path.read_text().splitlines()) == len(chat.base) + 2
+
+    # Every turn after saving is appended without rewriting the file
+    written = path.read_text()
+    chat.chat("second")
+    assert path.read_text().startswith(written)
+    assert len(path.read_text().splitlines()) == len(chat.base) + 4
+
+    chat.save_convo(mode="jsonl")
+    loaded = ChatGPT.fromconvo(str(path))
+    assert loaded.base == chat.base
+    assert loaded.messages == chat.messages
+
+
+def test_journal_turns_skip_the_catalog(
+    xession, chat, monkeypatch_openai, monkeypatch_tokens, tmp_path, monkeypatch
+):
+    xession.env["OPENAI_API_KEY"] = "test"
+    recorded = []
+    monkeypatch.setattr(ChatGPT, "_catalog", lambda self, path: recorded.append(path))
+    path = tmp_path / "convo.jsonl"
+    chat.chat("first")
+    chat.save_convo(path, mode="jsonl")
+    assert recorded == [path]
+
+    chat.chat("second")
+    chat.chat("third")
+    assert recorded == [path]
+
+    chat.save_convo(mode="jsonl")
+    assert recorded == [path, str(path)]
+
+    # Turns after the last save are recorded when the shell exits
+    chat.chat("fourth")
+    assert chat in journaled
+    _on_exit()
+    assert recorded == [path, str(path), str(path)]
+    assert chat not in journaled
+
+
+def test_autosave_journal(
+    xession, chat, monkeypatch_openai, monkeypatch_tokens, tmp_path, monkeypatch
+):
+    monkeypatch.setenv("USER", "user")
+    xession.env["OPENAI_API_KEY"] = "test"
+    xession.env["XONSH_DATA_DIR"] = str(tmp_path)
+    xession.env["CHATGPT_AUTOSAVE"] = True
+
+    chat.chat("first")
+    chat.chat("second")
+    (path,) = (tmp_path / "chatgpt").glob("*.jsonl")
+
+    # A crash mid-write leaves a partial record, dropped when resuming
+    with open(path, "a") as f:
+        f.write('{"role": "user", "con')
+    loaded = ChatGPT.fromconvo(str(path))
+    assert loaded.messages == chat.messages
+
+    loaded.chat("third")
+    assert ChatGPT.fromconvo(str(path)).messages == loaded.messages
+    assert len(list((tmp_path / "chatgpt").glob("*.jsonl"))) == 1
+
+
+@pytest.mark.parametrize(
+    ("mode", "file", "opener"),
+    [("json.gz", "convo.json.gz", gzip.open), ("text.xz", "convo.txt.xz", lzma.open)],
+)
+def test_saves_compressed(
+    xession, chat, monkeypatch_tokens, tmp_path, mode, file, opener
+):
+    chat.messages.extend(
+        [
+            {"role": "user", "content": "Please write me a hello world function"},
+            {"role": "assistant", "content": MARKDOWN_BLOCK_2},
+        ]
+    )
+    path = tmp_path / file
+    chat.save_convo(path, mode=mode)
+
+    with opener(path, "rt") as f:
+        assert "hello world function" in f.read()
+
+    # The text format adds a trailing newline to every message
+    loaded = ChatGPT.fromconvo(str(path))
+    for msgs, exp in [(loaded.base, chat.base), (loaded.messages, chat.messages)]:
+        assert [(m["role"], m["content"].strip()) for m in msgs] == [
+            (m["role"], m["content"].strip()) for m in exp
+        ]
+
+
+def test_saves_in_background(xession, chat, tmp_path, capsys):
+    chat.messages.append({"role": "user", "content": "test"})
+    path = tmp_path / "convo.json"
+    chat.save_convo(path, mode="json", background=True)
+    assert "Saving conversation to" in capsys.readouterr().out
+
+    # Changes after the save are not in it
+    chat.messages.append({"role": "user", "content": "later"})
+    assert writer.flush(5)
+    assert "Conversation saved to" in capsys.readouterr().out
+    with open(path) as f:
+        assert json.load(f) == chat.base + chat.messages[:1]
+    assert [p.name for p in tmp_path.iterdir()] == ["convo.json"]
+
+
 def test_saves_with_override(xession, chat, temp_home, monkeypatch):
     monkeypatch.setenv("USER", "user")
     chat.messages.extend(
@@ -329,6 +792,13 @@ def test_auto_del_alias(xession):
     del chat
     assert "chat" not in xession.aliases
 
+    # A chat collected after another took its alias leaves the alias alone
+    old, new = ChatGPT("chat"), ChatGPT("chat")
+    del old
+    assert "chat" in xession.aliases
+    del new
+    assert "chat" not in xession.aliases
+
 
 def test_cli_execution(xession, chat_w_alias, capsys, monkeypatch_openai):
     xession.env["OPENAI_API_KEY"] = "test"
@@ -339,6 +809,18 @@ def test_cli_execution(xession, chat_w_alias, capsys, monkeypatch_openai):
     assert "test" in out[1]
 
 
+def test_cli_execution_stream(
+    xession, chat_w_alias, capsys, monkeypatch_openai, monkeypatch_tokens
+):
+    xession.env["OPENAI_API_KEY"] = "test"
+    xession.aliases["gpt"](["--stream", "hello"])
+    out, err = capsys.readouterr()
+    out = out.strip().split("\n    ")
+    assert "ChatGPT" in out[0]
+    assert out[1] == "test"
+    assert len(chat_w_alias.messages) == 2
+
+
 def test_cli_execution_print(
     xession, chat_w_alias, capsys, monkeypatch, monkeypatch_openai
 ):
@@ -359,7 +841,7 @@ def test_cli_execution_save(
 ):
     monkeypatch.setattr(
         "xontrib_chatgpt.chatgpt.ChatGPT.save_convo",
-        lambda _, path, name, mode: print("save_convo", path, name, mode),
+        lambda _, path, name, mode, **kw: print("save_convo", path, name, mode),
     )
     xession.aliases["gpt"](["-s"])
     out, err = capsys.readouterr()
@@ -380,6 +862,33 @@ def test_cli_execution_pipe(xession, chat_w_alias, capsys, monkeypatch_openai):
     assert "test" in out[1]
 
 
+def test_cli_execution_batch(xession, chat_w_alias, capsys, monkeypatch_openai):
+    xession.env["OPENAI_API_KEY"] = "test"
+    stdin = io.StringIO('first\n{"prompt": "second", "id": 2}\n')
+    xession.aliases["gpt"](["--batch"], stdin=stdin)
+    out, err = capsys.readouterr()
+    # Other output, such as a collected chat saying it is deleted, is skipped
+    res = [json.loads(line) for line in out.splitlines() if line.startswith("{")]
+    assert res == [
+        {"index": 0, "prompt": "first", "response": "first"},
+        {"index": 1, "prompt": "second", "id": 2, "response": "second"},
+    ]
+    assert chat_w_alias.messages == []
+
+
+def test_one_off_chats_are_not_autosaved(
+    xession, chat_w_alias, capsys, monkeypatch_openai, tmp_path
+):
+    xession.env["OPENAI_API_KEY"] = "test"
+    xession.env["XONSH_DATA_DIR"] = str(tmp_path)
+    xession.env["CHATGPT_AUTOSAVE"] = True
+
+    xession.aliases["gpt"](["--batch"], stdin=io.StringIO("first\nsecond\n"))
+    ChatGPT.fromcli(["hello"])
+    capsys.readouterr()
+    assert list((tmp_path / "chatgpt").glob("*")) == []
+
+
 def test_enter_exit(xession, chat, capsys, monkeypatch_openai):
     xession.env["OPENAI_API_KEY"] = "test"
     exe = xession.execer.exec
@@ -390,6 +899,20 @@ def test_enter_exit(xession, chat, capsys, monkeypatch_openai):
     assert "test" in out[1]
 
 
+def test_enter_exit_stream(
+    xession, chat, capsys, monkeypatch_openai, monkeypatch_tokens
+):
+    xession.env["OPENAI_API_KEY"] = "test"
+    xession.env["CHATGPT_STREAM"] = True
+    exe = xession.execer.exec
+    exe("with! chat:\n    hello", glbs={"chat": chat})
+    out, err = capsys.readouterr()
+    out = out.strip().split("\n    ")
+    assert "ChatGPT" in out[0]
+    assert out[1] == "test"
+    assert chat.messages[0]["content"] == "hello"
+
+
 def test_loads_from_convo(xession, temp_home):
     chat_file = temp_home / "expected" / "no_color_convo2.txt"
     new_cls = ChatGPT.fromconvo(chat_file)
@@ -398,6 +921,15 @@ def test_loads_from_convo(xession, temp_home):
     assert "Please write me a hello world function" in new_cls.messages[0]["content"]
 
 
+def test_aloads_from_convo(xession, temp_home, monkeypatch_tokens):
+    chat_file = temp_home / "expected" / "no_color_convo2.txt"
+    new_cls = asyncio.run(ChatGPT.afromconvo(chat_file))
+    assert isinstance(new_cls, ChatGPT)
+    assert new_cls.base[0] == {"role": "system", "content": "Test\n"}
+    assert "Please write me a hello world function" in new_cls.messages[0]["content"]
+    assert new_cls._tokens == [1] * len(new_cls.messages)
+
+
 def test_loads_from_convo_in_default_dir(xession, temp_home):
     xession.env["XONSH_DATA_DIR"] = str(temp_home / "data_dir")
     new_cls = ChatGPT.fromconvo("no_color_convo.txt")
@@ -422,6 +954,52 @@ def test_loads_and_trims(xession, temp_home, monkeypatch):
     assert new_cls.chat_idx == -1
 
 
+@pytest.mark.parametrize("mode", ["jsonl", "json"])
+def test_lazy_loads_tail(xession, tmp_path, monkeypatch, mode):
+    monkeypatch.setattr(
+        "xontrib_chatgpt.chatgpt.get_token_list", lambda msgs: [3] + [10] * len(msgs)
+    )
+    monkeypatch.setattr("xontrib_chatgpt.chatgpt.count_message", lambda msg: 10)
+    chat = ChatGPT()
+    chat.base = [{"role": "system", "content": "sys"}]
+    chat.messages = [
+        {"role": "user" if i % 2 == 0 else "assistant", "content": str(i)}
+        for i in range(1000)
+    ]
+    path = tmp_path / f"convo.{mode}"
+    chat._write_convo(path, mode, chat.base + chat.messages)
+
+    eager = ChatGPT.fromconvo(str(path))
+    lazy = ChatGPT.fromconvo(str(path), lazy=True)
+    assert len(lazy.messages) < 1000
+    assert lazy.chat_idx == eager.chat_idx
+    assert lazy.chat_convo == eager.chat_convo
+    assert lazy.tokens == eager.tokens
+
+    lazy.print_convo(5)
+    assert lazy._older is not None
+
+    lazy.print_convo(0)
+    assert lazy._older is None
+    assert lazy.messages == eager.messages
+    assert lazy._tokens == eager._tokens
+    assert lazy.chat_convo == eager.chat_convo
+
+
+def test_lazy_load_saves_everything(xession, tmp_path, monkeypatch_tokens, monkeypatch):
+    monkeypatch.setattr("xontrib_chatgpt.chatgpt.count_message", lambda msg: 1000)
+    messages = [{"role": "user", "content": str(i)} for i in range(100)]
+    path = tmp_path / "convo.jsonl"
+    path.write_text("".join(json.dumps(m) + "\n" for m in messages))
+
+    chat = ChatGPT.fromconvo(str(path), lazy=True)
+    assert len(chat.messages) == 10
+    chat.save_convo(tmp_path / "saved.json", mode="json")
+
+    with open(tmp_path / "saved.json") as f:
+        assert json.load(f) == chat.base + messages
+
+
 @pytest.fixture
 def inc_test(xession):
     xession.ctx["test"] = 0
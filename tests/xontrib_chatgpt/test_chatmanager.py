@@ -1,8 +1,12 @@
 import pytest
+import asyncio
 from datetime import datetime
 from textwrap import dedent
 from xontrib_chatgpt.chatmanager import ChatManager, convert_to_sys
 from xontrib_chatgpt.chatgpt import ChatGPT
+from xontrib_chatgpt.catalog import get_catalog
+from xontrib_chatgpt.exceptions import SearchUnavailableError
+from xontrib_chatgpt.writer import writer
 
 
 @pytest.fixture(scope="module")
@@ -117,12 +121,23 @@ def test_find_saved(xession, cm, temp_home, test_files):
     assert sorted(res) == test_files
 
 
+def test_find_saved_skips_sidecars(xession, cm, temp_home, test_files):
+    sidecar = temp_home / "data_dir" / "chatgpt" / ".test1.txt.tokens"
+    sidecar.touch()
+    try:
+        assert sorted(cm._find_saved()) == test_files
+    finally:
+        sidecar.unlink()
+
+
 @pytest.mark.parametrize(
     ("input", "fname", "name"),
     [
         ("test1", "something_test1.txt", "test1"),
         ("something_test2_01-02-03.json", "something_test2_01-02-03.json", "test2"),
         ("test3", "test3.txt", "test3"),
+        ("test4", "user_test4_2023-01-02_1.json.gz", "test4"),
+        ("test5", "user_test5_2023-01-02.txt.xz", "test5"),
     ],
 )
 def test_find_path_from_name(xession, cm, input, fname, name, temp_home):
@@ -173,10 +188,47 @@ def test_save(xession, cm, test_files, temp_home, cm_events, monkeypatch):
     inst.messages += [{"role": "user", "content": "test"}]
     res = cm.save()
     assert res is None
+    assert writer.flush(5)
     now = datetime.now().strftime("%Y-%m-%d")
     assert (temp_home / "data_dir" / "chatgpt" / f"user_new_{now}.txt").exists()
 
 
+def test_ls_saved_shows_catalog(xession, cm, temp_home, cm_events, monkeypatch):
+    monkeypatch.setenv("USER", "user")
+    cm_events.on_chat_create(lambda *args, **kw: cm.on_chat_create_handler(*args, **kw))
+    inst = ChatGPT(alias="cataloged", managed=True)
+    inst.messages += [{"role": "user", "content": "test"}]
+    inst._tokens.append(5)
+    cm.save("")
+    assert writer.flush(5)
+
+    now = datetime.now().strftime("%Y-%m-%d")
+    res = cm.ls(saved=True)
+    assert f"user_cataloged_{now}.txt (1 messages, 58 tokens)" in res
+    path, name = cm._find_path_from_name("cataloged")
+    assert path.endswith(f"user_cataloged_{now}.txt") and name == "cataloged"
+    (temp_home / "data_dir" / "chatgpt" / f"user_cataloged_{now}.txt").unlink()
+
+
+def test_search(xession, cm, temp_home):
+    path = temp_home / "data_dir" / "chatgpt" / "user_found_2023-01-01.txt"
+    path.write_text("user:\n    Where is the nginx config?\n")
+
+    res = cm(["search", "nginx"])
+    assert "user_found_2023-01-01.txt" in res
+    assert "\x1b[1;33mnginx\x1b[0m config" in res
+    assert cm.search("apache") == "No saved chats match 'apache'."
+    path.unlink()
+
+
+def test_search_unavailable(xession, cm, temp_home, monkeypatch):
+    def search(*_, **__):
+        raise SearchUnavailableError("no such module: fts5")
+
+    monkeypatch.setattr(get_catalog(), "search", search)
+    assert "Search is unavailable" in cm(["search", "nginx"])
+
+
 def test_save_returns_when_key_error(xession, cm):
     with pytest.raises(SystemExit) as s:
         cm.save("nonexistent")
@@ -203,6 +255,17 @@ def test_save_returns_when_key_error(xession, cm):
             ["print", "-n", "20", "-m", "json", "name"],
             ((), {"chat_name": "name", "n": 20, "mode": "json"}),
         ),
+        (
+            "broadcast",
+            ["broadcast", "hello", "there"],
+            (("hello there",), {"chat_names": None, "pattern": "", "workers": None}),
+        ),
+        (
+            "broadcast",
+            ["b", "-c", "a", "-c", "b", "-g", "gpt*", "-w", "2", "hi"],
+            (("hi",), {"chat_names": ["a", "b"], "pattern": "gpt*", "workers": 2}),
+        ),
+        ("warmup_report", ["warmup"], ((), {})),
         ("help", ["help"], ((), {"tgt": ""})),
         ("help", ["help", "print_chat"], ((), {"tgt": "print_chat"})),
         (
@@ -237,3 +300,81 @@ def test_edit(xession, cm, cm_events):
     cm.edit(sys_msgs=str(sys_msg), no_code=True)
     assert len(inst.base) == 1
     assert inst.base == sys_msg
+
+
+class DummyAI:
+    def __init__(self):
+        self.api_key = "test"
+        self.in_flight = self.max_in_flight = 0
+
+    async def acreate(self, messages=None, **_):
+        self.in_flight += 1
+        self.max_in_flight = max(self.in_flight, self.max_in_flight)
+        await asyncio.sleep(0.01)
+        self.in_flight -= 1
+        return {
+            "choices": [
+                {"message": {"content": messages[-1]["content"], "role": "assistant"}}
+            ],
+            "usage": {"prompt_tokens": 1, "completion_tokens": 1},
+        }
+
+
+@pytest.mark.parametrize(
+    ("kwargs", "expected"),
+    [
+        ({}, ["gpt1", "gpt2", "other"]),
+        ({"chat_names": ["other"]}, ["other"]),
+        ({"pattern": "gpt*"}, ["gpt1", "gpt2"]),
+    ],
+)
+def test_broadcast(xession, cm, cm_events, monkeypatch, capsys, kwargs, expected):
+    dummy_ai = DummyAI()
+    dummy_ai.ChatCompletion = dummy_ai
+    monkeypatch.setattr("xontrib_chatgpt.chatgpt.openai", dummy_ai)
+    cm_events.on_chat_create(lambda *args, **kw: cm.on_chat_create_handler(*args, **kw))
+    for name in ["gpt1", "gpt2", "other"]:
+        cm.add(name)
+
+    cm.broadcast("hello", workers=2, **kwargs)
+    out, _ = capsys.readouterr()
+
+    assert dummy_ai.max_in_flight <= 2
+    for name in ["gpt1", "gpt2", "other"]:
+        inst = xession.ctx[name]
+        if name in expected:
+            assert f"[{name}]" in out
+            assert inst.messages[-1] == {"role": "assistant", "content": "hello"}
+        else:
+            assert f"[{name}]" not in out
+            assert inst.messages == []
+
+
+def test_broadcast_reports_errors_per_chat(xession, cm, cm_events, monkeypatch, capsys):
+    class FlakyAI(DummyAI):
+        async def acreate(self, messages=None, **kw):
+            if messages[-1]["content"] == "hello" and not self.failed:
+                self.failed = True
+                raise ConnectionResetError("connection reset")
+            return await super().acreate(messages=messages, **kw)
+
+    dummy_ai = FlakyAI()
+    dummy_ai.failed = False
+    dummy_ai.ChatCompletion = dummy_ai
+    monkeypatch.setattr("xontrib_chatgpt.chatgpt.openai", dummy_ai)
+    monkeypatch.setenv("CHATGPT_MAX_RETRIES", "0")
+    cm_events.on_chat_create(lambda *args, **kw: cm.on_chat_create_handler(*args, **kw))
+    for name in ["gpt1", "gpt2", "other"]:
+        cm.add(name)
+
+    cm.broadcast("hello", workers=1)
+    out, _ = capsys.readouterr()
+
+    assert "Error (ConnectionResetError)" in out
+    assert "connection reset" in out
+    answered = [n for n in ["gpt1", "gpt2", "other"] if xession.ctx[n].messages]
+    assert len(answered) == 2
+
+
+def test_broadcast_no_matching_chats(xession, cm):
+    assert cm.broadcast("hello", pattern="nothing*") == "No matching chats!"
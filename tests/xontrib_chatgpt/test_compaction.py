@@ -0,0 +1,104 @@
+import threading
+import pytest
+
+from xontrib_chatgpt.compaction import Compactor, SUMMARY_PREFIX, summary_request
+
+
+@pytest.fixture
+def counted(monkeypatch):
+    monkeypatch.setattr(
+        "xontrib_chatgpt.compaction.count_message", lambda msg: len(msg["content"])
+    )
+
+
+def test_summary_request():
+    msgs = [{"role": "user", "content": "hi"}, {"role": "assistant", "content": "yo"}]
+    req = summary_request(None, msgs)
+    assert req[0]["role"] == "system"
+    assert req[1] == {"role": "user", "content": "user: hi\n\nassistant: yo"}
+
+    req = summary_request("old", msgs[:1])
+    assert req[1]["content"] == "Previous summary:\nold\n\nuser: hi"
+
+
+def test_rolling_summary(counted):
+    requests = []
+
+    def summarize(convo):
+        requests.append(convo)
+        return f"s{len(requests)}"
+
+    compactor = Compactor(summarize)
+    assert compactor.messages == [] and compactor.tokens == 0
+
+    compactor.submit([{"role": "user", "content": "first"}])
+    assert compactor.wait(5)
+    summary = {"role": "system", "content": SUMMARY_PREFIX + "s1"}
+    assert compactor.messages == [summary]
+    assert compactor.tokens == len(summary["content"])
+
+    compactor.submit([{"role": "user", "content": "second"}])
+    compactor.wait(5)
+    assert requests[1][1]["content"] == "Previous summary:\ns1\n\nuser: second"
+    assert compactor.messages[0]["content"].endswith("s2")
+
+
+def test_runs_in_background(counted):
+    gate = threading.Event()
+
+    def summarize(_):
+        gate.wait()
+        return "done"
+
+    compactor = Compactor(summarize)
+    compactor.submit([{"role": "user", "content": "test"}])
+    assert compactor.running
+    assert compactor.messages == []
+
+    gate.set()
+    assert compactor.wait(5)
+    assert compactor.messages[0]["content"].endswith("done")
+
+
+def test_queues_batches_without_waiting(counted):
+    started, gate = threading.Event(), threading.Event()
+    requests = []
+
+    def summarize(convo):
+        started.set()
+        gate.wait()
+        requests.append(convo)
+        return f"s{len(requests)}"
+
+    compactor = Compactor(summarize)
+    compactor.submit([{"role": "user", "content": "first"}])
+    assert started.wait(5)
+    # Queued while the first summary is still running
+    compactor.submit([{"role": "user", "content": "second"}])
+    compactor.submit([{"role": "user", "content": "third"}])
+    assert not compactor.wait(0.01)
+
+    gate.set()
+    assert compactor.wait(5)
+    assert not compactor.running
+    assert [r[1]["content"] for r in requests] == [
+        "user: first",
+        "Previous summary:\ns1\n\nuser: second\n\nuser: third",
+    ]
+    assert compactor.messages[0]["content"].endswith("s2")
+
+
+def test_keeps_summary_on_error(counted):
+    results = iter(["kept"])
+
+    def summarize(_):
+        return next(results)
+
+    compactor = Compactor(summarize)
+    compactor.submit([{"role": "user", "content": "test"}])
+    compactor.wait(5)
+    compactor.submit([{"role": "user", "content": "test"}])
+    compactor.wait(5)
+
+    assert compactor.messages[0]["content"].endswith("kept")
+    assert compactor.error == "StopIteration: "
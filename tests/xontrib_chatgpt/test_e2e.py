@@ -0,0 +1,87 @@
+"""End to end tests against the local MockOpenAI server"""
+
+import asyncio
+import openai
+import pytest
+
+from xontrib_chatgpt.chatgpt import ChatGPT
+from xontrib_chatgpt import transport as tp
+
+
+@pytest.fixture
+def chat(xession, mock_openai):
+    xession.env["CHATGPT_MAX_RETRIES"] = 2
+    yield ChatGPT()
+
+
+def test_mock_streams_deltas(mock_openai):
+    chunks = openai.ChatCompletion.create(
+        model="gpt-3.5-turbo",
+        messages=[{"role": "user", "content": "one two  three"}],
+        stream=True,
+    )
+    deltas = [c["choices"][0]["delta"].get("content", "") for c in chunks]
+    assert "".join(deltas) == "one two  three"
+    assert len(deltas) == 5
+
+
+def test_chat_round_trip(chat, mock_openai):
+    assert chat.chat("hello there") == "hello there"
+    assert chat.chat("again") == "again"
+
+    sent = mock_openai.requests[-1]["messages"]
+    assert [m["content"] for m in sent[-3:]] == ["hello there", "hello there", "again"]
+    assert chat._tokens[1::2] == [2, 1]
+
+
+def test_chat_trims_long_convo(chat, mock_openai):
+    chat._max_tokens = 200
+    for i in range(20):
+        chat.chat(f"message {i} " + "word " * 10)
+
+    assert chat.tokens <= 200
+    assert len(chat.messages) == 40
+    assert len(mock_openai.requests[-1]["messages"]) < 40
+
+
+def test_chat_retries_injected_errors(chat, mock_openai, monkeypatch):
+    monkeypatch.setattr("xontrib_chatgpt.chatgpt.rate_limiter.backoff", 0.001)
+    mock_openai.inject(429, retry_after=0)
+    mock_openai.inject(503)
+    assert chat.chat("hello") == "hello"
+    assert len(mock_openai.requests) == 3
+
+
+def test_chat_exits_on_client_error(chat, mock_openai):
+    mock_openai.inject(400)
+    with pytest.raises(SystemExit):
+        chat.chat("hello")
+    assert len(mock_openai.requests) == 1
+    assert not chat.messages
+
+
+def test_achat_over_pooled_transport(xession, mock_openai):
+    # Start from a fresh transport, loading the xontrib in another test opens one
+    tp.close_transport()
+    transport = tp.open_transport()
+
+    async def run():
+        async with tp.aiosession():
+            return await asyncio.gather(*[ChatGPT().achat(str(i)) for i in range(8)])
+
+    try:
+        assert asyncio.run(run()) == [str(i) for i in range(8)]
+        stats = transport.stats()
+        assert stats["requests"] == 8
+        assert stats["connections"] <= 8
+    finally:
+        tp.close_transport()
+
+
+def test_save_and_load(chat, mock_openai, tmpdir):
+    chat.chat("hello")
+    path = str(tmpdir / "convo.json")
+    chat.save_convo(path, mode="json")
+
+    with open(path) as f:
+        assert '"content": "hello"' in f.read()
@@ -0,0 +1,74 @@
+import json
+import pytest
+
+from xontrib_chatgpt.journal import (
+    Journal,
+    is_journal,
+    read_journal,
+    read_journal_head,
+    read_journal_range,
+    iter_journal_reversed,
+)
+
+MESSAGES = [
+    {"role": "system", "content": "Be brief"},
+    {"role": "user", "content": "hi\nthere"},
+    {"role": "assistant", "content": "hello"},
+]
+
+
+def test_write_and_append(tmp_path):
+    path = tmp_path / "convo.jsonl"
+    journal = Journal(str(path), fsync=False)
+    journal.write(MESSAGES[:2])
+    journal.append(MESSAGES[2:])
+
+    lines = path.read_text().splitlines()
+    assert [json.loads(line) for line in lines] == MESSAGES
+
+    journal.write(MESSAGES[:1])
+    assert read_journal(path.read_text()) == MESSAGES[:1]
+
+
+def test_fsync(xession, tmp_path, monkeypatch):
+    synced = []
+    monkeypatch.setattr("xontrib_chatgpt.journal.os.fsync", synced.append)
+    journal = Journal(str(tmp_path / "convo.jsonl"))
+
+    journal.append(MESSAGES)
+    assert synced == []
+
+    xession.env["CHATGPT_JOURNAL_FSYNC"] = True
+    journal.append(MESSAGES)
+    assert len(synced) == 1
+
+
+def test_read_skips_partial_last_record():
+    convo = "".join(json.dumps(m) + "\n" for m in MESSAGES)
+    assert read_journal(convo + '{"role": "user", "con') == MESSAGES
+
+    with pytest.raises(json.JSONDecodeError):
+        read_journal('{"role": "user", "con\n' + convo)
+
+
+def test_is_journal():
+    assert is_journal(json.dumps(MESSAGES[0]) + "\n")
+    assert not is_journal(json.dumps(MESSAGES))
+    assert not is_journal("user:\n    hi\n")
+
+
+@pytest.mark.parametrize("block_size", [5, 1 << 16])
+def test_reads_backwards(tmp_path, block_size):
+    path = tmp_path / "convo.jsonl"
+    path.write_text("".join(json.dumps(m) + "\n" for m in MESSAGES) + '{"role": "')
+
+    with open(path, "rb") as f:
+        base, start = read_journal_head(f)
+        records = list(iter_journal_reversed(f, start, block_size))
+
+    assert base == MESSAGES[:1]
+    assert [m for _, m in records] == MESSAGES[:0:-1]
+
+    # Offsets point at the start of each record
+    offset = records[0][0]
+    assert read_journal_range(str(path), start, offset) == MESSAGES[1:2]
@@ -0,0 +1,57 @@
+import json
+import pickle
+
+from xontrib_chatgpt.messages import (
+    Message,
+    Window,
+    system_prompt,
+    to_messages,
+    to_wire,
+)
+
+
+def test_message_reads_like_a_dict():
+    msg = Message("user", "hi")
+    assert msg == {"role": "user", "content": "hi"}
+    assert {"role": "user", "content": "hi"} == msg
+    assert msg["content"] == "hi" and msg.get("name") is None
+    assert dict(msg) == {"role": "user", "content": "hi"}
+    assert json.dumps(to_wire([msg])) == '[{"role": "user", "content": "hi"}]'
+    assert pickle.loads(pickle.dumps(msg)) == msg
+
+
+def test_roles_are_shared():
+    roles = json.loads('["user", "user"]')
+    a, b = (Message(r, "") for r in roles)
+    assert a.role is b.role
+
+
+def test_message_has_no_dict():
+    assert not hasattr(Message("user", "hi"), "__dict__")
+    msg = Message("user", "hi")
+    assert Message.of(msg) is msg
+    assert to_messages([{"role": "user", "content": "hi"}]) == [msg]
+
+
+def test_window_follows_list():
+    msgs = to_messages({"role": "user", "content": str(i)} for i in range(5))
+    window = Window(msgs, -2)
+    assert window == msgs[-2:]
+    assert len(window) == 2 and window[-1] is msgs[-1]
+
+    msgs.append(Message("assistant", "5"))
+    assert [m["content"] for m in window] == ["4", "5"]
+    assert window[1:] == msgs[-1:]
+
+    assert list(Window(msgs, 0)) == msgs
+    assert list(Window(msgs, -100)) == msgs
+
+
+def test_system_prompts_are_interned():
+    msgs = [{"role": "system", "content": "interned"}]
+    prompt = system_prompt(msgs, lambda m: len(m))
+    assert prompt == msgs and prompt.tokens == 1
+    assert system_prompt(msgs, lambda m: 1 / 0) is prompt
+    assert system_prompt(prompt, lambda m: 1 / 0) is prompt
+    assert system_prompt([{"role": "user", "content": "interned"}], len) is not prompt
+    assert pickle.loads(pickle.dumps(prompt)) == msgs
@@ -0,0 +1,105 @@
+import asyncio
+import pytest
+from openai.error import RateLimitError, InvalidRequestError, APIError
+
+from xontrib_chatgpt.ratelimit import (
+    RateLimiter,
+    TokenBucket,
+    is_retryable,
+    get_retry_after,
+)
+
+
+@pytest.fixture
+def limiter(xession):
+    limiter = RateLimiter()
+    limiter.backoff = 0.001
+    return limiter
+
+
+@pytest.mark.parametrize(
+    ("err", "expected"),
+    [
+        (RateLimitError("test"), True),
+        (APIError("test", http_status=502), True),
+        (APIError("test", http_status=400), False),
+        (InvalidRequestError("test", None), False),
+    ],
+)
+def test_is_retryable(err, expected):
+    assert is_retryable(err) == expected
+
+
+def test_get_retry_after():
+    assert get_retry_after(RateLimitError("test", headers={"retry-after": "2"})) == 2
+    assert get_retry_after(RateLimitError("test")) == 0
+
+
+def test_token_bucket():
+    bucket = TokenBucket(60)
+    assert bucket.reserve(60, bucket.last) == 0
+    # Empty bucket refills at one per second
+    assert bucket.reserve(2, bucket.last) == pytest.approx(2)
+    bucket.adjust(-2, bucket.last)
+    assert bucket.reserve(1, bucket.last) == pytest.approx(1)
+
+
+def test_no_limits_by_default(limiter):
+    assert not limiter.limits_tokens("gpt-4")
+    assert all(limiter.reserve("gpt-4", 10**6) == 0 for _ in range(100))
+
+
+def test_limits_per_model(xession, limiter):
+    xession.env["CHATGPT_RPM"] = {"gpt-4": 60}
+    xession.env["CHATGPT_TPM"] = 6000
+    assert limiter.limits_tokens("gpt-3.5-turbo")
+    for _ in range(60):
+        assert limiter.reserve("gpt-4") == 0
+    assert limiter.reserve("gpt-4") == pytest.approx(1, abs=0.1)
+    assert limiter.reserve("gpt-3.5-turbo", 6000) == 0
+    assert limiter.reserve("gpt-3.5-turbo", 100) == pytest.approx(1, abs=0.1)
+    limiter.settle("gpt-3.5-turbo", 6100, 0)
+    assert limiter.reserve("gpt-3.5-turbo", 100) == 0
+
+
+def test_retries_then_raises(limiter):
+    calls = []
+
+    def fn():
+        calls.append(1)
+        raise RateLimitError("test")
+
+    with pytest.raises(RateLimitError):
+        limiter.call(fn, "gpt-4", retries=2)
+    assert len(calls) == 3
+
+
+def test_does_not_retry_client_errors(limiter):
+    calls = []
+
+    def fn():
+        calls.append(1)
+        raise InvalidRequestError("test", None)
+
+    with pytest.raises(InvalidRequestError):
+        limiter.call(fn, "gpt-4", retries=2)
+    assert len(calls) == 1
+
+
+def test_rate_limit_pauses_model(limiter):
+    limiter.pause("gpt-4", 5)
+    assert limiter.reserve("gpt-4") == pytest.approx(5, abs=0.1)
+    assert limiter.reserve("gpt-3.5-turbo") == 0
+
+
+def test_acall_retries(limiter):
+    calls = []
+
+    async def fn():
+        calls.append(1)
+        if len(calls) < 3:
+            raise APIError("test", http_status=503)
+        return "ok"
+
+    assert asyncio.run(limiter.acall(fn, "gpt-4", retries=3)) == "ok"
+    assert len(calls) == 3
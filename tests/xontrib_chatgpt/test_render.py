@@ -0,0 +1,109 @@
+import re
+
+from xontrib_chatgpt import utils
+from xontrib_chatgpt.render import (
+    RenderCache,
+    LexerCache,
+    split_fences,
+    render_markdown,
+)
+
+
+class Renderer:
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, text):
+        self.calls += 1
+        return text.upper()
+
+
+def test_renders_once(xession):
+    cache, render = RenderCache(), Renderer()
+    assert cache.render("hello", render) == "HELLO"
+    assert cache.render("hello", render) == "HELLO"
+    assert render.calls == 1
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_settings_are_part_of_key(xession):
+    cache, render = RenderCache(), Renderer()
+    cache.render("hello", render, settings="dark")
+    cache.render("hello", render, settings="light")
+    assert render.calls == 2
+
+
+def test_drops_least_recently_rendered(xession):
+    cache, render = RenderCache(max_entries=2), Renderer()
+    cache.render("a", render)
+    cache.render("b", render)
+    cache.render("a", render)
+    cache.render("c", render)
+    assert len(cache) == 2
+
+    render.calls = 0
+    cache.render("a", render)
+    assert render.calls == 0
+    cache.render("b", render)
+    assert render.calls == 1
+
+
+def test_max_entries_from_env(xession):
+    xession.env["CHATGPT_RENDER_CACHE_SIZE"] = 1
+    cache, render = RenderCache(), Renderer()
+    cache.render("a", render)
+    cache.render("b", render)
+    assert len(cache) == 1
+
+
+def test_format_markdown_is_cached(xession, monkeypatch):
+    cache = RenderCache()
+    monkeypatch.setattr(utils, "render_cache", cache)
+    first = utils.format_markdown("Some `code`")
+    assert utils.format_markdown("Some `code`") == first
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_splits_fences():
+    text = "Intro\n```python\nx = 1\n```\nMiddle\n```\nplain\n```\nEnd"
+    assert list(split_fences(text)) == [
+        (None, "Intro\n"),
+        ("python", "x = 1\n"),
+        (None, "Middle\n"),
+        ("", "plain\n"),
+        (None, "End"),
+    ]
+
+
+def test_splits_unclosed_fence():
+    assert list(split_fences("Look:\n```sh\nls -la\n")) == [
+        (None, "Look:\n"),
+        ("sh", "ls -la\n"),
+    ]
+
+
+def test_caches_lexers(xession):
+    cache = LexerCache()
+    assert cache.get("python") is cache.get("PYTHON")
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert cache.get("not-a-language").name == "Text only"
+    assert len(cache) == 2
+
+
+def test_lexer_cache_is_bounded(xession):
+    cache = LexerCache(max_entries=1)
+    cache.get("python")
+    cache.get("bash")
+    assert len(cache) == 1
+
+
+def test_highlights_code_in_its_language(xession):
+    res = render_markdown("Run:\n```python\ndef f():\n    pass\n```\nDone `now`\n")
+    assert "```" not in res and "`" not in res
+    plain = re.sub(r"\x1b\[[0-9;]*m", "", res)
+    assert plain == "Run:\ndef f():\n    pass\nDone now\n"
+    # The keyword is colored differently from the function name
+    colors = dict(
+        (word, code) for code, word in re.findall(r"\x1b\[([0-9;]+)m(\w+)", res)
+    )
+    assert colors["def"] != colors["f"]
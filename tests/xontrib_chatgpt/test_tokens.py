@@ -0,0 +1,164 @@
+import os
+import pytest
+
+from xonsh.lazyasd import LazyObject
+
+from xontrib_chatgpt import tokens
+from xontrib_chatgpt.lazyobjs import _tiktoken
+from xontrib_chatgpt.tokens import TokenCache, TokenLedger, get_sidecar_path
+
+
+class WordEncoder:
+    def __init__(self):
+        self.calls = 0
+        self.batches = []
+
+    def encode(self, text):
+        self.calls += 1
+        return text.split()
+
+    def encode_batch(self, texts, num_threads=8):
+        self.batches.append((len(texts), num_threads))
+        self.calls += len(texts)
+        return [t.split() for t in texts]
+
+
+@pytest.fixture
+def encoder(monkeypatch):
+    enc = WordEncoder()
+    monkeypatch.setattr(tokens, "tiktoken", enc)
+    yield enc
+
+
+@pytest.fixture
+def messages():
+    return [
+        {"role": "system", "content": "You are helpful."},
+        {"role": "user", "content": "Hello there friend"},
+        {"role": "assistant", "content": "Hi"},
+    ]
+
+
+def test_counts_once(xession, encoder, messages):
+    cache = TokenCache()
+    assert cache.get_token_list(messages) == [3, 7, 7, 5]
+    assert encoder.calls == 6
+
+    assert cache.get_token_list(messages) == [3, 7, 7, 5]
+    assert encoder.calls == 6
+    assert (cache.hits, cache.misses) == (3, 3)
+
+
+def test_edit_only_counts_changed(xession, encoder, messages):
+    cache = TokenCache()
+    cache.get_token_list(messages)
+    messages[0] = {"role": "system", "content": "You are a pirate."}
+    encoder.calls = 0
+
+    assert cache.get_token_list(messages)[1] == 8
+    assert encoder.calls == 2
+
+
+def test_encodes_large_convos_in_one_batch(xession, encoder):
+    messages = [{"role": "user", "content": f"message {i}"} for i in range(40)]
+    cache = TokenCache(threads=4)
+    assert cache.get_token_list(messages + messages[:2]) == [3] + [6] * 42
+    assert encoder.batches == [(80, 4)]
+
+
+def test_encodes_small_convos_serially(xession, encoder, messages):
+    cache = TokenCache(threads=4)
+    cache.get_token_list(messages)
+    assert encoder.batches == []
+    assert encoder.calls == 6
+
+
+def test_threads_from_env(xession, encoder):
+    xession.env["CHATGPT_TOKENIZER_THREADS"] = 1
+    messages = [{"role": "user", "content": f"message {i}"} for i in range(40)]
+    TokenCache().get_token_list(messages)
+    assert encoder.batches == []
+
+
+def test_key_separates_fields():
+    assert TokenCache.key({"role": "ab", "content": "c"}) != TokenCache.key(
+        {"role": "a", "content": "bc"}
+    )
+
+
+def test_evicts_least_recently_used(xession, encoder, messages):
+    cache = TokenCache(max_entries=2)
+    cache.get_token_list(messages)
+    assert len(cache) == 2
+    encoder.calls = 0
+    cache.count(messages[2])
+    assert encoder.calls == 0
+    cache.count(messages[0])
+    assert encoder.calls == 2
+
+
+def test_sidecar_round_trip(xession, encoder, messages, tmpdir):
+    path = get_sidecar_path(str(tmpdir / "convo.json"))
+    assert os.path.basename(path) == ".convo.json.tokens"
+
+    TokenCache().save(path, messages)
+    encoder.calls = 0
+
+    cache = TokenCache()
+    assert cache.load(path) == 3
+    assert cache.get_token_list(messages) == [3, 7, 7, 5]
+    assert encoder.calls == 0
+
+
+def test_load_ignores_bad_sidecar(xession, tmpdir):
+    path = tmpdir / ".convo.json.tokens"
+    assert TokenCache().load(str(path)) == 0
+    path.write('{"encoding": "p50k_base", "counts": {"a": 1}}')
+    assert TokenCache().load(str(path)) == 0
+
+
+def test_ledger_behaves_like_list():
+    ledger = TokenLedger([1, 2])
+    ledger.append(3)
+    ledger.extend([4])
+    assert ledger == [1, 2, 3, 4]
+    assert ledger == TokenLedger([1, 2, 3, 4])
+    assert len(ledger) == 4
+    assert list(ledger) == [1, 2, 3, 4]
+    assert ledger[1::2] == [2, 4]
+    assert ledger[-1] == 4
+
+
+@pytest.mark.parametrize("start", [0, 1, 4, 10, -1, -3, -10])
+def test_ledger_total(start):
+    counts = [5, 1, 7, 3]
+    assert TokenLedger(counts).total(start) == sum(counts[start:])
+
+
+@pytest.mark.parametrize(
+    ("budget", "start", "expected"), [(100, 0, 0), (10, 0, 2), (3, 0, 3), (0, 0, 3)]
+)
+def test_ledger_cut(budget, start, expected):
+    assert TokenLedger([5, 1, 7, 3]).cut(budget, start, 3) == expected
+
+
+def test_failed_encoding_load_is_retried(monkeypatch):
+    import tiktoken
+
+    calls = 0
+
+    def get_encoding(name):
+        nonlocal calls
+        calls += 1
+        if calls == 1:
+            raise OSError("offline")
+        return WordEncoder()
+
+    monkeypatch.setattr(tiktoken, "get_encoding", get_encoding)
+    ctx = {}
+    ctx["enc"] = LazyObject(_tiktoken, ctx, "enc")
+
+    with pytest.raises(OSError, match="offline"):
+        ctx["enc"].encode("hello")
+    assert ctx["enc"].encode("hello world") == ["hello", "world"]
+    assert calls == 2
@@ -0,0 +1,92 @@
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import openai
+import pytest
+
+from xontrib_chatgpt import transport as tp
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"ok")
+
+    def log_message(self, *_):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture(autouse=True)
+def no_transport(xession):
+    tp.close_transport()
+    yield
+    tp.close_transport()
+
+
+@pytest.fixture
+def transport(xession):
+    yield tp.open_transport(pool_size=2, connect_timeout=1, read_timeout=5)
+    tp.close_transport()
+
+
+def test_request_kwargs_without_transport(xession):
+    assert tp.get_transport() is None
+    assert tp.request_kwargs() == {}
+
+
+def test_installs_lazily(transport):
+    assert transport.session is None
+    assert tp.request_kwargs() == {"request_timeout": (1, 5)}
+    assert openai.requestssession is transport.session
+
+
+def test_close_restores_openai_session(transport):
+    tp.request_kwargs()
+    session = transport.session
+    tp.close_transport()
+    assert openai.requestssession is None
+    assert tp.get_transport() is None
+    assert not session.adapters["https://"].poolmanager.pools.keys()
+
+
+def test_survives_openai_session_recycling(transport, server):
+    tp.request_kwargs()
+    session = transport.session
+    session.get(server)
+    session.close()
+    assert transport.stats()["connections"] == 1
+
+
+def test_reuses_connections(transport, server):
+    tp.request_kwargs()
+    for _ in range(3):
+        assert transport.session.get(server).text == "ok"
+    assert transport.stats() == {"requests": 3, "connections": 1, "reused": 2}
+
+
+def test_aiosession(transport, server):
+    async def run():
+        async with tp.aiosession():
+            session = openai.aiosession.get()
+            for _ in range(3):
+                async with session.get(server) as res:
+                    assert await res.text() == "ok"
+        return openai.aiosession.get()
+
+    assert asyncio.run(run()) is None
+    assert transport.stats() == {"requests": 3, "connections": 1, "reused": 2}
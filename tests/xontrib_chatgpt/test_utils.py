@@ -4,6 +4,7 @@ from textwrap import dedent
 
 from xontrib_chatgpt.utils import (
     parse_convo,
+    read_convo,
     get_token_list,
     format_markdown,
     convert_to_sys,
@@ -54,6 +55,13 @@ def test_parses_json(xession, temp_home):
     assert base + msg == json.loads(exp_json)
 
 
+def test_parses_jsonl(xession, temp_home):
+    with open(temp_home / "expected" / "convo.json") as f:
+        exp = json.load(f)
+    msgs, base = parse_convo("".join(json.dumps(m) + "\n" for m in exp))
+    assert base + msgs == exp
+
+
 def test_parses_text(xession, temp_home):
     text_path = temp_home / "expected" / "long_convo.txt"
     with open(text_path) as f:
@@ -70,6 +78,31 @@ def test_parses_text(xession, temp_home):
     assert base[0] == {"role": "system", "content": "This is a test.\n"}
 
 
+def test_reads_convo_from_file(xession, tmp_path):
+    path = tmp_path / "convo.txt"
+    path.write_text(
+        "\n\nSystem:\n    sys\n\nuser:\n    a\n      b\nassistant:\n    c\n"
+    )
+
+    with open(path) as f:
+        msgs, base = read_convo(f)
+
+    assert base == [{"role": "system", "content": "sys\n"}]
+    assert msgs == [
+        {"role": "user", "content": "a\n  b\n"},
+        {"role": "assistant", "content": "c\n"},
+    ]
+
+
+def test_reads_partial_journal(xession, tmp_path):
+    path = tmp_path / "convo.jsonl"
+    msg = {"role": "user", "content": "hi"}
+    path.write_text(json.dumps(msg) + '\n{"role": "assis')
+
+    with open(path) as f:
+        assert read_convo(f) == ([msg], [])
+
+
 def test_get_token_list(xession, temp_home):
     json_path = temp_home / "expected" / "convo2.json"
     with open(json_path) as f:
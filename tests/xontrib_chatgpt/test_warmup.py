@@ -0,0 +1,82 @@
+import threading
+import pytest
+
+from xontrib_chatgpt import warmup as wu
+from xontrib_chatgpt.warmup import Warmup
+
+
+@pytest.fixture
+def components():
+    loaded = []
+
+    def fail():
+        raise OSError("offline")
+
+    yield loaded, [
+        ("fast", lambda: loaded.append("fast")),
+        ("broken", fail),
+    ]
+
+
+def test_runs_in_background(components):
+    loaded, comps = components
+    gate = threading.Event()
+    warmup = Warmup([("slow", gate.wait), *comps])
+
+    assert warmup.start()
+    assert not warmup.start()
+    assert warmup.started and not warmup.done
+    assert "running" in warmup.report()
+
+    gate.set()
+    assert warmup.wait(5)
+    assert loaded == ["fast"]
+    assert set(warmup.timings) == {"slow", "fast", "broken"}
+    assert warmup.errors == {"broken": "OSError: offline"}
+
+
+def test_report(components):
+    _, comps = components
+    warmup = Warmup(comps)
+    assert "has not run" in warmup.report()
+
+    warmup.start()
+    warmup.wait(5)
+    report = warmup.report()
+    assert "done" in report
+    assert "fast: " in report and "ms" in report
+    assert "broken: " in report and "OSError: offline" in report
+
+
+@pytest.mark.parametrize("enabled", [True, False])
+def test_starts_before_first_prompt(xession, monkeypatch, components, enabled):
+    _, comps = components
+    warmup = Warmup(comps)
+    monkeypatch.setattr(wu, "warmup", warmup)
+    xession.env["CHATGPT_WARMUP"] = enabled
+
+    wu.add_warmup(xession)
+    try:
+        xession.builtins.events.on_pre_prompt.fire()
+        xession.builtins.events.on_pre_prompt.fire()
+    finally:
+        wu.rm_warmup(xession)
+
+    assert warmup.started == enabled
+    warmup.wait(5)
+
+
+def test_loads_the_token_counting_encoder(monkeypatch):
+    from xontrib_chatgpt import tokens
+
+    class Encoder:
+        texts = []
+
+        def encode(self, text):
+            self.texts.append(text)
+            return text.split()
+
+    encoder = Encoder()
+    monkeypatch.setattr(tokens, "tiktoken", encoder)
+    dict(wu.COMPONENTS)["tiktoken"]()
+    assert encoder.texts == ["warm up"]
@@ -0,0 +1,72 @@
+import threading
+import pytest
+
+from xontrib_chatgpt.writer import BackgroundWriter, atomic_write
+
+
+def test_atomic_write(tmp_path):
+    path = tmp_path / "convo.txt"
+    path.write_text("old")
+
+    def fail(tmp):
+        with open(tmp, "w") as f:
+            f.write("partial")
+        raise OSError("disk full")
+
+    with pytest.raises(OSError):
+        atomic_write(str(path), fail)
+    assert path.read_text() == "old"
+    assert [p.name for p in tmp_path.iterdir()] == ["convo.txt"]
+
+    def write(tmp):
+        assert tmp.endswith(".txt")
+        with open(tmp, "w") as f:
+            f.write("new")
+
+    atomic_write(str(path), write)
+    assert path.read_text() == "new"
+
+
+def test_coalesces_writes(tmp_path):
+    writer = BackgroundWriter()
+    gate, started = threading.Event(), threading.Event()
+    written, done = [], []
+
+    def blocked(tmp):
+        started.set()
+        gate.wait()
+
+    def write(text):
+        def _write(tmp):
+            written.append(text)
+            with open(tmp, "w") as f:
+                f.write(text)
+
+        return _write
+
+    path = str(tmp_path / "convo.txt")
+    writer.submit(str(tmp_path / "other.txt"), blocked)
+    started.wait(5)
+    writer.submit(path, write("first"), done.append)
+    writer.submit(path, write("second"), done.append)
+    assert writer.pending == 2
+
+    gate.set()
+    assert writer.flush(5)
+    assert written == ["second"]
+    assert done == [None, None]
+    assert open(path).read() == "second"
+
+
+def test_records_errors(tmp_path):
+    writer = BackgroundWriter()
+    done = []
+
+    def fail(tmp):
+        raise ValueError("bad")
+
+    path = str(tmp_path / "convo.txt")
+    writer.submit(path, fail, done.append)
+    assert writer.flush(5)
+    assert done == ["ValueError: bad"]
+    assert writer.errors[path] == "ValueError: bad"
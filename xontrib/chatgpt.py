@@ -2,11 +2,13 @@
 
 from xonsh.built_ins import XonshSession
 
-from xontrib_chatgpt.chatgpt import ChatGPT
+from xontrib_chatgpt.chatgpt import ChatGPT, add_journals, rm_journals
 from xontrib_chatgpt.chatmanager import ChatManager
 from xontrib_chatgpt.events import add_events, rm_events
 from xontrib_chatgpt.completers import add_completers, rm_completers
-
+from xontrib_chatgpt.transport import open_transport, close_transport
+from xontrib_chatgpt.warmup import add_warmup, rm_warmup
+from xontrib_chatgpt.writer import add_writer, rm_writer
 
 __all__ = ()
 
@@ -15,12 +17,17 @@ def _load_xontrib_(xsh: XonshSession, **_):
     xsh.aliases["chatgpt"] = lambda args, stdin=None: ChatGPT.fromcli(args, stdin)
     xsh.aliases["chatgpt?"] = lambda *_, **__: xsh.help(ChatGPT)
 
+    open_transport()
+
     cm = ChatManager()
     xsh.aliases["chat-manager"] = lambda args, stdin=None: cm(args, stdin)
     xsh.aliases["chat-manager?"] = "chat-manager help"
 
     add_events(xsh, cm)
     add_completers()
+    add_warmup(xsh)
+    add_writer(xsh)
+    add_journals(xsh)
 
     if "abbrevs" in xsh.ctx:
         xsh.ctx["abbrevs"]["cm"] = "chat-manager"
@@ -35,6 +42,10 @@ def _unload_xontrib_(xsh: XonshSession, **_):
 
     rm_events(xsh)
     rm_completers()
+    rm_warmup(xsh)
+    rm_journals(xsh)
+    rm_writer(xsh)
+    close_transport()
 
     if "abbrevs" in xsh.ctx:
         del xsh.ctx["abbrevs"]["cm"]
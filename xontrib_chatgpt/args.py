@@ -1,6 +1,6 @@
 """Argument parsers for ChatGPT and ChatManager"""
 
-from argparse import ArgumentParser
+from argparse import ArgumentParser, BooleanOptionalAction
 
 
 def _gpt_parse():
@@ -59,8 +59,43 @@ def _gpt_parse():
         "--type",
         type=str,
         default="text",
-        choices=["text", "json"],
-        help="Type of the conversation file. Default is text.",
+        choices=["text", "json", "jsonl", "text.gz", "json.gz", "text.xz", "json.xz"],
+        help="Type of the conversation file, .gz and .xz are compressed. Default is text.",
+    )
+    b_group = cmd_parser.add_argument_group(title="Batch")
+    b_group.add_argument(
+        "-b",
+        "--batch",
+        dest="cmd",
+        const="batch",
+        action="store_const",
+        help="Sends each line of the given files, or stdin, as a separate prompt. Lines may be plain text or JSON objects with a 'prompt' key.",
+    )
+    b_group.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=None,
+        help="Maximum number of batch requests in flight. Defaults to $CHATGPT_BATCH_JOBS or 4.",
+    )
+    b_group.add_argument(
+        "-o",
+        "--output",
+        type=str,
+        default="",
+        help="File to write batch results to as JSONL. Default is stdout.",
+    )
+    b_group.add_argument(
+        "--retries",
+        type=int,
+        default=None,
+        help="Number of retries for failed batch requests. Defaults to $CHATGPT_MAX_RETRIES or 3.",
+    )
+    cmd_parser.add_argument(
+        "--stream",
+        action=BooleanOptionalAction,
+        default=None,
+        help="Render the response as it arrives. Defaults to $CHATGPT_STREAM.",
     )
     cmd_parser.add_argument(
         "text",
@@ -85,6 +120,13 @@ def _cm_parse() -> ArgumentParser:
         default=False,
         action="store_const",
     )
+    parser.add_argument(
+        "-T",
+        help="Print connection statistics for the shared OpenAI transport and exit",
+        const=True,
+        default=False,
+        action="store_const",
+    )
 
     subparser = parser.add_subparsers(
         dest="cmd", title="Available Commands", metavar="COMMAND"
@@ -110,6 +152,12 @@ def _cm_parse() -> ArgumentParser:
         "name", type=str, help="Name or absolute path of the chat to load", nargs=1
     )
 
+    p_search = subparser.add_parser("search", help="Search the contents of saved chats")
+    p_search.add_argument("query", type=str, help="Words to search for", nargs="+")
+    p_search.add_argument(
+        "-n", type=int, default=10, help="Maximum number of results. Default is 10"
+    )
+
     p_save = subparser.add_parser("save", help="Save a chat")
     p_save.add_argument(
         "name",
@@ -123,7 +171,7 @@ def _cm_parse() -> ArgumentParser:
         "--mode",
         type=str,
         default="text",
-        choices=["text", "json"],
+        choices=["text", "json", "jsonl", "text.gz", "json.gz", "text.xz", "json.xz"],
         help="Mode to print or save the conversation. Default is text",
     )
     p_save.add_argument(
@@ -154,6 +202,40 @@ def _cm_parse() -> ArgumentParser:
         help="Mode to print or save the conversation. Default is color",
     )
 
+    p_broadcast = subparser.add_parser(
+        "broadcast", help="Send a message to several chats at once", aliases=["b"]
+    )
+    p_broadcast.add_argument("text", type=str, help="Text to send", nargs="+")
+    p_broadcast.add_argument(
+        "-c",
+        "--chat",
+        type=str,
+        help="Name of a chat to send to. Can be used multiple times. Defaults to all chats",
+        dest="chats",
+        action="append",
+        default=None,
+    )
+    p_broadcast.add_argument(
+        "-g",
+        "--glob",
+        type=str,
+        help="Glob pattern of chat names to send to, i.e. 'gpt*'",
+        dest="pattern",
+        default="",
+    )
+    p_broadcast.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        help="Maximum number of requests in flight. Defaults to $CHATGPT_BROADCAST_WORKERS or 4",
+        default=None,
+    )
+
+    subparser.add_parser(
+        "warmup",
+        help="Load openai, tiktoken and pygments in the background and report how long each took",
+    )
+
     p_help = subparser.add_parser("help", help="Print help information", epilog="hello")
     p_help.add_argument(
         "target",
@@ -0,0 +1,100 @@
+"""Batch runner for sending many one-off prompts to ChatGPT"""
+
+import json
+import asyncio
+from typing import Any, Awaitable, Callable, Iterable, TextIO
+
+
+def read_prompts(lines: Iterable[str]) -> list[dict[str, Any]]:
+    """Reads batch records from lines of text or JSONL
+
+    Each non-empty line is one prompt. JSON objects must have a 'prompt' key,
+    any other keys are passed through to the output record. Lines that are not
+    JSON objects are sent as they are.
+
+    Parameters
+    ----------
+    lines : Iterable[str]
+        Lines from a file or stdin
+
+    Returns
+    -------
+    list[dict[str, Any]]
+        Records with at least a 'prompt' key
+    """
+    records = []
+
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError:
+            record = None
+
+        if isinstance(record, dict) and "prompt" in record:
+            records.append(record)
+        elif isinstance(record, str):
+            records.append({"prompt": record})
+        else:
+            records.append({"prompt": line})
+
+    return records
+
+
+class BatchRunner:
+    """Runs prompts concurrently and writes results as ordered JSONL
+
+    Retries and rate limits are handled by send, so a failed prompt is
+    recorded with its error and the rest of the batch carries on.
+
+    Parameters
+    ----------
+    send : Callable[[str], Awaitable[str]]
+        Coroutine function that sends a single prompt and returns the response
+    jobs : int, optional
+        Maximum number of requests in flight, by default 4
+    """
+
+    def __init__(self, send: Callable[[str], Awaitable[str]], jobs: int = 4):
+        self.send = send
+        self.jobs = max(jobs, 1)
+
+    async def arun(self, records: list[dict[str, Any]], out: TextIO) -> int:
+        """Runs all records, writing each result to out in input order.
+        Returns the number of failed records."""
+        sem = asyncio.Semaphore(self.jobs)
+        results: dict[int, dict[str, Any]] = {}
+        next_idx, failed = 0, 0
+
+        async def worker(idx: int, record: dict[str, Any]) -> int:
+            async with sem:
+                results[idx] = await self._run_one(idx, record)
+            return idx
+
+        for fut in asyncio.as_completed([worker(i, r) for i, r in enumerate(records)]):
+            await fut
+
+            # Only write once every earlier record is done to keep the output ordered
+            while next_idx in results:
+                res = results.pop(next_idx)
+                failed += "error" in res
+                out.write(json.dumps(res) + "\n")
+                out.flush()
+                next_idx += 1
+
+        return failed
+
+    async def _run_one(self, idx: int, record: dict[str, Any]) -> dict[str, Any]:
+        """Sends a single record, recording the response or error"""
+        res = {"index": idx, **record}
+
+        try:
+            res["response"] = await self.send(record["prompt"])
+        except Exception as e:
+            # Any error, including transport ones, only fails this record
+            res["error"] = f"{type(e).__name__}: {e}"
+
+        return res
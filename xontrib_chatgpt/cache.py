@@ -0,0 +1,201 @@
+"""On-disk cache of ChatGPT responses"""
+
+import os
+import json
+import time
+import hashlib
+import tempfile
+from typing import Optional
+
+from xonsh.built_ins import XSH
+
+from xontrib_chatgpt.utils import get_data_dir
+
+# Writes between full scans of the cache directory. A scan also removes expired
+# entries that are never read again and counts entries added by other shells.
+SCAN_EVERY = 100
+
+
+class ResponseCache:
+    """Caches responses on disk, keyed by the model and the messages sent
+
+    Each entry is a small JSON file holding the response message and its usage.
+    The file's modification time is bumped on every hit, so the least recently
+    used entries are evicted first once there are more than max_entries.
+    Entries are counted in memory, the directory is only scanned once the
+    count goes over max_entries or every SCAN_EVERY writes.
+
+    Parameters
+    ----------
+    cache_dir : str, optional
+        Directory to store entries in, by default ''
+        Defaults to $XONSH_DATA_DIR/chatgpt/cache.
+    max_entries : int, optional
+        Maximum number of entries to keep, by default None
+        Defaults to $CHATGPT_CACHE_MAX_ENTRIES or 1000.
+    ttl : float, optional
+        Seconds an entry stays valid after it is stored, by default None
+        Defaults to $CHATGPT_CACHE_TTL or 7 days.
+    """
+
+    def __init__(
+        self,
+        cache_dir: str = "",
+        max_entries: Optional[int] = None,
+        ttl: Optional[float] = None,
+    ):
+        self._cache_dir = cache_dir
+        self._max_entries = max_entries
+        self._ttl = ttl
+        # Entries in _counted_dir as of the last scan, plus new ones since
+        self._entries: Optional[int] = None
+        self._counted_dir = ""
+        self._writes = 0
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def cache_dir(self) -> str:
+        if self._cache_dir:
+            return self._cache_dir
+        return os.path.join(get_data_dir(), "chatgpt", "cache")
+
+    @property
+    def max_entries(self) -> int:
+        if self._max_entries is not None:
+            return self._max_entries
+        return int(XSH.env.get("CHATGPT_CACHE_MAX_ENTRIES", 1000))
+
+    @property
+    def ttl(self) -> float:
+        if self._ttl is not None:
+            return self._ttl
+        return float(XSH.env.get("CHATGPT_CACHE_TTL", 7 * 24 * 60 * 60))
+
+    @staticmethod
+    def key(model: str, messages: list[dict[str, str]]) -> str:
+        """Returns a stable hash of the model and messages"""
+        payload = json.dumps(
+            {
+                "model": model,
+                "messages": [[m["role"], m["content"]] for m in messages],
+            },
+            separators=(",", ":"),
+        )
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[dict]:
+        """Returns the cached entry for key, or None on a miss
+
+        Entries are dicts with 'message' and 'usage' keys, in the same
+        shape as an OpenAI ChatCompletion response.
+        """
+        path = self._path(key)
+
+        try:
+            with open(path, "r") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+
+        if time.time() - entry.get("created", 0) > self.ttl:
+            self._remove(path)
+            self.misses += 1
+            return None
+
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+        self.hits += 1
+        return entry
+
+    def set(self, key: str, message: dict[str, str], usage: dict[str, int]) -> None:
+        """Stores a response and evicts old entries if the cache is full"""
+        cache_dir = self.cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+        entry = {
+            "message": {"role": message["role"], "content": message["content"]},
+            "usage": {
+                "prompt_tokens": usage["prompt_tokens"],
+                "completion_tokens": usage["completion_tokens"],
+            },
+            "created": time.time(),
+        }
+
+        path = self._path(key)
+        new = not os.path.exists(path)
+
+        # Write to a temp file first so a reader never sees a partial entry
+        fd, tmp = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(entry, f)
+        os.replace(tmp, path)
+
+        self._writes += 1
+        if self._entries is None or self._counted_dir != cache_dir:
+            self.evict()
+        else:
+            self._entries += new
+            if self._entries > self.max_entries or self._writes >= SCAN_EVERY:
+                self.evict()
+
+    def evict(self) -> None:
+        """Removes expired entries, then the least recently used over max_entries"""
+        cache_dir = self.cache_dir
+        try:
+            entries = [
+                e
+                for e in os.scandir(cache_dir)
+                if e.is_file() and e.name.endswith(".json")
+            ]
+        except OSError:
+            return
+
+        now, ttl, live = time.time(), self.ttl, []
+
+        for e in entries:
+            mtime = e.stat().st_mtime
+            # mtime is bumped on hits, so it can only be newer than the created time
+            if now - mtime > ttl:
+                self._remove(e.path)
+            else:
+                live.append((mtime, e.path))
+
+        excess = len(live) - self.max_entries
+        if excess > 0:
+            for _, path in sorted(live)[:excess]:
+                self._remove(path)
+
+        self._entries = len(live) - max(excess, 0)
+        self._counted_dir = cache_dir
+        self._writes = 0
+
+    def clear(self) -> None:
+        """Removes every entry and resets the counters"""
+        try:
+            entries = list(os.scandir(self.cache_dir))
+        except OSError:
+            entries = []
+
+        for e in entries:
+            if e.is_file():
+                self._remove(e.path)
+
+        self._entries = None
+        self.hits = self.misses = 0
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key + ".json")
+
+    @staticmethod
+    def _remove(path: str) -> None:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+response_cache = ResponseCache()
@@ -0,0 +1,305 @@
+"""SQLite catalog of the chats saved in the default directory"""
+
+import os
+import lzma
+import sqlite3
+import threading
+import contextlib
+from datetime import datetime
+from typing import Iterator, Optional
+
+from xonsh.lazyasd import LazyObject
+
+from xontrib_chatgpt.exceptions import SearchUnavailableError
+from xontrib_chatgpt.lazyobjs import _FIND_NAME_REGEX
+from xontrib_chatgpt.utils import get_data_dir, open_convo, read_convo
+
+FIND_NAME_REGEX = LazyObject(_FIND_NAME_REGEX, globals(), "FIND_NAME_REGEX")
+
+FORMATS = {".txt": "text", ".json": "json", ".jsonl": "jsonl"}
+
+COMPRESSIONS = (".gz", ".xz")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS chats (
+    file TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    alias TEXT NOT NULL DEFAULT '',
+    date TEXT NOT NULL,
+    format TEXT NOT NULL,
+    messages INTEGER,
+    tokens INTEGER,
+    mtime INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS chats_name ON chats (name);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER);
+"""
+
+# Created on the first search, so the catalog works without FTS5
+SEARCH_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS chat_text USING fts5 (
+    file UNINDEXED, content, tokenize = 'porter unicode61'
+);
+CREATE TABLE IF NOT EXISTS indexed (file TEXT PRIMARY KEY, mtime INTEGER NOT NULL);
+"""
+
+
+class Catalog:
+    """Index of the saved chats in a directory
+
+    Lookups are answered from the index instead of listing the directory and
+    matching every file name. The directory is only rescanned when its mtime
+    changes, which is how files added or removed outside the xontrib are
+    picked up. Message and token counts of such files are unknown until they
+    are saved or loaded through the xontrib.
+
+    The database lives in its own hidden subdirectory, so its journal files
+    do not change the mtime of the chat directory.
+
+    Parameters
+    ----------
+    chat_dir : str
+        Directory of the saved chats
+    """
+
+    def __init__(self, chat_dir: str):
+        self.chat_dir = chat_dir
+        self.db_path = os.path.join(chat_dir, ".catalog", "catalog.sqlite")
+        self._lock = threading.Lock()
+        self._ready = False
+
+    @contextlib.contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        """Connection for a single transaction, committed and closed after"""
+        with self._lock:
+            if not self._ready:
+                os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+
+            conn = sqlite3.connect(self.db_path)
+            try:
+                if not self._ready:
+                    conn.executescript(SCHEMA)
+                    self._ready = True
+                with conn:
+                    yield conn
+            finally:
+                conn.close()
+
+    def refresh(self) -> bool:
+        """Rescans the directory if it changed since the last scan,
+        returns whether it did"""
+        if not os.path.isdir(self.chat_dir):
+            return False
+
+        with self._connect() as conn:
+            # Read after connecting, which may create the database directory
+            dir_mtime = os.stat(self.chat_dir).st_mtime_ns
+            row = conn.execute("SELECT value FROM meta WHERE key = 'mtime'").fetchone()
+            if row is not None and row[0] == dir_mtime:
+                return False
+
+            on_disk = {}
+            with os.scandir(self.chat_dir) as it:
+                for e in it:
+                    # Hidden files are sidecars, i.e. token counts
+                    if not e.name.startswith(".") and e.is_file():
+                        on_disk[e.name] = e.stat().st_mtime_ns
+
+            known = dict(conn.execute("SELECT file, mtime FROM chats"))
+            conn.executemany(
+                "DELETE FROM chats WHERE file = ?",
+                [(f,) for f in known.keys() - on_disk.keys()],
+            )
+            # Keeps the alias and counts recorded for a file that was appended to
+            conn.executemany(
+                "INSERT INTO chats (file, name, date, format, mtime) "
+                "VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (file) DO UPDATE SET name = excluded.name, "
+                "date = excluded.date, format = excluded.format, mtime = excluded.mtime",
+                [
+                    (f, *self._describe(f, mtime), mtime)
+                    for f, mtime in on_disk.items()
+                    if known.get(f) != mtime
+                ],
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('mtime', ?)",
+                (dir_mtime,),
+            )
+
+        return True
+
+    @staticmethod
+    def _describe(file: str, mtime: int) -> tuple[str, str, str]:
+        """Returns the name, date and format of a saved chat file"""
+        date = datetime.fromtimestamp(mtime / 1e9).strftime("%Y-%m-%d")
+        root, ext = os.path.splitext(file)
+        if ext in COMPRESSIONS:
+            root, inner = os.path.splitext(root)
+            fmt = FORMATS.get(inner, "text") + ext
+        else:
+            fmt = FORMATS.get(ext, "text")
+        return FIND_NAME_REGEX.sub(r"\1", file), date, fmt
+
+    def record(
+        self,
+        path: str,
+        alias: str = "",
+        messages: Optional[int] = None,
+        tokens: Optional[int] = None,
+    ) -> None:
+        """Adds or updates a chat saved to path, if it is in the directory.
+        Counts left as None keep the ones already recorded."""
+        path = str(path)
+        if os.path.dirname(os.path.abspath(path)) != os.path.abspath(self.chat_dir):
+            return
+
+        file = os.path.basename(path)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            return
+
+        name, date, fmt = self._describe(file, mtime)
+
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO chats "
+                "(file, name, alias, date, format, messages, tokens, mtime) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (file) DO UPDATE SET name = excluded.name, "
+                "alias = excluded.alias, date = excluded.date, "
+                "format = excluded.format, "
+                "messages = COALESCE(excluded.messages, chats.messages), "
+                "tokens = COALESCE(excluded.tokens, chats.tokens), "
+                "mtime = excluded.mtime",
+                (file, name, alias, date, fmt, messages, tokens, mtime),
+            )
+
+    def _query(self, sql: str, params: tuple = ()) -> list[sqlite3.Row]:
+        """Runs a query against an up to date catalog"""
+        if not os.path.isdir(self.chat_dir):
+            return []
+
+        self.refresh()
+
+        with self._connect() as conn:
+            conn.row_factory = sqlite3.Row
+            return conn.execute(sql, params).fetchall()
+
+    def files(self) -> list[str]:
+        """Returns the file names of every saved chat"""
+        return [
+            row["file"] for row in self._query("SELECT file FROM chats ORDER BY file")
+        ]
+
+    def find(self, name: str) -> list[tuple[str, str]]:
+        """Returns the (name, file) of the saved chats with a name or file name"""
+        rows = self._query(
+            "SELECT name, file FROM chats WHERE name = ? OR file = ? ORDER BY file",
+            (name, name),
+        )
+        return [(row["name"], row["file"]) for row in rows]
+
+    def entries(self) -> list[dict]:
+        """Returns every catalog entry as a dict"""
+        return [dict(row) for row in self._query("SELECT * FROM chats ORDER BY file")]
+
+    def search(
+        self, query: str, limit: int = 10, mark: tuple[str, str] = ("[", "]")
+    ) -> list[dict]:
+        """Full-text search over the contents of the saved chats
+
+        Parameters
+        ----------
+        query : str
+            Words to search for, every one must appear in a chat
+        limit : int, optional
+            Maximum number of results, by default 10
+        mark : tuple[str, str], optional
+            Strings put around the matched words in the snippets
+
+        Returns
+        -------
+        list[dict]
+            The name, file and snippet of the matching chats, best match first
+
+        Raises
+        ------
+        SearchUnavailableError
+            If SQLite was built without the FTS5 extension
+        """
+        terms = " ".join('"' + t.replace('"', '""') + '"' for t in query.split())
+        if not terms or not os.path.isdir(self.chat_dir):
+            return []
+
+        self.refresh()
+
+        with self._connect() as conn:
+            try:
+                conn.executescript(SEARCH_SCHEMA)
+            except sqlite3.OperationalError as e:
+                raise SearchUnavailableError(str(e)) from None
+            self._reindex(conn)
+            conn.row_factory = sqlite3.Row
+            rows = conn.execute(
+                "SELECT chats.name, chat_text.file, "
+                "snippet(chat_text, 1, ?, ?, '...', 16) AS snippet "
+                "FROM chat_text JOIN chats ON chats.file = chat_text.file "
+                "WHERE chat_text MATCH ? ORDER BY rank LIMIT ?",
+                (*mark, terms, limit),
+            ).fetchall()
+
+        return [dict(row) for row in rows]
+
+    def _reindex(self, conn: sqlite3.Connection) -> None:
+        """Brings the search index up to date with the catalog, only reading
+        the files added or changed since they were last indexed"""
+        on_disk = {}
+        for (file,) in conn.execute("SELECT file FROM chats"):
+            try:
+                on_disk[file] = os.stat(os.path.join(self.chat_dir, file)).st_mtime_ns
+            except FileNotFoundError:
+                pass
+
+        known = dict(conn.execute("SELECT file, mtime FROM indexed"))
+        stale = [f for f in known if on_disk.get(f) != known[f]]
+        conn.executemany("DELETE FROM chat_text WHERE file = ?", [(f,) for f in stale])
+        conn.executemany("DELETE FROM indexed WHERE file = ?", [(f,) for f in stale])
+
+        for file, mtime in on_disk.items():
+            if known.get(file) == mtime:
+                continue
+            conn.execute(
+                "INSERT INTO chat_text (file, content) VALUES (?, ?)",
+                (file, self._read_text(file)),
+            )
+            conn.execute(
+                "INSERT INTO indexed (file, mtime) VALUES (?, ?)", (file, mtime)
+            )
+
+    def _read_text(self, file: str) -> str:
+        """Returns the text of every message of a saved chat, or an empty
+        string if it can not be parsed"""
+        try:
+            with open_convo(os.path.join(self.chat_dir, file)) as f:
+                messages, base = read_convo(f)
+            return "\n".join(m["content"] for m in base + messages)
+        except (OSError, ValueError, EOFError, KeyError, TypeError, lzma.LZMAError):
+            return ""
+
+
+_catalogs: dict[str, Catalog] = {}
+
+
+def get_chat_dir() -> str:
+    """Returns the default directory of saved chats"""
+    return os.path.join(get_data_dir(), "chatgpt")
+
+
+def get_catalog() -> Catalog:
+    """Returns the catalog of the current default directory"""
+    chat_dir = get_chat_dir()
+    if chat_dir not in _catalogs:
+        _catalogs[chat_dir] = Catalog(chat_dir)
+    return _catalogs[chat_dir]
@@ -3,9 +3,11 @@
 import sys
 import os
 import json
+import asyncio
 import weakref
-from typing import TextIO
-from xonsh.built_ins import XSH
+import itertools
+from typing import Callable, Iterable, TextIO, Optional, Iterator
+from xonsh.built_ins import XSH, XonshSession
 from xonsh.tools import indent
 from xonsh.contexts import Block
 from xonsh.lazyasd import LazyObject
@@ -13,26 +15,81 @@ from xonsh.ansi_colors import ansi_partial_color_format
 from openai.error import OpenAIError
 
 from xontrib_chatgpt.args import _gpt_parse
+from xontrib_chatgpt.batch import BatchRunner, read_prompts
+from xontrib_chatgpt.cache import response_cache
+from xontrib_chatgpt.catalog import get_catalog
+from xontrib_chatgpt.compaction import Compactor
+from xontrib_chatgpt.messages import (
+    Message,
+    SystemPrompt,
+    Window,
+    system_prompt,
+    to_messages,
+    to_wire,
+)
+from xontrib_chatgpt.journal import (
+    Journal,
+    journal_status,
+    iter_journal_reversed,
+    read_journal_head,
+    read_journal_range,
+)
+from xontrib_chatgpt.transport import aiosession, request_kwargs
+from xontrib_chatgpt.writer import atomic_write, writer
+from xontrib_chatgpt.ratelimit import rate_limiter
+from xontrib_chatgpt.tokens import (
+    CONTEXT_WINDOWS,
+    TokenLedger,
+    token_cache,
+    get_sidecar_path,
+    truncate_tokens,
+    count_tokens,
+    estimate_tokens,
+)
 from xontrib_chatgpt.lazyobjs import (
     _openai,
 )
 from xontrib_chatgpt.utils import (
     get_token_list,
-    parse_convo,
+    aget_token_list,
+    count_message,
+    read_convo,
     print_res,
+    print_stream,
     format_markdown,
     get_default_path,
+    get_data_dir,
+    get_env_bool,
+    open_convo,
+    SAVE_MODES,
 )
 from xontrib_chatgpt.exceptions import (
     NoApiKeyError,
     UnsupportedModelError,
     NoConversationsError,
     InvalidConversationsTypeError,
+    PromptTooLongError,
 )
 
 openai = LazyObject(_openai, globals(), "openai")
 parse = LazyObject(_gpt_parse, globals(), "parse")
 
+# Shared by every chat until its base is changed, counted once by hand
+DEFAULT_BASE = system_prompt(
+    [
+        {"role": "system", "content": "You are a helpful assistant."},
+        {
+            "role": "system",
+            "content": "If your responses include code, make sure to wrap it in a markdown code block with the appropriate language.\nExample:\n```python\nprint('Hello World!')\n```",
+        },
+    ],
+    lambda _: 53,
+)
+
+# Messages loaded by a lazy load even if fewer fill the token limit,
+# so printing the default 10 does not load the rest
+LAZY_MIN_MESSAGES = 10
+
 DOCSTRING = """\
 Allows for communication with ChatGPT from the xonsh shell.
 
@@ -48,6 +105,7 @@ Usage:
     # With the pre-registered 'chatgpt' alias
     >>> chatgpt [text] # text will be sent to ChatGPT
     >>> echo [text] | chatgpt # text from stdin will be sent to ChatGPT
+    >>> chatgpt --batch prompts.txt # each line is sent as a separate prompt
 
     # With a ChatGPT instance and context manager
     >>> gpt = ChatGPT()
@@ -73,12 +131,38 @@ Usage:
 Methods:
     print_convo - Prints the current conversation to the shell
     save_convo - Saves the current conversation to a file
+    achat - Async version of chat, for running several chats at once
+    asave_convo - Async version of save_convo
 
 Envs:
     $OPENAI_API_KEY - OpenAI API Key (REQUIRED)
     $OPENAI_CHAT_MODEL - OpenAI Chat Model
         Default: gpt-3.5-turbo
         Supported: gpt-3.5-turbo, gpt-4
+    $CHATGPT_STREAM - Render responses as they arrive
+        Default: False
+    $CHATGPT_CACHE - Reuse responses to identical conversations from disk
+        Default: False
+    $CHATGPT_RPM, $CHATGPT_TPM - Requests/tokens per minute to stay under
+        Default: None (unlimited), can be a dict of model to limit
+    $CHATGPT_MAX_RETRIES - Retries for rate limits and server errors
+        Default: 3
+    $CHATGPT_COMPLETION_RESERVE - Tokens of the context window kept for the response
+        Default: 1000
+    $CHATGPT_TRUNCATE_PROMPT - Cut down messages too long to send instead of refusing
+        Default: False
+    $CHATGPT_TOKEN_CACHE_PERSIST - Save token counts next to saved conversations
+        Default: False
+    $CHATGPT_COMPACT - Summarize trimmed history instead of dropping it
+        Default: False
+    $CHATGPT_SUMMARY_TOKENS - Maximum length of the summary of trimmed history
+        Default: 400
+    $CHATGPT_AUTOSAVE - Append every turn to a JSONL journal as it happens
+        Default: False
+    $CHATGPT_JOURNAL_FSYNC - Flush the journal to disk after every turn
+        Default: False
+    $CHATGPT_LAZY_LOAD - Only load the latest messages of saved chats until needed
+        Default: False
 
 Default Commands/Aliases:
     chatgpt - Alias for ChatGPT.fromcli
@@ -93,7 +177,9 @@ class ChatGPT(Block):
 
     __xonsh_block__ = str
 
-    def __init__(self, alias: str = "", managed: bool = False) -> None:
+    def __init__(
+        self, alias: str = "", managed: bool = False, autosave: bool = True
+    ) -> None:
         """
         Initializes the ChatGPT instance
 
@@ -102,34 +188,37 @@ class ChatGPT(Block):
         alias : str, optional
             Alias to use for the instance. Defaults to ''.
             Will automatically register a xonsh alias under XSH.aliases[alias] if provided.
+        autosave : bool, optional
+            Whether turns are journaled when $CHATGPT_AUTOSAVE is set.
+            Defaults to True, one off chats pass False.
         """
 
         self.alias = alias
-        self._base: list[dict[str, str]] = [
-            {"role": "system", "content": "You are a helpful assistant."},
-            {
-                "role": "system",
-                "content": "If your responses include code, make sure to wrap it in a markdown code block with the appropriate language.\nExample:\n```python\nprint('Hello World!')\n```",
-            },
-        ]
-        self.messages: list[dict[str, str]] = []
-        self._base_tokens: int = 53
-        self._tokens: list = []
+        self._base: SystemPrompt = DEFAULT_BASE
+        self.messages: list[Message] = []
+        self._tokens = TokenLedger()
         self._max_tokens = 3000
         self.chat_idx = 0
         self._managed = managed
+        self._autosaves = autosave
+        self._journal: Optional[Journal] = None
+        self._journaled = 0
+        self._older: Optional[Callable[[], list[dict[str, str]]]] = None
 
+        # Make sure the __del__ method is called despite the alias and compactor
+        # pointing to the instance
+        ref = weakref.proxy(self)
+        self._compactor = Compactor(lambda convo: ref._summarize(convo))
+
+        self._alias_func = lambda args, stdin=None: ref(args, stdin)
         if self.alias:
-            # Make sure the __del__ method is called despite the alias pointing to the instance
-            ref = weakref.proxy(self)
-            XSH.aliases[self.alias] = lambda args, stdin=None: ref(args, stdin)
+            XSH.aliases[self.alias] = self._alias_func
 
         if managed:
             XSH.builtins.events.on_chat_create.fire(inst=self)
 
     def __enter__(self):
-        res = self.chat(self.macro_block.strip())
-        print_res(res)
+        self._send(self.macro_block.strip())
         return self
 
     def __exit__(self, *_):
@@ -147,15 +236,19 @@ class ChatGPT(Block):
             return
 
         if pargs.cmd == "send":
-            res = self.chat(" ".join(pargs.text))
-            print_res(res)
+            self._send(" ".join(pargs.text), pargs.stream)
         elif pargs.cmd == "print":
             self.print_convo(pargs.n, pargs.mode)
         elif pargs.cmd == "save":
-            self.save_convo(pargs.path, pargs.name, pargs.type)
+            self.save_convo(pargs.path, pargs.name, pargs.type, background=True)
+        elif pargs.cmd == "batch":
+            self.batch(pargs.text, stdin, pargs.output, pargs.jobs, pargs.retries)
 
     def __del__(self):
-        if self.alias and self.alias in XSH.aliases:
+        # A newer chat may have taken over the alias since, xonsh wraps the
+        # function in a FuncAlias
+        alias = XSH.aliases[self.alias] if self.alias in XSH.aliases else None
+        if getattr(alias, "func", alias) is self._alias_func:
             print(f"Deleting {self.alias}")
             del XSH.aliases[self.alias]
 
@@ -172,20 +265,36 @@ class ChatGPT(Block):
     @property
     def tokens(self) -> int:
         """Current convo tokens"""
-        return self._base_tokens + sum(self._tokens[self.chat_idx :])
+        return (
+            self._base_tokens
+            + self._compactor.tokens
+            + self._tokens.total(self.chat_idx)
+        )
 
     @property
-    def base(self) -> list[dict[str, str]]:
+    def base(self) -> SystemPrompt:
+        """Base system messages, shared with other chats and read-only.
+        Assign a new list to change them."""
         return self._base
 
     @base.setter
     def base(self, msgs: list[dict[str, str]]) -> None:
-        self._base_tokens = sum(get_token_list(msgs))
-        self._base = msgs
+        self._base = system_prompt(msgs, lambda m: sum(get_token_list(m)))
+
+    @property
+    def _base_tokens(self) -> int:
+        return self._base.tokens
 
     @property
     def chat_convo(self) -> list[dict[str, str]]:
-        return self.base + self.messages[self.chat_idx :]
+        """The conversation sent with the next prompt, as API dicts"""
+        return to_wire(
+            itertools.chain(
+                self.base,
+                self._compactor.messages,
+                Window(self.messages, self.chat_idx),
+            )
+        )
 
     def stats(self) -> None:
         """Prints conversation stats to shell"""
@@ -205,8 +314,34 @@ class ChatGPT(Block):
             ("Alias:", f"{self.alias or None}", "{BOLD_GREEN}", "🤖"),
             ("Tokens:", self.tokens, "{BOLD_BLUE}", "🪙"),
             ("Trim After:", f"{self._max_tokens} Tokens", "{BOLD_BLUE}", "🔪"),
-            ("Messages:", len(self.messages), "{BOLD_BLUE}", "📨"),
+            (
+                "Messages:",
+                f"{len(self.messages)}{' + older, not loaded' if self._older else ''}",
+                "{BOLD_BLUE}",
+                "📨",
+            ),
         ]
+
+        if self._compactor.tokens:
+            stats.append(
+                (
+                    "Summary:",
+                    f"{self._compactor.tokens} Tokens",
+                    "{BOLD_BLUE}",
+                    "📝",
+                )
+            )
+
+        if get_env_bool("CHATGPT_CACHE"):
+            stats.append(
+                (
+                    "Cache:",
+                    f"{response_cache.hits} hits / {response_cache.misses} misses",
+                    "{BOLD_BLUE}",
+                    "📦",
+                )
+            )
+
         return stats
 
     def chat(self, text: str) -> str:
@@ -229,6 +364,176 @@ class ChatGPT(Block):
 
         """
 
+        model, user_msg = self._prepare(text)
+        self._compactor.wait()
+        convo, user_msg, user_toks = self._fit_prompt(model, user_msg)
+        response = self._cache_get(model, convo)
+
+        if response is None:
+            estimate = self._estimate(model, convo)
+            try:
+                response = rate_limiter.call(
+                    lambda: openai.ChatCompletion.create(
+                        model=model,
+                        messages=convo,
+                        **request_kwargs(),
+                    ),
+                    model,
+                    estimate,
+                )
+            except OpenAIError as e:
+                self._exit_on_error(e)
+
+            self._settle(model, estimate, response)
+            self._cache_set(model, convo, response)
+
+        return self._record_response(user_msg, response, user_toks)
+
+    def chat_stream(self, text: str) -> Iterator[str]:
+        """
+        Streaming version of chat, yields pieces of the response as they arrive
+
+        The full response is added to the conversation once the stream is
+            exhausted. Streamed responses carry no usage information, so the
+            tokens are counted locally instead.
+
+        Parameters
+        ----------
+        text : str
+            Text to send to ChatGPT
+
+        Returns
+        -------
+        Iterator[str]: Pieces of the response from ChatGPT
+        """
+        model, user_msg = self._prepare(text)
+        self._compactor.wait()
+        convo, user_msg, user_toks = self._fit_prompt(model, user_msg)
+        return self._stream(model, convo, user_msg, user_toks)
+
+    def _stream(
+        self,
+        model: str,
+        convo: list[dict[str, str]],
+        user_msg: dict[str, str],
+        user_toks: Optional[int],
+    ) -> Iterator[str]:
+        """Helper generator for chat_stream"""
+        cached = self._cache_get(model, convo)
+
+        if cached is not None:
+            content = self._record_response(user_msg, cached, user_toks)
+            if content:
+                yield content
+            return
+
+        parts = []
+        estimate = self._estimate(model, convo)
+
+        try:
+            for chunk in rate_limiter.call(
+                lambda: openai.ChatCompletion.create(
+                    model=model, messages=convo, stream=True, **request_kwargs()
+                ),
+                model,
+                estimate,
+            ):
+                delta = chunk["choices"][0]["delta"].get("content")
+                if delta:
+                    parts.append(delta)
+                    yield delta
+        except OpenAIError as e:
+            self._exit_on_error(e)
+
+        content = "".join(parts)
+        try:
+            usage = {
+                "prompt_tokens": sum(get_token_list(convo)),
+                "completion_tokens": count_tokens(content),
+            }
+            counted = True
+        except OSError:
+            # The response was already shown, so it is recorded even if the
+            # encoding can not be loaded, with its length as a rough count
+            usage = {
+                "prompt_tokens": sum(estimate_tokens(m["content"]) for m in convo),
+                "completion_tokens": estimate_tokens(content),
+            }
+            counted = False
+
+        response = {
+            "choices": [{"message": {"role": "assistant", "content": content}}],
+            "usage": usage,
+        }
+        self._settle(model, estimate, response)
+        if counted:
+            self._cache_set(model, convo, response)
+        self._record_response(user_msg, response, user_toks)
+
+    async def achat(self, text: str, retries: Optional[int] = None) -> str:
+        """
+        Async version of chat, for use from scripts or an event loop
+
+        The conversation is only updated once the response arrives, with no
+            await between the updates, so several chats can be in flight
+            at once without interleaving partial state.
+
+        Parameters
+        ----------
+        text : str
+            Text to send to ChatGPT
+        retries : int, optional
+            Number of retries for transient errors, by default None
+            Defaults to $CHATGPT_MAX_RETRIES or 3.
+
+        Returns
+        -------
+        str: Response from ChatGPT
+
+        Raises
+        ------
+        OpenAIError
+            Unlike chat, errors are raised instead of exiting
+        PromptTooLongError
+            If the message does not fit in the model's context window
+        """
+        model, user_msg = self._prepare(text)
+        # Waiting on a summary, loading the encoder and counting all block
+        await asyncio.to_thread(self._compactor.wait)
+        convo, user_msg, user_toks = await asyncio.to_thread(
+            self._fit_prompt, model, user_msg
+        )
+        response = self._cache_get(model, convo)
+
+        if response is None:
+            estimate = self._estimate(model, convo)
+            response = await rate_limiter.acall(
+                lambda: openai.ChatCompletion.acreate(
+                    model=model,
+                    messages=convo,
+                    **request_kwargs(),
+                ),
+                model,
+                estimate,
+                retries,
+            )
+            self._settle(model, estimate, response)
+            self._cache_set(model, convo, response)
+
+        return self._record_response(user_msg, response, user_toks)
+
+    def _send(self, text: str, stream: Optional[bool] = None) -> None:
+        """Sends text to ChatGPT and prints the response, streaming it if enabled"""
+        if stream is None:
+            stream = get_env_bool("CHATGPT_STREAM")
+
+        if stream:
+            print_stream(self.chat_stream(text))
+        else:
+            print_res(self.chat(text))
+
+    def _prepare(self, text: str) -> tuple[str, dict[str, str]]:
+        """Validates the model and api key, returns the model and new user message"""
         model = XSH.env.get("OPENAI_CHAT_MODEL", "gpt-3.5-turbo")
         choices = ["gpt-3.5-turbo", "gpt-4"]
         if model not in choices:
@@ -242,54 +547,237 @@ class ChatGPT(Block):
                 raise NoApiKeyError()
             openai.api_key = api_key
 
-        self.messages.append({"role": "user", "content": text})
-        self.chat_idx -= 1
+        return model, {"role": "user", "content": text}
+
+    def _fit_prompt(
+        self, model: str, user_msg: dict[str, str]
+    ) -> tuple[list[dict[str, str]], dict[str, str], Optional[int]]:
+        """Counts the outgoing prompt locally and drops the oldest history until
+        it fits in the model's context window, minus $CHATGPT_COMPLETION_RESERVE.
+
+        A user message too large to fit on its own raises PromptTooLongError,
+        or is cut down to fit if $CHATGPT_TRUNCATE_PROMPT is set.
 
+        Returns the conversation to send, the user message and its tokens.
+        The tokens are None if the encoding could not be loaded, in which case
+        the conversation is only trimmed after the response, as before.
+
+        Any summary of the last trim has to be in before the prompt is built,
+        callers wait for the compactor first.
+        """
         try:
-            response = openai.ChatCompletion.create(
-                model=model,
-                messages=self.chat_convo,
-            )
-        except OpenAIError as e:
-            self.messages.pop()
-            self.chat_idx += 1
-            sys.exit(
-                ansi_partial_color_format(
-                    "{}OpenAI Error{}: {}".format("{BOLD_RED}", "{RESET}", e)
-                )
-            )
+            user_toks = count_message(user_msg)
+        except OSError:
+            return self.chat_convo + [user_msg], user_msg, None
+
+        budget = CONTEXT_WINDOWS[model] - int(
+            XSH.env.get("CHATGPT_COMPLETION_RESERVE", 1000)
+        )
+        fixed = self._base_tokens + self._compactor.tokens + user_toks
+
+        if fixed > budget:
+            if not get_env_bool("CHATGPT_TRUNCATE_PROMPT"):
+                raise PromptTooLongError(fixed, budget, model)
 
-        res_text = response["choices"][0]["message"]
-        user_toks, gpt_toks = (
-            response["usage"]["prompt_tokens"],
+            over = fixed - budget
+            content = truncate_tokens(user_msg["content"], over)
+            if not content:
+                raise PromptTooLongError(fixed, budget, model)
+
+            user_msg = {**user_msg, "content": content}
+            user_toks = count_message(user_msg)
+
+        n = len(self._tokens)
+        start = self._tokens.cut(budget - fixed, self.chat_idx, n)
+        # The ledger may start with the priming tokens of a loaded conversation
+        keep = min(n - start, len(self.messages))
+        history = Window(self.messages, len(self.messages) - keep)
+
+        convo = to_wire(
+            itertools.chain(self.base, self._compactor.messages, history, [user_msg])
+        )
+        return convo, user_msg, user_toks
+
+    def _record_response(
+        self,
+        user_msg: dict[str, str],
+        response: dict,
+        user_toks: Optional[int] = None,
+    ) -> str:
+        """Records a ChatCompletion response and returns its content.
+        Falls back to the prompt usage if the user message was not counted."""
+        res_msg = response["choices"][0]["message"]
+        self._record(
+            user_msg,
+            res_msg,
+            response["usage"]["prompt_tokens"] if user_toks is None else user_toks,
             response["usage"]["completion_tokens"],
         )
 
-        self.messages.append(res_text)
-        self._tokens.extend([user_toks, gpt_toks])
+        return res_msg["content"]
 
-        self.chat_idx -= 1
+    def _record(
+        self,
+        user_msg: dict[str, str],
+        res_msg: dict[str, str],
+        user_toks: int,
+        gpt_toks: int,
+    ) -> None:
+        """Adds a completed exchange to the conversation and trims it"""
+        self.messages.extend([Message.of(user_msg), Message.of(res_msg)])
+        self._tokens.extend([user_toks, gpt_toks])
+        self.chat_idx -= 2
         self.trim_convo()
+        self._autosave()
+
+    def _autosave(self) -> None:
+        """Appends new messages to the journal, starting one in the default
+        directory if there is none and $CHATGPT_AUTOSAVE is set"""
+        if self._journal is not None:
+            # The catalog is only updated on save, load and close, not per turn
+            self._journal.append(self.messages[self._journaled :])
+            self._journaled = len(self.messages)
+        elif self._autosaves and get_env_bool("CHATGPT_AUTOSAVE"):
+            self._load_older()
+            path = get_default_path(alias=self.alias, mode="jsonl")
+            self._write_convo(path, "jsonl", self.base + self.messages)
+            self._attach_journal(path)
+            self._catalog(path)
+
+    def _attach_journal(self, path: str) -> None:
+        """Appends every following turn to the journal at path, which already
+        holds the conversation"""
+        self._journal = Journal(str(path))
+        self._journaled = len(self.messages)
+        journaled.add(self)
+
+    def close(self) -> None:
+        """Records the turns appended to the journal since it was last saved
+        in the catalog and stops journaling. Called for every chat with a
+        journal when the shell exits."""
+        if self._journal is None:
+            return
 
-        return res_text["content"]
+        journaled.discard(self)
+        path, self._journal = self._journal.path, None
+        self._catalog(path)
+
+    @staticmethod
+    def _estimate(model: str, convo: list[dict[str, str]]) -> int:
+        """Local token estimate of a prompt, only counted when a TPM limit is set"""
+        if not rate_limiter.limits_tokens(model):
+            return 0
+        return sum(get_token_list(convo))
+
+    @staticmethod
+    def _settle(model: str, estimate: int, response: dict) -> None:
+        """Corrects the rate limiter with the actual usage of a response"""
+        usage = response["usage"]
+        rate_limiter.settle(
+            model, estimate, usage["prompt_tokens"] + usage["completion_tokens"]
+        )
+
+    @staticmethod
+    def _cache_get(model: str, convo: list[dict[str, str]]) -> Optional[dict]:
+        """Returns a cached response for the conversation if caching is enabled"""
+        if not get_env_bool("CHATGPT_CACHE"):
+            return None
+
+        entry = response_cache.get(response_cache.key(model, convo))
+        if entry is None:
+            return None
+
+        return {"choices": [{"message": entry["message"]}], "usage": entry["usage"]}
+
+    @staticmethod
+    def _cache_set(model: str, convo: list[dict[str, str]], response: dict) -> None:
+        """Stores a response in the cache if caching is enabled"""
+        if not get_env_bool("CHATGPT_CACHE"):
+            return
+
+        response_cache.set(
+            response_cache.key(model, convo),
+            response["choices"][0]["message"],
+            response["usage"],
+        )
+
+    @staticmethod
+    def _exit_on_error(e: OpenAIError) -> None:
+        """Exits with a formatted OpenAI error message"""
+        sys.exit(
+            ansi_partial_color_format(
+                "{}OpenAI Error{}: {}".format("{BOLD_RED}", "{RESET}", e)
+            )
+        )
 
     def trim_convo(self) -> None:
-        while self.chat_idx < -1 and self.tokens > self._max_tokens:
-            self.chat_idx += 1
+        """Moves the start of the conversation forward until it fits in
+        _max_tokens, always keeping at least the last message.
+
+        With $CHATGPT_COMPACT set, the messages moved out of the conversation
+        are summarized in the background instead of being dropped.
+        """
+        if self.chat_idx >= -1 or self.tokens <= self._max_tokens:
+            return
+
+        n = len(self._tokens)
+        cut = self._tokens.cut(
+            self._max_tokens - self._base_tokens - self._compactor.tokens,
+            self.chat_idx,
+            n - 1,
+        )
+        start, self.chat_idx = self.chat_idx, cut - n
+
+        if get_env_bool("CHATGPT_COMPACT"):
+            self._compact(start, self.chat_idx)
+
+    def _compact(self, start: int, stop: int) -> None:
+        """Summarizes messages[start:stop], at most _max_tokens of the latest"""
+        n = len(self._tokens)
+        budget = self._max_tokens + self._tokens.total(stop)
+        first = self._tokens.cut(budget, start, n + stop) - n
+        if first < stop:
+            self._compactor.submit(self.messages[first:stop])
+
+    def _summarize(self, convo: list[dict[str, str]]) -> str:
+        """Sends a summary request for the compactor, returns the summary"""
+        model = XSH.env.get("OPENAI_CHAT_MODEL", "gpt-3.5-turbo")
+        estimate = self._estimate(model, convo)
+        response = rate_limiter.call(
+            lambda: openai.ChatCompletion.create(
+                model=model,
+                messages=convo,
+                max_tokens=int(XSH.env.get("CHATGPT_SUMMARY_TOKENS", 400)),
+                **request_kwargs(),
+            ),
+            model,
+            estimate,
+        )
+        self._settle(model, estimate, response)
+        return response["choices"][0]["message"]["content"]
 
     def _get_json_convo(self, n: int) -> list[dict[str, str]]:
         """Returns the current conversation as a JSON string, up to n last items"""
-        n = -n if n != 0 else 0
-        messages = self.base + self.messages if n == 0 else self.messages[n:]
-
-        return json.dumps(messages, indent=4)
+        return json.dumps(to_wire(self._last_messages(n)), indent=4)
 
     def _get_printed_convo(self, n: int, color: bool = True) -> list[tuple[str, str]]:
         """Helper method to get up to n items of conversation, formatted for printing"""
+        return self._format_convo(self._last_messages(n), color)
+
+    def _last_messages(self, n: int) -> Iterable[Message]:
+        """The last n messages without copying them, or every message
+        including the base ones if n is 0"""
+        if n == 0:
+            return itertools.chain(self.base, self.messages)
+        return Window(self.messages, -n)
+
+    @staticmethod
+    def _format_convo(
+        messages: Iterable[dict[str, str]], color: bool = True
+    ) -> list[tuple[str, str]]:
+        """Formats messages as (role, content) pairs for printing"""
         user = XSH.env.get("USER", "user")
         convo = []
-        n = -n if n != 0 else 0
-        messages = self.base + self.messages if n == 0 else self.messages[n:]
 
         for msg in messages:
             if msg["role"] == "user":
@@ -347,6 +835,9 @@ class ChatGPT(Block):
         if not self.messages:
             raise NoConversationsError()
 
+        if n == 0 or n > len(self.messages):
+            self._load_older()
+
         if mode in ["color", "no-color"]:
             convo = self._get_printed_convo(n, mode == "color")
             for role, content in convo:
@@ -362,7 +853,12 @@ class ChatGPT(Block):
         print(rtn_str)
 
     def save_convo(
-        self, path: str = "", name: str = "", mode: str = "text", override: bool = False
+        self,
+        path: str = "",
+        name: str = "",
+        mode: str = "text",
+        override: bool = False,
+        background: bool = False,
     ) -> None:
         """
         Saves conversation to path or default xonsh data directory
@@ -378,9 +874,13 @@ class ChatGPT(Block):
             Ignored when path is specified.
         mode : str, optional
             Type of the conversation file. Defaults to 'text'.
-            Options - 'text', 'json'
+            Options - 'text', 'json', 'jsonl', and the compressed
+            'text.gz', 'json.gz', 'text.xz', 'json.xz'
         override : bool, optional
             Whether or not to override existing files. Defaults to False.
+        background : bool, optional
+            Whether to return right away and write the file on a background
+            thread, printing when it is done. Defaults to False.
 
         Returns
         -------
@@ -389,40 +889,176 @@ class ChatGPT(Block):
         Notes
         -----
         Default File Path Structure:
-            $XONSH_DATA_DIR/chatgpt/$USER_[name|alias|'chatgpt']_[date]_[index].[text|json]
+            $XONSH_DATA_DIR/chatgpt/$USER_[name|alias|'chatgpt']_[date]_[index].[txt|json|jsonl][.gz|.xz]
+
+        A 'jsonl' save becomes the chat's journal. Every following turn is
+            appended to it, and saving to it again only writes new messages.
+            It is always written right away, before anything is appended.
+
+        Files are written to a temporary file which then replaces the target,
+            so a crash never leaves a partly written save behind.
         """
         if not self.messages:
             raise NoConversationsError()
 
+        if self._in_journal(path, mode):
+            self._autosave()
+            self._catalog(self._journal.path)
+            print("Conversation saved to: " + self._journal.path)
+            return
+
+        path = self._get_save_path(path, name, mode, override)
+        if not path:
+            return
+
+        self._load_older()
+        if background and mode != "jsonl":
+            self._save_in_background(path, mode)
+            return
+
+        self._write_convo(path, mode, self.base + self.messages)
+        if mode == "jsonl":
+            self._attach_journal(path)
+        self._catalog(path)
+
+        print("Conversation saved to: " + str(path))
+        return
+
+    async def asave_convo(
+        self, path: str = "", name: str = "", mode: str = "text", override: bool = False
+    ) -> None:
+        """
+        Async version of save_convo
+
+        The conversation is snapshotted on the calling thread, then serialized
+            and written in a worker thread so the event loop is not blocked.
+        There is no prompt to override an existing file, it raises
+            FileExistsError unless override is set.
+
+        See Also
+        --------
+        ChatGPT.save_convo
+        """
+        if not self.messages:
+            raise NoConversationsError()
+
+        if self._in_journal(path, mode):
+            await asyncio.to_thread(self._autosave)
+            await asyncio.to_thread(self._catalog, self._journal.path)
+            print("Conversation saved to: " + self._journal.path)
+            return
+
+        path = self._get_save_path(path, name, mode, override, interactive=False)
+
+        await asyncio.to_thread(self._load_older)
+        await asyncio.to_thread(
+            self._write_convo, path, mode, self.base + self.messages
+        )
+        if mode == "jsonl":
+            self._attach_journal(path)
+        await asyncio.to_thread(self._catalog, path)
+
+        print("Conversation saved to: " + str(path))
+        return
+
+    def _save_in_background(self, path: str, mode: str) -> None:
+        """Snapshots the conversation and leaves serializing and writing it
+        to the writer thread, which prints when it is done"""
+        messages = self.base + self.messages
+        entry = self._catalog_entry()
+        persist = get_env_bool("CHATGPT_TOKEN_CACHE_PERSIST")
+        write_file = self._write_file
+
+        def done(error: Optional[str]) -> None:
+            if error is not None:
+                print(f"\nFailed to save conversation to {path}: {error}")
+                return
+            if persist:
+                token_cache.save(get_sidecar_path(path), messages)
+            get_catalog().record(path, *entry)
+            print("\nConversation saved to: " + str(path))
+
+        writer.submit(str(path), lambda tmp: write_file(tmp, mode, messages), done)
+        print("Saving conversation to: " + str(path))
+
+    def _catalog(self, path: str) -> None:
+        """Records the chat saved to path in the catalog of saved chats"""
+        get_catalog().record(path, *self._catalog_entry())
+
+    def _catalog_entry(self) -> tuple:
+        """The alias, message count and tokens of the chat for the catalog"""
+        if self._older is not None:
+            # Counts are unknown until the older messages are loaded
+            return (self.alias,)
+
+        return (
+            self.alias,
+            len(self.messages),
+            self._base_tokens + self._tokens.total(),
+        )
+
+    def _in_journal(self, path: str, mode: str) -> bool:
+        """Whether a save goes to the chat's journal, which is already up to
+        date apart from any new messages"""
+        return (
+            mode == "jsonl"
+            and self._journal is not None
+            and (not path or str(path) == self._journal.path)
+        )
+
+    def _get_save_path(
+        self, path: str, name: str, mode: str, override: bool, interactive: bool = True
+    ) -> Optional[str]:
+        """Resolves the path to save to, returns None if the user declines to override.
+        Without interactive, an existing file raises FileExistsError instead of asking.
+        """
+        if mode not in SAVE_MODES:
+            raise InvalidConversationsTypeError(
+                f'Invalid mode: "{mode}" -- options are {", ".join(SAVE_MODES)}'
+            )
+
         if not path:
             path = get_default_path(
-                name=name, json_mode=mode == "json", override=override, alias=self.alias
+                name=name, override=override, alias=self.alias, mode=mode
             )
         elif os.path.exists(path) and not override:
+            if not interactive:
+                raise FileExistsError(
+                    f"File already exists: {path}, set override to replace it"
+                )
+
             res = input(f"File already exists: {path}\nOverride? [Y/n]: ")
 
             if res.lower() == "n":
-                return
+                return None
 
-        if mode == "text":
-            convo = self._get_printed_convo(0, color=False)
-        elif mode == "json":
-            convo = self._get_json_convo(0)
-        else:
-            raise InvalidConversationsTypeError(
-                f'Invalid mode: "{mode}" -- options are "text", and "json"'
-            )
+        return path
 
-        with open(path, "w") as f:
-            if mode == "json":
-                f.write(convo)
-            else:
-                for role, content in convo:
-                    f.write(role + "\n")
-                    f.write(content + "\n")
+    @classmethod
+    def _write_convo(cls, path: str, mode: str, messages: list[dict[str, str]]) -> None:
+        """Serializes messages and replaces path with them, along with their
+        token counts if $CHATGPT_TOKEN_CACHE_PERSIST is set"""
+        atomic_write(str(path), lambda tmp: cls._write_file(tmp, mode, messages))
 
-        print("Conversation saved to: " + str(path))
-        return
+        if get_env_bool("CHATGPT_TOKEN_CACHE_PERSIST"):
+            token_cache.save(get_sidecar_path(path), messages)
+
+    @classmethod
+    def _write_file(cls, path: str, mode: str, messages: list[dict[str, str]]) -> None:
+        """Serializes messages to path in the format of mode"""
+        if mode == "jsonl":
+            Journal(path).write(messages)
+        else:
+            with open_convo(path, "w") as f:
+                if mode == "json":
+                    f.write(json.dumps(to_wire(messages), indent=4))
+                elif mode.startswith("json."):
+                    # Compressed as it is encoded, indenting would only add bytes
+                    json.dump(to_wire(messages), f)
+                else:
+                    for role, content in cls._format_convo(messages, color=False):
+                        f.write(role + "\n")
+                        f.write(content + "\n")
 
     @staticmethod
     def fromcli(args: list[str], stdin: TextIO = None) -> None:
@@ -444,16 +1080,90 @@ class ChatGPT(Block):
             >>> echo [text] | chatgpt # text from stdin will be sent to ChatGPT
             >>> cat [text file] | chatgpt # text from file will be sent to ChatGPT
         """
-        inst = ChatGPT()
+        inst = ChatGPT(autosave=False)
         inst(args, stdin)
         return None
 
+    @staticmethod
+    def batch(
+        paths: list[str],
+        stdin: TextIO = None,
+        output: str = "",
+        jobs: Optional[int] = None,
+        retries: Optional[int] = None,
+    ) -> None:
+        """Sends each line of the input as a separate one off conversation.
+        Results are written as JSONL in input order.
+
+        Parameters
+        ----------
+        paths : list[str]
+            Files to read prompts from. If empty, prompts are read from stdin.
+        stdin : TextIO, optional
+            Text from stdin, by default None
+        output : str, optional
+            File to write the results to, by default '' (stdout)
+        jobs : int, optional
+            Maximum number of requests in flight.
+            Defaults to $CHATGPT_BATCH_JOBS or 4.
+        retries : int, optional
+            Number of retries for failed requests.
+            Defaults to $CHATGPT_MAX_RETRIES or 3.
+
+        Usage
+        -----
+            >>> chatgpt --batch prompts.txt -o results.jsonl
+            >>> cat prompts.jsonl | chatgpt --batch -j 8
+        """
+        if paths:
+            records = []
+            for path in paths:
+                with open(path, "r") as f:
+                    records.extend(read_prompts(f))
+        elif stdin:
+            records = read_prompts(stdin)
+        else:
+            return
+
+        runner = BatchRunner(
+            send=lambda text: ChatGPT(autosave=False).achat(text, retries=retries),
+            jobs=(
+                jobs if jobs is not None else int(XSH.env.get("CHATGPT_BATCH_JOBS", 4))
+            ),
+        )
+
+        async def run(out: TextIO) -> int:
+            async with aiosession():
+                return await runner.arun(records, out)
+
+        if output:
+            with open(output, "w") as f:
+                failed = asyncio.run(run(f))
+            print(f"Batch results saved to: {output}")
+        else:
+            failed = asyncio.run(run(sys.stdout))
+
+        if failed:
+            sys.exit(
+                ansi_partial_color_format(
+                    "{}{}/{} prompts failed{}".format(
+                        "{BOLD_RED}", failed, len(records), "{RESET}"
+                    )
+                )
+            )
+
     @staticmethod
     def getdoc() -> str:
         return DOCSTRING
 
     @classmethod
-    def fromconvo(cls, path, alias: str = "", managed: bool = False) -> "ChatGPT":
+    def fromconvo(
+        cls,
+        path,
+        alias: str = "",
+        managed: bool = False,
+        lazy: Optional[bool] = None,
+    ) -> "ChatGPT":
         """Loads a conversation from a saved file and returns new instance
 
         Parameters
@@ -465,36 +1175,209 @@ class ChatGPT(Block):
         managed : bool, optional
             Whether or not to register the instance with the chat manager.
             Defaults to False.
+        lazy : bool, optional
+            Whether to only load the latest messages that fit in the token
+            limit, see _load_tail. Defaults to $CHATGPT_LAZY_LOAD or False.
 
         Returns
         -------
         ChatGPT
             New instance with the loaded conversation
         """
-        if not os.path.exists(path):
-            bname = os.path.basename(path)
-            default_dir = XSH.env.get(
-                "XONSH_DATA_DIR",
-                os.path.join(os.path.expanduser("~"), ".local", "share", "xonsh"),
+        path = cls._find_convo(path)
+        token_cache.load(get_sidecar_path(path))
+
+        if lazy is None:
+            lazy = get_env_bool("CHATGPT_LAZY_LOAD")
+
+        if lazy:
+            inst = cls(alias=alias, managed=managed)
+            inst._load_tail(path)
+        else:
+            with open_convo(path) as f:
+                messages, base = read_convo(f)
+
+            inst = cls._from_messages(
+                messages, base, get_token_list(base + messages), alias, managed
             )
-            guess_name = os.path.join(default_dir, "chatgpt", bname)
+        inst._resume_journal(path)
 
-            if not os.path.exists(guess_name):
-                raise FileNotFoundError(f"File not found: {path}")
-            else:
-                path = guess_name
+        return inst
+
+    @classmethod
+    async def afromconvo(
+        cls,
+        path,
+        alias: str = "",
+        managed: bool = False,
+        lazy: Optional[bool] = None,
+    ) -> "ChatGPT":
+        """Async version of fromconvo, reading and tokenizing the file in a worker thread
+
+        See Also
+        --------
+        ChatGPT.fromconvo
+        """
+        path = cls._find_convo(path)
+
+        if lazy is None:
+            lazy = get_env_bool("CHATGPT_LAZY_LOAD")
+
+        if lazy:
+            inst = cls(alias=alias, managed=managed)
+            await asyncio.to_thread(token_cache.load, get_sidecar_path(path))
+            await asyncio.to_thread(inst._load_tail, path)
+            await asyncio.to_thread(inst._resume_journal, path)
+            return inst
+
+        def _read():
+            token_cache.load(get_sidecar_path(path))
+            with open_convo(path) as f:
+                return read_convo(f)
+
+        messages, base = await asyncio.to_thread(_read)
+        tokens = await aget_token_list(base + messages)
+        inst = cls._from_messages(messages, base, tokens, alias, managed)
+        await asyncio.to_thread(inst._resume_journal, path)
+
+        return inst
 
-        with open(path, "r") as f:
-            convo = f.read()
+    def _resume_journal(self, path: str) -> None:
+        """Carries on appending to a loaded journal if $CHATGPT_AUTOSAVE is set"""
+        if not get_env_bool("CHATGPT_AUTOSAVE"):
+            return
+
+        complete = journal_status(path)
+        if complete is None:
+            return
+
+        if not complete:
+            # Drop the partly written record of a crash before appending
+            self._load_older()
+            self._write_convo(path, "jsonl", self.base + self.messages)
+        self._attach_journal(path)
 
-        messages, base = parse_convo(convo)
+    @classmethod
+    def _from_messages(
+        cls,
+        messages: list[dict[str, str]],
+        base: list[dict[str, str]],
+        tokens: list[int],
+        alias: str = "",
+        managed: bool = False,
+    ) -> "ChatGPT":
+        """Creates a new instance from parsed messages and the token list of
+        base + messages, so both are tokenized in a single batch"""
         new_cls = cls(alias=alias, managed=managed)
-        new_cls.messages = messages
-        if base:
-            new_cls.base = base
-            new_cls._base_tokens = sum(get_token_list(base))
-        new_cls._tokens = get_token_list(messages)
-        new_cls.chat_idx = -len(messages)
-        new_cls.trim_convo()
+        new_cls._set_messages(messages, base, tokens)
 
         return new_cls
+
+    def _set_messages(
+        self,
+        messages: list[dict[str, str]],
+        base: list[dict[str, str]],
+        tokens: list[int],
+    ) -> None:
+        """Replaces the conversation with messages, see _from_messages"""
+        self.messages = to_messages(messages)
+        n_base = len(base)
+        if base:
+            # Set directly, the base setter would tokenize base again
+            self._base = system_prompt(base, lambda _: sum(tokens[: n_base + 1]))
+        self._tokens = TokenLedger(tokens[:1] + tokens[n_base + 1 :])
+        self.chat_idx = -len(messages)
+        self.trim_convo()
+
+    def _load_tail(self, path: str) -> None:
+        """Loads only the latest messages of a saved conversation, enough to
+        fill the token limit and at least LAZY_MIN_MESSAGES. The older ones
+        are loaded by _load_older once something needs the whole chat.
+
+        Journals are read backwards from the end of the file, so the older
+        messages are never read. Other formats are parsed in full, but only
+        the latest messages are tokenized.
+        """
+        budget = self._max_tokens * (2 if get_env_bool("CHATGPT_COMPACT") else 1)
+        tail, total = [], 0
+
+        if journal_status(path) is not None:
+            with open(path, "rb") as f:
+                base, start = read_journal_head(f)
+                budget -= sum(get_token_list(base))
+                offset = start
+                for offset, msg in iter_journal_reversed(f, start):
+                    tail.append(msg)
+                    total += count_message(msg)
+                    if total > budget and len(tail) >= LAZY_MIN_MESSAGES:
+                        break
+                else:
+                    offset = start
+
+            if offset > start:
+                self._older = lambda: read_journal_range(path, start, offset)
+        else:
+            with open_convo(path) as f:
+                messages, base = read_convo(f)
+
+            budget -= sum(get_token_list(base))
+            for msg in reversed(messages):
+                tail.append(msg)
+                total += count_message(msg)
+                if total > budget and len(tail) >= LAZY_MIN_MESSAGES:
+                    break
+
+            older = messages[: len(messages) - len(tail)]
+            if older:
+                self._older = lambda: older
+
+        tail.reverse()
+        self._set_messages(tail, base, get_token_list(base + tail))
+
+    def _load_older(self) -> None:
+        """Loads the messages left out by a lazy load in front of the others"""
+        if self._older is None:
+            return
+
+        older, self._older = self._older(), None
+        counts = get_token_list(older)[1:]
+        self.messages[:0] = to_messages(older)
+        self._tokens = TokenLedger([*self._tokens[:1], *counts, *self._tokens[1:]])
+        if self._journal is not None:
+            self._journaled += len(older)
+
+    @staticmethod
+    def _find_convo(path: str) -> str:
+        """Returns the path to a saved conversation, checking the default directory"""
+        if os.path.exists(path):
+            return path
+
+        bname = os.path.basename(path)
+        guess_name = os.path.join(get_data_dir(), "chatgpt", bname)
+
+        if not os.path.exists(guess_name):
+            raise FileNotFoundError(f"File not found: {path}")
+
+        return guess_name
+
+
+# Chats appending to a journal, closed when the shell exits
+journaled: "weakref.WeakSet[ChatGPT]" = weakref.WeakSet()
+
+
+def _on_exit(**_) -> None:
+    """Brings the catalog entry of every journaled chat up to date"""
+    for inst in list(journaled):
+        try:
+            inst.close()
+        except Exception:
+            pass
+
+
+def add_journals(xsh: XonshSession) -> None:
+    xsh.builtins.events.on_exit(_on_exit)
+
+
+def rm_journals(xsh: XonshSession) -> None:
+    xsh.builtins.events.on_exit.discard(_on_exit)
+    _on_exit()
@@ -2,7 +2,9 @@
 
 import os
 import sys
+import asyncio
 import weakref
+from fnmatch import fnmatchcase
 from collections import defaultdict
 from typing import Optional, Union, TextIO
 from argparse import ArgumentParser
@@ -11,14 +13,19 @@ from re import Pattern
 from xonsh.built_ins import XSH
 from xonsh.ansi_colors import ansi_partial_color_format
 from xonsh.lazyasd import LazyObject
+from openai.error import OpenAIError
 
 from xontrib_chatgpt.chatgpt import ChatGPT
-from xontrib_chatgpt.utils import convert_to_sys
+from xontrib_chatgpt.utils import convert_to_sys, print_res
 from xontrib_chatgpt.lazyobjs import _FIND_NAME_REGEX
+from xontrib_chatgpt.catalog import get_catalog, get_chat_dir
 from xontrib_chatgpt.args import _cm_parse
+from xontrib_chatgpt.transport import aiosession, get_transport
+from xontrib_chatgpt.warmup import warmup
 from xontrib_chatgpt.exceptions import (
     NoConversationsError,
     InvalidConversationsTypeError,
+    SearchUnavailableError,
 )
 
 FIND_NAME_REGEX: Pattern = LazyObject(_FIND_NAME_REGEX, globals(), "FIND_NAME_REGEX")
@@ -77,6 +84,11 @@ TUTORIAL = """
             {YELLOW}>>> {INTENSE_BLUE}my_literature_convo {INTENSE_GREEN}-s{RESET}
             {GREEN}# or{RESET}
             {YELLOW}>>> {INTENSE_BLUE}chat-manager {INTENSE_GREEN}save{RESET} my_literature_convo
+
+        Send the same message to several chats at once:
+            {YELLOW}>>> {INTENSE_BLUE}chat-manager {INTENSE_GREEN}broadcast{RESET} Hello, how are you?
+            {GREEN}# or only to chats matching a name or pattern{RESET}
+            {YELLOW}>>> {INTENSE_BLUE}chat-manager {INTENSE_GREEN}broadcast -g{RESET} 'gpt*' Hello, how are you?
         
         You can delete a conversation using {INTENSE_GREEN}Python{RESET} syntax:
             {YELLOW}>>> {INTENSE_PURPLE}del {INTENSE_BLUE}gpt{RESET}
@@ -119,18 +131,32 @@ class ChatManager:
             else:
                 return self._instances[self._current]["inst"].stats()
 
+        if pargs.T:
+            return self.transport_stats()
+
         if pargs.cmd in ["add", "a", "create"]:
             return self.add(pargs.name[0])
         elif pargs.cmd in ["list", "ls"]:
             return self.ls(saved=pargs.saved)
         elif pargs.cmd == "load":
             return self.load(pargs.name[0])
+        elif pargs.cmd == "search":
+            return self.search(" ".join(pargs.query), limit=pargs.n)
         elif pargs.cmd == "save":
             return self.save(
                 chat_name=pargs.name, mode=pargs.mode, override=pargs.override
             )
         elif pargs.cmd in ["print", "p"]:
             return self.print_chat(chat_name=pargs.name, n=pargs.n, mode=pargs.mode)
+        elif pargs.cmd in ["broadcast", "b"]:
+            return self.broadcast(
+                " ".join(pargs.text),
+                chat_names=pargs.chats,
+                pattern=pargs.pattern,
+                workers=pargs.workers,
+            )
+        elif pargs.cmd == "warmup":
+            return self.warmup_report()
         elif pargs.cmd == "help":
             return self.help(tgt=pargs.target)
         elif pargs.cmd in ["edit", "e"]:
@@ -177,7 +203,7 @@ class ChatManager:
             return (
                 ansi_partial_color_format("{BOLD_WHITE}Saved chats:")
                 + "\n  "
-                + "\n  ".join(self._find_saved())
+                + "\n  ".join(self._describe_saved(e) for e in get_catalog().entries())
             )
 
         if not self._instances:
@@ -185,6 +211,38 @@ class ChatManager:
 
         return "\n\n".join([inst["inst"].stats() for inst in self._instances.values()])
 
+    def search(self, query: str, limit: int = 10) -> str:
+        """Search the contents of the saved chats
+
+        Parameters
+        ----------
+        query : str
+            Words to search for, every one must appear in a matching chat
+        limit : int, optional
+            Maximum number of results, by default 10
+
+        Returns
+        -------
+        str
+            The matching chats, best match first. Load one with its file name.
+        """
+        try:
+            results = get_catalog().search(query, limit, mark=("\x1b[1;33m", "\x1b[0m"))
+        except SearchUnavailableError as e:
+            return str(e)
+
+        if not results:
+            return f"No saved chats match '{query}'."
+
+        return "\n".join(
+            ansi_partial_color_format(
+                "{BOLD_WHITE}" + r["name"] + "{RESET} " + r["file"]
+            )
+            + "\n    "
+            + " ".join(r["snippet"].split())
+            for r in results
+        )
+
     def load(self, path_or_name: str) -> str:
         """Load a conversation from a path or a saved chat name
 
@@ -219,20 +277,23 @@ class ChatManager:
         inst = ChatGPT.fromconvo(path, alias=name, managed=True)
         XSH.ctx[name] = inst
         self._instances[hash(inst)]["name"] = name
+        # Fills in the counts of files saved outside the xontrib
+        inst._catalog(path)
 
         return f"Loaded chat {name} from {path}"
 
     def save(
         self, chat_name: str = "", mode: str = "text", override: bool = False
     ) -> Optional[str]:
-        """Save a conversation to a file
+        """Save a conversation to a file, written in the background
 
         Parameters
         ----------
         chat_name : str, optional
             Name of the chat to save. Defaults to last used/current chat, by default ''
         mode : str, optional
-            Mode to save the conversation. Defaults to 'text', other option is 'json'
+            Mode to save the conversation. Defaults to 'text', other options are 'json', 'jsonl'
+            and the compressed 'text.gz', 'json.gz', 'text.xz' and 'json.xz'
 
         Returns
         -------
@@ -242,7 +303,7 @@ class ChatManager:
         chat = self.get_chat_by_name(chat_name)
 
         try:
-            res = chat["inst"].save_convo(mode=mode, override=override)
+            res = chat["inst"].save_convo(mode=mode, override=override, background=True)
         except (NoConversationsError, InvalidConversationsTypeError) as e:
             print(e)
             sys.exit(1)
@@ -278,6 +339,123 @@ class ChatManager:
 
         return res
 
+    def broadcast(
+        self,
+        text: str,
+        chat_names: Optional[list[str]] = None,
+        pattern: str = "",
+        workers: Optional[int] = None,
+    ) -> Optional[str]:
+        """Send the same message to several chats at once
+
+        Requests run concurrently, with at most `workers` in flight. Each chat's
+        history is updated and its response printed as soon as it finishes.
+
+        Parameters
+        ----------
+        text : str
+            Text to send to each chat
+        chat_names : list[str], optional
+            Names of the chats to send to, by default None
+        pattern : str, optional
+            Glob pattern of chat names to send to, by default ''
+            If neither chat_names or pattern are given, all chats are used.
+        workers : int, optional
+            Maximum number of requests in flight, by default None
+            Defaults to $CHATGPT_BROADCAST_WORKERS or 4.
+
+        Returns
+        -------
+        Optional[str]
+        """
+        chats = self._select_chats(chat_names, pattern)
+
+        if not chats:
+            return "No matching chats!"
+
+        if workers is None:
+            workers = int(XSH.env.get("CHATGPT_BROADCAST_WORKERS", 4))
+
+        asyncio.run(self._broadcast(text, chats, max(workers, 1)))
+
+    async def _broadcast(self, text: str, chats: list[dict], workers: int) -> None:
+        """Helper coroutine for broadcast, prints responses grouped by chat"""
+        async with aiosession():
+            await self._broadcast_all(text, chats, workers)
+
+    async def _broadcast_all(self, text: str, chats: list[dict], workers: int) -> None:
+        """Sends text to every chat, at most workers at a time"""
+        sem = asyncio.Semaphore(workers)
+
+        async def send(chat: dict) -> tuple[dict, Optional[str], Optional[Exception]]:
+            async with sem:
+                try:
+                    return chat, await chat["inst"].achat(text), None
+                except Exception as e:
+                    # Reported with this chat, the others carry on
+                    return chat, None, e
+
+        for fut in asyncio.as_completed([send(c) for c in chats]):
+            chat, res, err = await fut
+            print(
+                ansi_partial_color_format(
+                    "\n{BOLD_WHITE}" + f"[{chat['name']}]" + "{RESET}"
+                )
+            )
+            if err is not None:
+                label = (
+                    "OpenAI Error"
+                    if isinstance(err, OpenAIError)
+                    else f"Error ({type(err).__name__})"
+                )
+                print(
+                    ansi_partial_color_format(
+                        "{}{}{}: {}".format("{BOLD_RED}", label, "{RESET}", err)
+                    )
+                )
+            else:
+                print_res(res)
+
+    def _select_chats(
+        self, chat_names: Optional[list[str]] = None, pattern: str = ""
+    ) -> list[dict]:
+        """Returns active chats matching the given names or glob pattern"""
+        if not chat_names and not pattern:
+            return list(self._instances.values())
+
+        chat_names = chat_names or []
+        return [
+            chat
+            for chat in self._instances.values()
+            if chat["name"] in chat_names
+            or (pattern and fnmatchcase(chat["name"], pattern))
+        ]
+
+    @staticmethod
+    def warmup_report() -> str:
+        """Starts the background warm-up if it has not run, returns its report"""
+        warmup.start()
+        return warmup.report()
+
+    def transport_stats(self) -> str:
+        """Returns connection reuse statistics for the shared transport"""
+        transport = get_transport()
+        if transport is None:
+            return "Transport is not open."
+
+        stats = transport.stats()
+        timeout = transport.request_timeout
+        return "\n".join(
+            [
+                ansi_partial_color_format("{BOLD_WHITE}Transport:{RESET}"),
+                f"  Pool Size: {transport.pool_size}",
+                f"  Timeouts: {timeout[0]}s connect / {timeout[1]}s read",
+                f"  Requests: {stats['requests']}",
+                f"  Connections Opened: {stats['connections']}",
+                f"  Connections Reused: {stats['reused']}",
+            ]
+        )
+
     def help(self, tgt: str = "") -> Optional[str]:
         """Print help information on the instance, methods, or xontrib
 
@@ -356,29 +534,27 @@ class ChatManager:
 
     def _find_saved(self) -> list[Optional[str]]:
         """Returns a list of saved chat files in the default directory"""
-        def_dir = os.path.join(XSH.env["XONSH_DATA_DIR"], "chatgpt")
-        if not os.path.exists(def_dir):
-            return []
-        return [
-            f for f in os.listdir(def_dir) if os.path.isfile(os.path.join(def_dir, f))
-        ]
+        return get_catalog().files()
+
+    @staticmethod
+    def _describe_saved(entry: dict) -> str:
+        """Formats a catalog entry for ls, with its counts if they are known"""
+        if entry["messages"] is None:
+            return entry["file"]
+        return (
+            f"{entry['file']} ({entry['messages']} messages, {entry['tokens']} tokens)"
+        )
 
     def _find_path_from_name(self, name: str) -> tuple[str, str]:
         """Finds a saved chat file from user input if it's not a path"""
-        def_dir = XSH.env["XONSH_DATA_DIR"]
-        saved = self._find_saved()
+        # Creates a tuple of (chat_name, file_name)
+        found = get_catalog().find(name)
 
-        if name in saved:
-            return os.path.join(def_dir, "chatgpt", name), FIND_NAME_REGEX.sub(
-                r"\1", name
-            )
+        for n, f in found:
+            if f == name:
+                return os.path.join(get_chat_dir(), f), n
 
-        # Creates a tuple of (chat_name, file_name)
-        names_saved = [
-            (n, f)
-            for n, f in [(FIND_NAME_REGEX.sub(r"\1", f), f) for f in saved]
-            if n == name
-        ]
+        names_saved = [(n, f) for n, f in found if n == name]
 
         if not names_saved:
             raise FileNotFoundError(f"No chat with name {name} found.")
@@ -387,7 +563,7 @@ class ChatManager:
         else:
             chat_name, file = names_saved[0]
 
-        return os.path.join(def_dir, "chatgpt", file), chat_name
+        return os.path.join(get_chat_dir(), file), chat_name
 
     def _choose_from_multiple(self, chats: list[tuple[str, str]]) -> tuple[str, str]:
         """If multiple saved chats are found, allows the user to choose from them"""
@@ -0,0 +1,107 @@
+"""Summarizing compaction of the history trimmed from a chat"""
+
+import threading
+from typing import Callable, Optional
+
+from xontrib_chatgpt.utils import count_message
+
+SUMMARY_PROMPT = (
+    "Summarize the conversation below for your own future reference. "
+    "Keep every fact, name, decision, preference and piece of code that may "
+    "matter later, fold in the previous summary if there is one, and be brief."
+)
+SUMMARY_PREFIX = "Summary of the earlier conversation:\n"
+
+
+def summary_request(
+    previous: Optional[str], messages: list[dict[str, str]]
+) -> list[dict[str, str]]:
+    """Returns the messages asking for a summary of previous and messages"""
+    parts = [f"Previous summary:\n{previous}"] if previous else []
+    parts.extend(f"{m['role']}: {m['content']}" for m in messages)
+    return [
+        {"role": "system", "content": SUMMARY_PROMPT},
+        {"role": "user", "content": "\n\n".join(parts)},
+    ]
+
+
+class Compactor:
+    """Folds messages trimmed from a chat into a rolling summary
+
+    Each batch of trimmed messages is summarized together with the current
+    summary on a daemon thread, so the request happens between turns instead
+    of holding up the response that caused the trim. Batches trimmed while a
+    summary is running are queued and folded in together afterwards, so
+    submitting never waits. The summary is a single system message whose
+    tokens count towards the chat's budget.
+
+    Parameters
+    ----------
+    summarize : Callable[[list[dict[str, str]]], str]
+        Sends a summary request and returns the summary text
+    """
+
+    def __init__(self, summarize: Callable[[list[dict[str, str]]], str]):
+        self.summarize = summarize
+        self.error: Optional[str] = None
+        # Replaced as a whole so readers never see a summary with stale tokens
+        self._state: tuple[Optional[dict[str, str]], int] = (None, 0)
+        self._queue: list[dict[str, str]] = []
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def messages(self) -> list[dict[str, str]]:
+        """The summary message to prepend to the conversation, if any"""
+        summary, _ = self._state
+        return [summary] if summary is not None else []
+
+    @property
+    def tokens(self) -> int:
+        return self._state[1]
+
+    @property
+    def running(self) -> bool:
+        with self._cond:
+            return self._thread is not None
+
+    def submit(self, messages: list[dict[str, str]]) -> None:
+        """Queues messages to be folded into the summary after any pending
+        batch, without waiting for it"""
+        with self._cond:
+            self._queue.extend(messages)
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="chatgpt-compact", daemon=True
+                )
+                self._thread.start()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Waits for every queued summary, returns whether none is left running"""
+        with self._cond:
+            return self._cond.wait_for(lambda: self._thread is None, timeout)
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                messages, self._queue = self._queue, []
+                if not messages:
+                    # A new thread is started by the next submit
+                    self._thread = None
+                    self._cond.notify_all()
+                    return
+
+            self._fold(messages)
+
+    def _fold(self, messages: list[dict[str, str]]) -> None:
+        summary, _ = self._state
+        previous = summary["content"][len(SUMMARY_PREFIX) :] if summary else None
+
+        try:
+            text = self.summarize(summary_request(previous, messages))
+            summary = {"role": "system", "content": SUMMARY_PREFIX + text}
+            self._state = (summary, count_message(summary))
+            self.error = None
+        except Exception as e:
+            # The messages are dropped without a summary, as without compaction
+            self.error = f"{type(e).__name__}: {e}"
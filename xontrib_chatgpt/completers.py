@@ -18,7 +18,10 @@ def cm_completer(command: CommandContext) -> set[RichCompletion]:
         "list": "List all current or saved chats",
         "save": "Save a chat to a local file",
         "load": "Load a chat from a local file",
+        "search": "Search the contents of saved chats",
         "print": "Print a chat to the console",
+        "broadcast": "Send a message to several chats at once",
+        "warmup": "Load dependencies in the background and report timings",
     }
     if command.arg_index < 2:
         return {
@@ -44,6 +44,18 @@ class InvalidConversationsTypeError(Exception):
         return f"\n\x1b[1;31m{self.msg}"
 
 
+class PromptTooLongError(Exception):
+    """Raised when a message does not fit in the model's context window on its own"""
+
+    def __init__(self, tokens: int, budget: int, model: str, *_):
+        self.tokens = tokens
+        self.budget = budget
+        self.model = model
+
+    def __str__(self):
+        return f"\n\x1b[1;31mPrompt is {self.tokens} tokens, over the {self.budget} token budget for {self.model}. Shorten the message or set $CHATGPT_TRUNCATE_PROMPT."
+
+
 class MalformedSysMsgError(Exception):
     """Raised when user attempts to set a malformed system message for a chat"""
 
@@ -54,4 +66,14 @@ class MalformedSysMsgError(Exception):
         return f"\x1b[1;31mIncorrect System Message Format:\n{self.msg}\nMust be a python list[dict], dict, or yaml equivalent. See documentation for more information."
 
 
+class SearchUnavailableError(Exception):
+    """Raised when searching saved chats with an SQLite built without FTS5"""
+
+    def __init__(self, msg: str, *_):
+        self.msg = msg
+
+    def __str__(self):
+        return f"\n\x1b[1;31mSearch is unavailable, SQLite has no full-text search: {self.msg}"
+
+
 #############
@@ -0,0 +1,158 @@
+"""Append-only JSONL journal of a conversation"""
+
+import os
+import json
+from typing import BinaryIO, Iterable, Iterator, Optional
+
+from xonsh.built_ins import XSH
+from xonsh.tools import to_bool
+
+
+def is_journal(convo: str) -> bool:
+    """Whether a saved conversation is a JSONL journal, one message per line"""
+    return convo.lstrip().startswith("{")
+
+
+def journal_status(path: str) -> Optional[bool]:
+    """Returns None if the file at path is not a journal, otherwise whether
+    its last record is complete. Only reads the first and last bytes."""
+    with open(path, "rb") as f:
+        if not is_journal(f.read(64).decode("utf-8", "ignore")):
+            return None
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b"\n"
+
+
+def iter_journal(lines: Iterable[str]) -> Iterator[dict[str, str]]:
+    """Replays the lines of a journal into its messages, skipping a partly
+    written last line left by a crash mid-write"""
+    error = None
+
+    for line in lines:
+        if not line.strip():
+            continue
+        if error is not None:
+            raise error
+        try:
+            yield json.loads(line)
+        except json.JSONDecodeError as e:
+            error = e
+
+
+def read_journal_head(f: BinaryIO) -> tuple[list[dict[str, str]], int]:
+    """Reads the system messages at the start of a journal, returns them and
+    the offset of the first record after them"""
+    base, offset = [], f.seek(0)
+
+    for line in iter(f.readline, b""):
+        if line.strip():
+            try:
+                msg = json.loads(line)
+            except json.JSONDecodeError:
+                break
+            if msg.get("role") != "system":
+                break
+            base.append(msg)
+        offset += len(line)
+
+    return base, offset
+
+
+def iter_journal_reversed(
+    f: BinaryIO, stop: int = 0, block_size: int = 1 << 16
+) -> Iterator[tuple[int, dict[str, str]]]:
+    """Yields the (offset, message) of each record of a journal from the last
+    to the first one at or after offset stop, reading the file backwards a
+    block at a time. A partly written last record is skipped."""
+    pos = f.seek(0, os.SEEK_END)
+    buf, last = b"", True
+
+    while pos > stop:
+        size = min(block_size, pos - stop)
+        pos -= size
+        f.seek(pos)
+        buf = f.read(size) + buf
+        lines = buf.split(b"\n")
+
+        # The first line may continue in the previous block
+        head, complete = (b"", lines) if pos == stop else (lines[0], lines[1:])
+        offset = pos + (len(head) + 1 if pos != stop else 0)
+        records = []
+        for line in complete:
+            records.append((offset, line))
+            offset += len(line) + 1
+
+        for offset, line in reversed(records):
+            if not line.strip():
+                continue
+            try:
+                msg = json.loads(line)
+            except json.JSONDecodeError:
+                if not last:
+                    raise
+                msg = None
+            last = False
+            if msg is not None:
+                yield offset, msg
+
+        buf = head
+
+
+def read_journal(convo: str) -> list[dict[str, str]]:
+    """Replays a journal into its messages, see iter_journal"""
+    return list(iter_journal(convo.split("\n")))
+
+
+def read_journal_range(path: str, start: int, stop: int) -> list[dict[str, str]]:
+    """Replays the records of a journal between two offsets"""
+    with open(path, "rb") as f:
+        f.seek(start)
+        data = f.read(stop - start)
+    return read_journal(data.decode("utf-8"))
+
+
+class Journal:
+    """JSONL file a conversation is appended to as it happens
+
+    Every message is one JSON record on its own line, so recording a turn
+    only writes the new messages instead of the whole conversation.
+
+    Parameters
+    ----------
+    path : str
+        Path to the journal file
+    fsync : bool, optional
+        Whether to fsync after every write, by default None
+        Defaults to $CHATGPT_JOURNAL_FSYNC or False.
+    """
+
+    def __init__(self, path: str, fsync: Optional[bool] = None):
+        self.path = path
+        self._fsync = fsync
+
+    @property
+    def fsync(self) -> bool:
+        if self._fsync is not None:
+            return self._fsync
+        return to_bool(XSH.env.get("CHATGPT_JOURNAL_FSYNC", False))
+
+    def write(self, messages: Iterable[dict[str, str]]) -> None:
+        """Starts the journal over with messages"""
+        self._write("w", messages)
+
+    def append(self, messages: Iterable[dict[str, str]]) -> None:
+        """Adds messages to the end of the journal"""
+        self._write("a", messages)
+
+    def _write(self, mode: str, messages: Iterable[dict[str, str]]) -> None:
+        # One write per call keeps a turn together if the shell dies mid-way
+        data = "".join(json.dumps(dict(m)) + "\n" for m in messages)
+
+        with open(self.path, mode) as f:
+            f.write(data)
+            if self.fsync:
+                f.flush()
+                os.fsync(f.fileno())
+
+    def __repr__(self) -> str:
+        return f"Journal({self.path!r})"
@@ -15,16 +15,49 @@ def _openai():
     return openai
 
 
+def _PooledSession():
+    """Session class for the shared transport, imports requests on first use"""
+    import requests
+
+    class PooledSession(requests.Session):
+        """Session that survives openai's periodic session recycling.
+        openai closes each thread's session every few minutes, which would
+        drop the pooled connections, so it is only closed through shutdown.
+        """
+
+        def close(self) -> None:
+            pass
+
+        def shutdown(self) -> None:
+            super().close()
+
+    return PooledSession
+
+
+def _aiohttp():
+    """Imports aiohttp, installed alongside openai"""
+    import aiohttp
+
+    return aiohttp
+
+
 def _tiktoken():
-    """Imports tiktoken"""
+    """Imports tiktoken. The encoding is downloaded on first use, if that
+    fails the error is raised and the LazyObject left unloaded, so the next
+    count tries the download again."""
     import tiktoken
 
     return tiktoken.get_encoding("cl100k_base")
 
 
-def _MULTI_LINE_CODE():
-    """Regex to remove multiline code blocks (```code```) from markdown"""
-    return re.compile(r"```.*?\n", re.DOTALL)
+def _FENCED_CODE():
+    """Regex to find fenced code blocks (```lang ... ```) in markdown, along
+    with the language named after the opening fence. A block left open runs
+    to the end of the text."""
+    return re.compile(
+        r"^ {0,3}```[ \t]*([^\s`]*)[^\n]*\n(.*?)(?:^ {0,3}```[ \t]*(?:\n|\Z)|\Z)",
+        re.DOTALL | re.MULTILINE,
+    )
 
 
 def _SINGLE_LINE_CODE():
@@ -37,6 +70,8 @@ def _PYGMENTS():
     from pygments import highlight
     from pygments.lexers import get_lexer_by_name
     from pygments.lexers.python import PythonLexer
+    from pygments.lexers.special import TextLexer
+    from pygments.util import ClassNotFound
     from pygments.formatters import Terminal256Formatter
     from pygments.styles.gh_dark import GhDarkStyle
 
@@ -46,30 +81,40 @@ def _PYGMENTS():
             "highlight",
             "get_lexer_by_name",
             "PythonLexer",
+            "TextLexer",
+            "ClassNotFound",
             "Terminal256Formatter",
             "GhDarkStyle",
         ],
     )
     return container(
-        highlight, get_lexer_by_name, PythonLexer, Terminal256Formatter, GhDarkStyle
+        highlight,
+        get_lexer_by_name,
+        PythonLexer,
+        TextLexer,
+        ClassNotFound,
+        Terminal256Formatter,
+        GhDarkStyle,
     )
 
 
 def _markdown():
-    """Formats markdown text using pygments"""
+    """Formats markdown text using pygments, with one lexer and formatter
+    reused for every call"""
     from pygments import highlight
     from pygments.lexers.markup import MarkdownLexer
     from pygments.formatters import Terminal256Formatter
     from pygments.styles.gh_dark import GhDarkStyle
 
-    return lambda text: highlight(
-        text, MarkdownLexer(), Terminal256Formatter(style=GhDarkStyle)
-    )
+    lexer = MarkdownLexer()
+    formatter = Terminal256Formatter(style=GhDarkStyle)
+    return lambda text: highlight(text, lexer, formatter)
 
 
 def _FIND_NAME_REGEX():
-    """Regex to find the name of a chat from a file name"""
-    return re.compile(r"^(?:.+?_)*([a-zA-Z0-9]+)(?:_[0-9\-]+)?\.(?:.*)$", re.DOTALL)
+    """Regex to find the name of a chat from a file name, i.e. the 'name' of
+    user_name_2023-01-01_1.json.gz"""
+    return re.compile(r"^(?:.+?_)*?([a-zA-Z0-9]+)(?:_[0-9\-]+)*\.(?:.*)$", re.DOTALL)
 
 
 def _YAML():
@@ -0,0 +1,186 @@
+"""Compact records for the messages of a conversation"""
+
+import sys
+import hashlib
+import threading
+import weakref
+from collections.abc import Mapping, Sequence
+from typing import Callable, Iterable, Iterator, Union
+
+MessageLike = Union["Message", Mapping]
+
+
+class Message(Mapping):
+    """A single message of a conversation
+
+    Reads like the {'role': ..., 'content': ...} dict the API expects, and
+    compares equal to one, but is a fraction of the size. Roles are interned,
+    so every message with the same role shares one string.
+
+    Parameters
+    ----------
+    role : str
+        Role of the message, i.e. 'user'
+    content : str
+        Text of the message
+    """
+
+    __slots__ = ("role", "content")
+
+    def __init__(self, role: str, content: str):
+        self.role = sys.intern(role)
+        self.content = content
+
+    @classmethod
+    def of(cls, msg: MessageLike) -> "Message":
+        """Returns msg as a Message, without copying it if it already is one"""
+        if isinstance(msg, Message):
+            return msg
+        return cls(msg["role"], msg["content"])
+
+    def to_dict(self) -> dict[str, str]:
+        return {"role": self.role, "content": self.content}
+
+    def __getitem__(self, key: str) -> str:
+        if key == "role":
+            return self.role
+        if key == "content":
+            return self.content
+        raise KeyError(key)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(("role", "content"))
+
+    def __len__(self) -> int:
+        return 2
+
+    def __repr__(self) -> str:
+        return repr(self.to_dict())
+
+    def __reduce__(self):
+        return (Message, (self.role, self.content))
+
+
+class Window(Sequence):
+    """Read-only view of a list of messages from start onwards, which follows
+    the list as it grows instead of copying it
+
+    Parameters
+    ----------
+    messages : list[MessageLike]
+        Messages to view
+    start : int
+        Index of the first message in view, negative to count from the end
+    """
+
+    __slots__ = ("_messages", "_start")
+
+    def __init__(self, messages: list[MessageLike], start: int):
+        self._messages = messages
+        self._start = start
+
+    def _range(self) -> range:
+        return range(*slice(self._start, None).indices(len(self._messages)))
+
+    def __len__(self) -> int:
+        return len(self._range())
+
+    def __getitem__(self, idx: Union[int, slice]):
+        if isinstance(idx, slice):
+            return [self._messages[i] for i in self._range()[idx]]
+        return self._messages[self._range()[idx]]
+
+    def __iter__(self) -> Iterator[MessageLike]:
+        return map(self._messages.__getitem__, self._range())
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, Sequence) and list(self) == list(other)
+
+    def __repr__(self) -> str:
+        return f"Window({list(self)})"
+
+
+def to_messages(messages: Iterable[MessageLike]) -> list[Message]:
+    """Converts messages to Message records"""
+    return [Message.of(m) for m in messages]
+
+
+def to_wire(messages: Iterable[MessageLike]) -> list[dict[str, str]]:
+    """Converts messages to the dicts sent to the API or written to disk"""
+    return [{"role": m["role"], "content": m["content"]} for m in messages]
+
+
+class SystemPrompt(list):
+    """A set of base system messages shared by every chat that uses it,
+    along with its token count
+
+    It can not be changed in place, since other chats may hold the same
+    one. Assigning a new list to ChatGPT.base looks up or creates another
+    set instead, see system_prompt.
+    """
+
+    __slots__ = ("tokens", "key", "__weakref__")
+
+    def __init__(self, messages: Iterable[Message], tokens: int, key: str = ""):
+        super().__init__(messages)
+        self.tokens = tokens
+        self.key = key
+
+    def _read_only(self, *_, **__):
+        raise TypeError("System prompts are shared, assign a new list to base")
+
+    append = extend = insert = remove = pop = clear = sort = reverse = _read_only
+    __setitem__ = __delitem__ = __iadd__ = __imul__ = _read_only
+
+    def __reduce__(self):
+        return (list, (list(self),))
+
+
+_prompts: "weakref.WeakValueDictionary[str, SystemPrompt]" = (
+    weakref.WeakValueDictionary()
+)
+_prompts_lock = threading.Lock()
+
+
+def prompt_key(messages: Iterable[MessageLike]) -> str:
+    """Returns a hash of the roles and contents of messages"""
+    h = hashlib.blake2b(digest_size=16)
+    for m in messages:
+        for v in (m["role"], m["content"]):
+            h.update(f"{len(v)}:".encode())
+            h.update(v.encode())
+    return h.hexdigest()
+
+
+def system_prompt(
+    messages: Iterable[MessageLike], count: Callable[[list[Message]], int]
+) -> SystemPrompt:
+    """Returns the shared SystemPrompt with the same messages, creating it if
+    no chat uses one yet. count is only called to create one.
+
+    Parameters
+    ----------
+    messages : Iterable[MessageLike]
+        Base system messages
+    count : Callable[[list[Message]], int]
+        Returns the token count of the messages
+
+    Returns
+    -------
+    SystemPrompt
+    """
+    if isinstance(messages, SystemPrompt):
+        return messages
+
+    messages = to_messages(messages)
+    key = prompt_key(messages)
+
+    with _prompts_lock:
+        prompt = _prompts.get(key)
+    if prompt is not None:
+        return prompt
+
+    prompt = SystemPrompt(messages, count(messages), key)
+    with _prompts_lock:
+        # Another thread may have created it in the meantime
+        return _prompts.setdefault(key, prompt)
@@ -0,0 +1,231 @@
+"""Client side rate limiting and retries for OpenAI requests"""
+
+import time
+import random
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Optional, Union
+
+from xonsh.built_ins import XSH
+from openai.error import (
+    OpenAIError,
+    APIError,
+    TryAgain,
+    Timeout,
+    APIConnectionError,
+    RateLimitError,
+    ServiceUnavailableError,
+)
+
+RETRY_ERRORS = (
+    APIError,
+    TryAgain,
+    Timeout,
+    APIConnectionError,
+    RateLimitError,
+    ServiceUnavailableError,
+)
+
+
+def is_retryable(e: OpenAIError) -> bool:
+    """Whether a request that failed with e is worth retrying"""
+    if not isinstance(e, RETRY_ERRORS):
+        return False
+    if type(e) is APIError and e.http_status is not None:
+        return e.http_status >= 500
+    return True
+
+
+def get_retry_after(e: OpenAIError) -> float:
+    """Returns the seconds to wait from a Retry-After header, or 0"""
+    try:
+        return float(e.headers.get("retry-after", 0))
+    except (AttributeError, TypeError, ValueError):
+        return 0.0
+
+
+class TokenBucket:
+    """Token bucket refilled continuously up to capacity over one minute
+
+    Reservations may take the bucket below zero. The returned delay is how long
+    the caller must wait for the debt to be repaid, so callers are served in
+    the order they reserved.
+    """
+
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.rate = per_minute / 60
+        self.tokens = per_minute
+        self.last = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        elapsed = max(0.0, now - self.last)
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+        self.last = max(self.last, now)
+
+    def reserve(self, amount: float, now: float) -> float:
+        """Takes amount from the bucket, returns the seconds to wait before using it"""
+        self._refill(now)
+        # A single request larger than the bucket would otherwise never fit
+        self.tokens -= min(amount, self.capacity)
+        return max(0.0, -self.tokens / self.rate)
+
+    def adjust(self, amount: float, now: float) -> None:
+        """Takes (or gives back, if negative) amount after the fact"""
+        self._refill(now)
+        self.tokens = min(self.capacity, self.tokens - amount)
+
+
+class RateLimiter:
+    """Process wide scheduler keeping requests under per model RPM and TPM limits
+
+    Limits are read from $CHATGPT_RPM and $CHATGPT_TPM, either a number for
+    every model or a dict of model name to number. Unset or 0 means unlimited.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets: dict[tuple[str, str], tuple[float, TokenBucket]] = {}
+        self._paused_until: dict[str, float] = {}
+        self.backoff = 1.0
+
+    @staticmethod
+    def _limit(name: str, model: str) -> float:
+        limit: Union[int, float, dict, None] = XSH.env.get(name, None)
+        if isinstance(limit, dict):
+            limit = limit.get(model, None)
+        return float(limit or 0)
+
+    def _bucket(self, kind: str, model: str) -> Optional[TokenBucket]:
+        """Returns the bucket for the model, recreating it if the limit changed"""
+        limit = self._limit(f"CHATGPT_{kind}", model)
+        if limit <= 0:
+            return None
+
+        current = self._buckets.get((kind, model))
+        if current is None or current[0] != limit:
+            current = self._buckets[(kind, model)] = (limit, TokenBucket(limit))
+
+        return current[1]
+
+    def limits_tokens(self, model: str) -> bool:
+        """Whether requests to model need a token estimate"""
+        return self._limit("CHATGPT_TPM", model) > 0
+
+    def reserve(self, model: str, tokens: int = 0) -> float:
+        """Reserves one request and tokens, returns the seconds to wait first"""
+        with self._lock:
+            now = time.monotonic()
+            delay = max(0.0, self._paused_until.get(model, 0.0) - now)
+
+            rpm = self._bucket("RPM", model)
+            if rpm is not None:
+                delay = max(delay, rpm.reserve(1, now))
+
+            tpm = self._bucket("TPM", model)
+            if tpm is not None:
+                delay = max(delay, tpm.reserve(tokens, now))
+
+            return delay
+
+    def settle(self, model: str, estimate: int, actual: int) -> None:
+        """Corrects the token budget once the actual usage is known"""
+        with self._lock:
+            tpm = self._bucket("TPM", model)
+            if tpm is not None:
+                tpm.adjust(actual - estimate, time.monotonic())
+
+    def pause(self, model: str, seconds: float) -> None:
+        """Holds back every request to model, i.e. after a 429"""
+        with self._lock:
+            until = time.monotonic() + seconds
+            self._paused_until[model] = max(self._paused_until.get(model, 0.0), until)
+
+    def get_delay(self, attempt: int, e: OpenAIError) -> float:
+        """Jittered exponential backoff, at least as long as any Retry-After"""
+        return max(
+            get_retry_after(e), self.backoff * 2**attempt * (1 + random.random())
+        )
+
+    def call(
+        self,
+        fn: Callable[[], Any],
+        model: str,
+        estimate: int = 0,
+        retries: Optional[int] = None,
+    ) -> Any:
+        """Calls fn once the limits allow, retrying transient errors with backoff
+
+        Parameters
+        ----------
+        fn : Callable[[], Any]
+            Function making the request
+        model : str
+            Model the request is for
+        estimate : int, optional
+            Local estimate of the request's tokens, by default 0
+        retries : int, optional
+            Number of retries, by default None
+            Defaults to $CHATGPT_MAX_RETRIES or 3.
+
+        Returns
+        -------
+        Any
+            Result of fn
+        """
+        retries = self._retries(retries)
+
+        for attempt in range(retries + 1):
+            time.sleep(self.reserve(model, estimate))
+
+            try:
+                return fn()
+            except OpenAIError as e:
+                delay = self._on_error(e, attempt, retries, model, estimate)
+
+            time.sleep(delay)
+
+    async def acall(
+        self,
+        fn: Callable[[], Awaitable[Any]],
+        model: str,
+        estimate: int = 0,
+        retries: Optional[int] = None,
+    ) -> Any:
+        """Async version of call, fn returns an awaitable"""
+        retries = self._retries(retries)
+
+        for attempt in range(retries + 1):
+            await asyncio.sleep(self.reserve(model, estimate))
+
+            try:
+                return await fn()
+            except OpenAIError as e:
+                delay = self._on_error(e, attempt, retries, model, estimate)
+
+            await asyncio.sleep(delay)
+
+    @staticmethod
+    def _retries(retries: Optional[int]) -> int:
+        if retries is None:
+            retries = int(XSH.env.get("CHATGPT_MAX_RETRIES", 3))
+        return max(retries, 0)
+
+    def _on_error(
+        self, e: OpenAIError, attempt: int, retries: int, model: str, estimate: int
+    ) -> float:
+        """Refunds a failed request, re-raises if it should not be retried,
+        otherwise returns how long to wait before the next attempt"""
+        self.settle(model, estimate, 0)
+
+        if attempt == retries or not is_retryable(e):
+            raise e
+
+        delay = self.get_delay(attempt, e)
+        if isinstance(e, RateLimitError):
+            self.pause(model, delay)
+
+        return delay
+
+
+rate_limiter = RateLimiter()
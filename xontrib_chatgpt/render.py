@@ -0,0 +1,201 @@
+"""Highlighting of messages for the terminal, with a per-message cache"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Callable, Iterator, Optional
+
+from xonsh.built_ins import XSH
+from xonsh.lazyasd import LazyObject
+
+from xontrib_chatgpt.lazyobjs import (
+    _PYGMENTS,
+    _FENCED_CODE,
+    _SINGLE_LINE_CODE,
+    _markdown,
+)
+
+PYGMENTS = LazyObject(_PYGMENTS, globals(), "PYGMENTS")
+FENCED_CODE = LazyObject(_FENCED_CODE, globals(), "FENCED_CODE")
+SINGLE_LINE_CODE = LazyObject(_SINGLE_LINE_CODE, globals(), "SINGLE_LINE_CODE")
+markdown = LazyObject(_markdown, globals(), "markdown")
+formatter = LazyObject(
+    lambda: PYGMENTS.Terminal256Formatter(style=PYGMENTS.GhDarkStyle),
+    globals(),
+    "formatter",
+)
+
+# Changes whenever the output of the renderer would, so stale renders miss
+RENDER_SETTINGS = "fenced:gh-dark:terminal256"
+
+
+class RenderCache:
+    """In memory cache of highlighted messages, keyed by a hash of the text
+    and the render settings
+
+    Printing a conversation again only highlights the messages that are new
+    since it was last printed. The least recently printed renders are
+    dropped first once the cache is full.
+
+    Parameters
+    ----------
+    max_entries : int, optional
+        Maximum number of renders to keep, by default None
+        Defaults to $CHATGPT_RENDER_CACHE_SIZE or 512.
+    """
+
+    def __init__(self, max_entries: Optional[int] = None):
+        self._max_entries = max_entries
+        self._renders: OrderedDict[str, str] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def max_entries(self) -> int:
+        if self._max_entries is not None:
+            return self._max_entries
+        return int(XSH.env.get("CHATGPT_RENDER_CACHE_SIZE", 512))
+
+    @staticmethod
+    def key(text: str, settings: str = RENDER_SETTINGS) -> str:
+        """Returns a hash of the text and the settings it is rendered with"""
+        h = hashlib.blake2b(digest_size=16)
+        h.update(f"{len(settings)}:{settings}".encode())
+        h.update(text.encode())
+        return h.hexdigest()
+
+    def render(
+        self,
+        text: str,
+        render: Callable[[str], str],
+        settings: str = RENDER_SETTINGS,
+    ) -> str:
+        """Returns the cached render of text, calling render on a miss"""
+        key = self.key(text, settings)
+
+        with self._lock:
+            rendered = self._renders.get(key)
+            if rendered is not None:
+                self._renders.move_to_end(key)
+                self.hits += 1
+                return rendered
+
+        rendered = render(text)
+        self._store(key, rendered)
+        return rendered
+
+    def _store(self, key: str, rendered: str) -> None:
+        with self._lock:
+            self.misses += 1
+            self._renders[key] = rendered
+            self._renders.move_to_end(key)
+
+            excess = len(self._renders) - self.max_entries
+            for _ in range(max(excess, 0)):
+                self._renders.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._renders.clear()
+            self.hits = self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._renders)
+
+
+class LexerCache:
+    """Pygments lexers by the language named in a code fence, i.e. 'py'
+
+    Looking up a lexer by name can scan every installed pygments plugin, so
+    each name is only resolved once and the lexer reused. Names pygments does
+    not know resolve to plain text, which is cached too.
+
+    Parameters
+    ----------
+    max_entries : int, optional
+        Maximum number of lexers to keep, by default 64
+    """
+
+    def __init__(self, max_entries: int = 64):
+        self.max_entries = max_entries
+        self._lexers: OrderedDict[str, object] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, name: str):
+        """Returns the lexer for the language name, resolving it on a miss"""
+        name = name.lower()
+
+        with self._lock:
+            lexer = self._lexers.get(name)
+            if lexer is not None:
+                self._lexers.move_to_end(name)
+                self.hits += 1
+                return lexer
+
+        lexer = self._resolve(name)
+        with self._lock:
+            self.misses += 1
+            self._lexers[name] = lexer
+            self._lexers.move_to_end(name)
+            if len(self._lexers) > self.max_entries:
+                self._lexers.popitem(last=False)
+
+        return lexer
+
+    @staticmethod
+    def _resolve(name: str):
+        if name:
+            try:
+                return PYGMENTS.get_lexer_by_name(name)
+            except PYGMENTS.ClassNotFound:
+                pass
+        return PYGMENTS.TextLexer()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._lexers.clear()
+            self.hits = self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._lexers)
+
+
+def split_fences(text: str) -> Iterator[tuple[Optional[str], str]]:
+    """Splits markdown into prose and fenced code blocks in one pass
+
+    Yields
+    ------
+    tuple[Optional[str], str]
+        (None, prose) for text between fences, or (language, code) for the
+        inside of a fenced block, the language being '' if the fence names none
+    """
+    pos = 0
+    for match in FENCED_CODE.finditer(text):
+        if match.start() > pos:
+            yield None, text[pos : match.start()]
+        yield match.group(1), match.group(2)
+        pos = match.end()
+
+    if pos < len(text):
+        yield None, text[pos:]
+
+
+def render_markdown(text: str) -> str:
+    """Highlights markdown for the terminal. Code blocks are highlighted in
+    the language named by their fence and the fences and '`'s removed."""
+    parts = []
+    for lang, chunk in split_fences(text):
+        if lang is None:
+            chunk = markdown(chunk)
+            parts.append(SINGLE_LINE_CODE.sub(r"\1", chunk))
+        elif chunk:
+            parts.append(PYGMENTS.highlight(chunk, lexer_cache.get(lang), formatter))
+
+    return "".join(parts)
+
+
+render_cache = RenderCache()
+lexer_cache = LexerCache()
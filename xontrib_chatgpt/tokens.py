@@ -0,0 +1,272 @@
+"""Token counting with a per-message cache"""
+
+import os
+import json
+import hashlib
+import tempfile
+import threading
+from bisect import bisect_left
+from collections import OrderedDict
+from typing import Iterable, Iterator, Optional, Union
+
+from xonsh.built_ins import XSH
+from xonsh.lazyasd import LazyObject
+
+from xontrib_chatgpt.lazyobjs import _tiktoken
+
+tiktoken = LazyObject(_tiktoken, globals(), "tiktoken")
+
+ENCODING = "cl100k_base"
+TOKENS_PER_MESSAGE = 3
+# Context window of each supported model, shared by the prompt and completion
+CONTEXT_WINDOWS = {"gpt-3.5-turbo": 4096, "gpt-4": 8192}
+# Conversations with fewer new messages than this are encoded on one thread,
+# where the thread pool would cost more than it saves
+BATCH_MIN_MESSAGES = 32
+# Rough length of a token in English text, for when the encoding is unavailable
+CHARS_PER_TOKEN = 4
+
+
+class TokenCache:
+    """In memory cache of message token counts, keyed by a hash of the message
+
+    Every message is encoded at most once per process, so reloading or editing
+    a conversation only pays for the messages that changed. Counts can also be
+    persisted to a sidecar file next to a saved conversation, so loading it in
+    a new shell does not have to encode anything either.
+
+    Parameters
+    ----------
+    max_entries : int, optional
+        Maximum number of counts to keep, by default None
+        Defaults to $CHATGPT_TOKEN_CACHE_SIZE or 100000.
+    threads : int, optional
+        Threads used to encode large conversations, by default None
+        Defaults to $CHATGPT_TOKENIZER_THREADS or the number of CPUs, up to 8.
+    """
+
+    def __init__(
+        self, max_entries: Optional[int] = None, threads: Optional[int] = None
+    ):
+        self._max_entries = max_entries
+        self._threads = threads
+        self._counts: OrderedDict[str, int] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def max_entries(self) -> int:
+        if self._max_entries is not None:
+            return self._max_entries
+        return int(XSH.env.get("CHATGPT_TOKEN_CACHE_SIZE", 100000))
+
+    @property
+    def threads(self) -> int:
+        if self._threads is not None:
+            return self._threads
+        default = min(os.cpu_count() or 1, 8)
+        return max(int(XSH.env.get("CHATGPT_TOKENIZER_THREADS", default)), 1)
+
+    @staticmethod
+    def key(message: dict[str, str]) -> str:
+        """Returns a hash of every field of the message"""
+        h = hashlib.blake2b(digest_size=16)
+        for k, v in message.items():
+            h.update(f"{len(k)}:{k}{len(v)}:".encode())
+            h.update(v.encode())
+        return h.hexdigest()
+
+    def count(self, message: dict[str, str]) -> int:
+        """Returns the tokens of a single message, encoding it on a miss"""
+        key = self.key(message)
+
+        with self._lock:
+            count = self._counts.get(key)
+            if count is not None:
+                self._counts.move_to_end(key)
+                self.hits += 1
+                return count
+
+        count = self._encode([message])[0]
+        self._store(key, count)
+        return count
+
+    def get_token_list(self, messages: list[dict[str, str]]) -> list[int]:
+        """Returns the priming tokens followed by the tokens of each message.
+        Messages missing from the cache are encoded together in one batch."""
+        keys = [self.key(m) for m in messages]
+        counts: list[Optional[int]] = []
+
+        with self._lock:
+            for key in keys:
+                count = self._counts.get(key)
+                if count is not None:
+                    self._counts.move_to_end(key)
+                    self.hits += 1
+                counts.append(count)
+
+        missing = {k: m for k, m, c in zip(keys, messages, counts) if c is None}
+        if missing:
+            for key, count in zip(missing, self._encode(list(missing.values()))):
+                self._store(key, count)
+                missing[key] = count
+            counts = [missing[k] if c is None else c for k, c in zip(keys, counts)]
+
+        return [3] + counts
+
+    def _encode(self, messages: list[dict[str, str]]) -> list[int]:
+        """Counts the tokens of messages, on several threads if there are enough"""
+        texts = [v for m in messages for v in m.values()]
+        threads = self.threads
+
+        if threads > 1 and len(messages) >= BATCH_MIN_MESSAGES:
+            lengths = [
+                len(t) for t in tiktoken.encode_batch(texts, num_threads=threads)
+            ]
+        else:
+            lengths = [len(tiktoken.encode(t)) for t in texts]
+
+        counts, idx = [], 0
+        for m in messages:
+            counts.append(TOKENS_PER_MESSAGE + sum(lengths[idx : idx + len(m)]))
+            idx += len(m)
+
+        return counts
+
+    def _store(self, key: str, count: int) -> None:
+        with self._lock:
+            self.misses += 1
+            self._counts[key] = count
+            self._counts.move_to_end(key)
+
+            excess = len(self._counts) - self.max_entries
+            for _ in range(max(excess, 0)):
+                self._counts.popitem(last=False)
+
+    def load(self, path: str) -> int:
+        """Merges the counts from a sidecar file, returns the number loaded"""
+        try:
+            with open(path, "r") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return 0
+
+        if not isinstance(data, dict) or data.get("encoding") != ENCODING:
+            return 0
+
+        counts = data.get("counts", {})
+        with self._lock:
+            for key, count in counts.items():
+                self._counts.setdefault(key, count)
+
+        return len(counts)
+
+    def save(self, path: str, messages: list[dict[str, str]]) -> None:
+        """Writes the counts of messages to a sidecar file"""
+        counts = {self.key(m): self.count(m) for m in messages}
+        dir_name = os.path.dirname(path) or "."
+
+        fd, tmp = tempfile.mkstemp(dir=dir_name, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump({"encoding": ENCODING, "counts": counts}, f)
+        os.replace(tmp, path)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._counts.clear()
+            self.hits = self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._counts)
+
+
+class TokenLedger:
+    """Token counts of a conversation's messages, with running totals
+
+    Behaves like the list of counts it replaces, but also keeps prefix sums
+    so the total of any tail is O(1) and finding where to trim is O(log n).
+    Counts are only ever appended, which keeps the prefix sums valid.
+
+    Parameters
+    ----------
+    counts : Iterable[int], optional
+        Initial token counts, by default ()
+    """
+
+    __slots__ = ("_counts", "_prefix")
+
+    def __init__(self, counts: Iterable[int] = ()):
+        self._counts: list[int] = []
+        self._prefix: list[int] = [0]
+        self.extend(counts)
+
+    def append(self, count: int) -> None:
+        self._counts.append(count)
+        self._prefix.append(self._prefix[-1] + count)
+
+    def extend(self, counts: Iterable[int]) -> None:
+        for count in counts:
+            self.append(count)
+
+    def _position(self, idx: int) -> int:
+        """Converts a slice style index to a position in 0..len"""
+        n = len(self._counts)
+        if idx < 0:
+            return max(n + idx, 0)
+        return min(idx, n)
+
+    def total(self, start: int = 0) -> int:
+        """Sum of the counts from start onwards, like sum(counts[start:])"""
+        return self._prefix[-1] - self._prefix[self._position(start)]
+
+    def cut(self, budget: int, start: int, stop: int) -> int:
+        """Returns the first position in start..stop from which the remaining
+        counts fit in budget, or stop if none of them do"""
+        target = self._prefix[-1] - budget
+        return bisect_left(self._prefix, target, self._position(start), stop)
+
+    def __len__(self) -> int:
+        return len(self._counts)
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self._counts)
+
+    def __getitem__(self, idx: Union[int, slice]) -> Union[int, list[int]]:
+        return self._counts[idx]
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, TokenLedger):
+            return self._counts == other._counts
+        return self._counts == other
+
+    def __repr__(self) -> str:
+        return f"TokenLedger({self._counts})"
+
+
+def count_tokens(text: str) -> int:
+    """Returns the number of tokens in a single piece of text"""
+    return len(tiktoken.encode(text))
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count from the length of text, without the encoding"""
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+
+def truncate_tokens(text: str, n: int) -> str:
+    """Removes the last n tokens of text, returns '' if nothing is left"""
+    encoded = tiktoken.encode(text)
+    if n >= len(encoded):
+        return ""
+    return tiktoken.decode(encoded[: len(encoded) - n])
+
+
+def get_sidecar_path(path: str) -> str:
+    """Returns the token count sidecar for a saved conversation,
+    a hidden file in the same directory, i.e. .convo.json.tokens"""
+    dir_name, base_name = os.path.split(path)
+    return os.path.join(dir_name, f".{base_name}.tokens")
+
+
+token_cache = TokenCache()
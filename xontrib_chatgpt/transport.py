@@ -0,0 +1,187 @@
+"""Pooled HTTP transport shared by all chats"""
+
+import contextlib
+from typing import Optional, AsyncIterator
+
+from xonsh.built_ins import XSH
+from xonsh.lazyasd import LazyObject
+
+from xontrib_chatgpt.lazyobjs import _openai, _aiohttp, _PooledSession
+
+openai = LazyObject(_openai, globals(), "openai")
+aiohttp = LazyObject(_aiohttp, globals(), "aiohttp")
+PooledSession = LazyObject(_PooledSession, globals(), "PooledSession")
+
+
+class Transport:
+    """Keep-alive connection pools for OpenAI requests
+
+    The requests session is created on the first request, so opening the
+    transport does not slow down shell startup. Once created, it is installed
+    as openai.requestssession and every synchronous request reuses its
+    connections. Async requests share a pool inside aiosession.
+
+    Parameters
+    ----------
+    pool_size : int, optional
+        Maximum connections kept per host, by default None
+        Defaults to $CHATGPT_POOL_SIZE or 10.
+    connect_timeout : float, optional
+        Seconds to wait for a connection, by default None
+        Defaults to $CHATGPT_CONNECT_TIMEOUT or 10.
+    read_timeout : float, optional
+        Seconds to wait for a response, by default None
+        Defaults to $CHATGPT_READ_TIMEOUT or 600.
+    """
+
+    def __init__(
+        self,
+        pool_size: Optional[int] = None,
+        connect_timeout: Optional[float] = None,
+        read_timeout: Optional[float] = None,
+    ):
+        self._pool_size = pool_size
+        self._connect_timeout = connect_timeout
+        self._read_timeout = read_timeout
+        self.session = None
+        self._prev_session = None
+        self._async_connections = 0
+        self._async_reused = 0
+
+    @property
+    def pool_size(self) -> int:
+        if self._pool_size is not None:
+            return self._pool_size
+        return int(XSH.env.get("CHATGPT_POOL_SIZE", 10))
+
+    @property
+    def request_timeout(self) -> tuple[float, float]:
+        connect = self._connect_timeout
+        if connect is None:
+            connect = float(XSH.env.get("CHATGPT_CONNECT_TIMEOUT", 10))
+
+        read = self._read_timeout
+        if read is None:
+            read = float(XSH.env.get("CHATGPT_READ_TIMEOUT", 600))
+
+        return (connect, read)
+
+    def install(self) -> None:
+        """Creates the pooled session and installs it for openai, if not done yet"""
+        if self.session is not None:
+            return
+
+        from requests.adapters import HTTPAdapter
+
+        self.session = PooledSession()
+        # No retries here, the rate limiter retries and counts every request
+        adapter = HTTPAdapter(
+            pool_connections=self.pool_size, pool_maxsize=self.pool_size
+        )
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self._prev_session = openai.requestssession
+        openai.requestssession = self.session
+
+    def close(self) -> None:
+        """Closes every pooled connection and restores openai's own sessions"""
+        if self.session is None:
+            return
+
+        if openai.requestssession is self.session:
+            openai.requestssession = self._prev_session
+
+        self.session.shutdown()
+        self.session = None
+        self._prev_session = None
+
+    @contextlib.asynccontextmanager
+    async def aiosession(self) -> AsyncIterator[None]:
+        """Shares one aiohttp connection pool between the async requests in the block"""
+        trace = aiohttp.TraceConfig()
+        trace.on_connection_create_end.append(self._on_async_connect)
+        trace.on_connection_reuseconn.append(self._on_async_reuse)
+
+        async with aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.pool_size),
+            trace_configs=[trace],
+        ) as session:
+            token = openai.aiosession.set(session)
+            try:
+                yield
+            finally:
+                openai.aiosession.reset(token)
+
+    async def _on_async_connect(self, *_) -> None:
+        self._async_connections += 1
+
+    async def _on_async_reuse(self, *_) -> None:
+        self._async_reused += 1
+
+    def stats(self) -> dict[str, int]:
+        """Returns connection reuse statistics
+
+        'requests' counts the requests sent over pooled connections and
+        'connections' counts the connections that had to be opened for them.
+        """
+        conns = self._async_connections
+        reqs = self._async_connections + self._async_reused
+
+        if self.session is not None:
+            for adapter in {id(a): a for a in self.session.adapters.values()}.values():
+                pools = adapter.poolmanager.pools
+                for key in pools.keys():
+                    pool = pools.get(key)
+                    if pool is not None:
+                        conns += pool.num_connections
+                        reqs += pool.num_requests
+
+        return {"requests": reqs, "connections": conns, "reused": max(reqs - conns, 0)}
+
+
+_transport: Optional[Transport] = None
+
+
+def open_transport(**kwargs) -> Transport:
+    """Opens the shared transport, called when the xontrib is loaded"""
+    global _transport
+
+    if _transport is None:
+        _transport = Transport(**kwargs)
+
+    return _transport
+
+
+def close_transport() -> None:
+    """Closes the shared transport, called when the xontrib is unloaded"""
+    global _transport
+
+    if _transport is not None:
+        _transport.close()
+        _transport = None
+
+
+def get_transport() -> Optional[Transport]:
+    """Returns the shared transport if it is open"""
+    return _transport
+
+
+def request_kwargs() -> dict:
+    """Extra keyword arguments for openai requests, installing the transport if open"""
+    if _transport is None:
+        return {}
+
+    _transport.install()
+    return {"request_timeout": _transport.request_timeout}
+
+
+@contextlib.asynccontextmanager
+async def aiosession() -> AsyncIterator[None]:
+    """Shares the transport's async connection pool in the block, if it is open"""
+    if _transport is None:
+        yield
+        return
+
+    async with _transport.aiosession():
+        yield
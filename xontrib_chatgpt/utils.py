@@ -1,30 +1,28 @@
 """Utility Functions for xontrib-chatgpt"""
 
+import io
 import os
+import gzip
+import lzma
+import sys
 import json
-from typing import Union
+import asyncio
+import itertools
+from typing import IO, Union, Iterable, Iterator
 from datetime import datetime
 from textwrap import dedent
 
 from xonsh.built_ins import XSH
-from xonsh.tools import indent
+from xonsh.tools import indent, to_bool
 from xonsh.ansi_colors import ansi_partial_color_format
 from xonsh.lazyasd import LazyObject
 
-from xontrib_chatgpt.lazyobjs import (
-    _tiktoken,
-    _MULTI_LINE_CODE,
-    _SINGLE_LINE_CODE,
-    _markdown,
-    _YAML,
-)
+from xontrib_chatgpt.lazyobjs import _YAML
+from xontrib_chatgpt.tokens import token_cache
+from xontrib_chatgpt.render import render_cache, render_markdown
+from xontrib_chatgpt.journal import iter_journal
 from xontrib_chatgpt.exceptions import MalformedSysMsgError
 
-
-tiktoken = LazyObject(_tiktoken, globals(), "tiktoken")
-MULTI_LINE_CODE = LazyObject(_MULTI_LINE_CODE, globals(), "MULTI_LINE_CODE")
-SINGLE_LINE_CODE = LazyObject(_SINGLE_LINE_CODE, globals(), "SINGLE_LINE_CODE")
-markdown = LazyObject(_markdown, globals(), "markdown")
 YAML = LazyObject(_YAML, globals(), "YAML")
 
 
@@ -41,55 +39,82 @@ def parse_convo(convo: str) -> tuple[list[dict[str, str]]]:
     tuple[list[dict[str, str]]]
         Parsed conversation and base system messages
     """
-    try:
-        convo = json.loads(convo)
-    except json.JSONDecodeError:
-        pass
-    else:
-        base, messages = [], []
-        for msg in convo:
-            if msg["role"] == "system":
-                base.append(msg)
-            else:
-                messages.append(msg)
-        return messages, base
-
-    convo = convo.split("\n")
-    messages, base, user, idx, n = [], [], True, 0, len(convo)
-
-    # Couldn't figure out how to do this with regex, so while loop instead
-    while idx < n:
-        if not convo[idx]:
-            idx += 1
-            continue
+    return read_convo(io.StringIO(convo))
 
-        if convo[idx].startswith("System"):
-            msg = {"role": "system", "content": ""}
+
+def read_convo(lines: Iterable[str]) -> tuple[list[dict[str, str]]]:
+    """Parses a conversation from an open file or other iterable of lines,
+    reading it incrementally. See parse_convo."""
+    base, messages = [], []
+    for msg in iter_convo(lines):
+        if msg["role"] == "system":
+            base.append(msg)
         else:
-            msg = {"role": "user" if user else "assistant", "content": ""}
+            messages.append(msg)
+    return messages, base
 
-        idx += 1
 
-        if idx >= n:
+def iter_convo(lines: Iterable[str]) -> Iterator[dict[str, str]]:
+    """Yields the messages of a saved conversation from its lines
+
+    The format is detected from the first non-blank line: a JSON list,
+    a JSONL journal or the text format written by save_convo.
+    """
+    lines = iter(lines)
+    for first in lines:
+        if first.strip():
             break
+    else:
+        return
 
-        while idx < n and convo[idx].startswith(" "):
-            msg["content"] += convo[idx] + "\n"
-            idx += 1
+    lines = itertools.chain([first], lines)
+    start = first.lstrip()[0]
 
-        msg["content"] = dedent(msg["content"])
+    if start == "[":
+        yield from json.loads("".join(lines))
+    elif start == "{":
+        yield from iter_journal(lines)
+    else:
+        yield from _iter_text(lines)
 
-        if msg["role"] == "system":
-            base.append(msg)
+
+def _iter_text(lines: Iterable[str]) -> Iterator[dict[str, str]]:
+    """Yields the messages of a text format conversation. Each message is a
+    header line followed by its indented content."""
+    msg, chunks, header, user = None, [], "", True
+
+    for raw in lines:
+        line = raw[:-1] if raw.endswith("\n") else raw
+
+        if msg is not None:
+            if line.startswith(" "):
+                chunks.append(line)
+                continue
+
+            msg["content"] = dedent("\n".join(chunks) + "\n") if chunks else ""
+            if msg["role"] != "system":
+                user = not user
+            yield msg
+            msg = None
+
+        if not line:
+            continue
+
+        if line.startswith("System"):
+            msg = {"role": "system", "content": ""}
         else:
-            messages.append(msg)
-            user = not user
+            msg = {"role": "user" if user else "assistant", "content": ""}
+        chunks, header = [], raw
 
-    return messages, base
+    # A header on the very last line, without a newline, has no message
+    if msg is not None and (chunks or header.endswith("\n")):
+        msg["content"] = dedent("\n".join(chunks) + "\n") if chunks else ""
+        yield msg
 
 
 def get_token_list(messages: list[dict[str, str]]) -> list[int]:
-    """Gets the chat tokens for the loaded conversation
+    """Gets the chat tokens for the loaded conversation.
+    Each message is only encoded the first time it is seen, see TokenCache.
 
     Parameters
     ----------
@@ -101,17 +126,17 @@ def get_token_list(messages: list[dict[str, str]]) -> list[int]:
     list[int]
         List of tokens for each message
     """
-    tokens_per_message = 3
-    tokens = [3]
+    return token_cache.get_token_list(messages)
+
+
+def count_message(message: dict[str, str]) -> int:
+    """Returns the tokens of a single message, see TokenCache"""
+    return token_cache.count(message)
 
-    for message in messages:
-        num_tokens = 0
-        num_tokens += tokens_per_message
-        for v in message.values():
-            num_tokens += len(tiktoken.encode(v))
-        tokens.append(num_tokens)
 
-    return tokens
+async def aget_token_list(messages: list[dict[str, str]]) -> list[int]:
+    """Async version of get_token_list, tokenizes in a worker thread"""
+    return await asyncio.to_thread(get_token_list, messages)
 
 
 def print_res(res: str) -> None:
@@ -122,33 +147,64 @@ def print_res(res: str) -> None:
     print(res)
 
 
+def print_stream(chunks: Iterable[str]) -> str:
+    """Prints a streamed response from ChatGPT to the shell as it arrives.
+    Returns the full text of the response once the stream is exhausted.
+    """
+    print(ansi_partial_color_format("\n{BOLD_BLUE}ChatGPT:{RESET}\n"))
+    parts = []
+    sys.stdout.write("    ")
+
+    for chunk in chunks:
+        parts.append(chunk)
+        sys.stdout.write(chunk.replace("\n", "\n    "))
+        sys.stdout.flush()
+
+    sys.stdout.write("\n")
+    sys.stdout.flush()
+    return "".join(parts)
+
+
 def format_markdown(text: str) -> str:
-    """Formats the text using the Pygments Markdown Lexer, removes markdown code '`'s"""
-    text = markdown(text)
-    text = MULTI_LINE_CODE.sub("", text)
-    text = SINGLE_LINE_CODE.sub(r"\1", text)
-    return text
+    """Formats the text using Pygments, highlighting each code block in its own
+    language and removing markdown code '`'s. Each text is only formatted once,
+    see RenderCache and render_markdown."""
+    return render_cache.render(text, render_markdown)
+
+
+def get_data_dir() -> str:
+    """Returns $XONSH_DATA_DIR, or the xonsh default if it is not set"""
+    return XSH.env.get(
+        "XONSH_DATA_DIR",
+        os.path.join(os.path.expanduser("~"), ".local", "share", "xonsh"),
+    )
 
 
 def get_default_path(
-    name: str = "", json_mode: bool = False, override: bool = False, alias: str = ""
+    name: str = "",
+    json_mode: bool = False,
+    override: bool = False,
+    alias: str = "",
+    mode: str = "text",
 ) -> str:
     """Helper method to get the default path for saving conversations"""
+    if json_mode:
+        mode = "json"
+
     user = XSH.env.get("USER", "user")
-    data_dir = XSH.env.get(
-        "XONSH_DATA_DIR",
-        os.path.join(os.path.expanduser("~"), ".local", "share", "xonsh"),
-    )
-    chat_dir = os.path.join(data_dir, "chatgpt")
+    chat_dir = os.path.join(get_data_dir(), "chatgpt")
 
     if not os.path.exists(chat_dir):
         os.makedirs(chat_dir)
 
     date, idx = datetime.now().strftime("%Y-%m-%d"), 1
+    fmt, _, compression = mode.partition(".")
     path_prefix, ext = (
         os.path.join(chat_dir, f"{user}_{name or alias or 'chatgpt'}_{date}"),
-        ".json" if json_mode else ".txt",
+        {"json": ".json", "jsonl": ".jsonl"}.get(fmt, ".txt"),
     )
+    if compression:
+        ext += "." + compression
 
     if os.path.exists(f"{path_prefix}{ext}") and not override:
         while os.path.exists(path_prefix + f"_{idx}{ext}"):
@@ -160,6 +216,25 @@ def get_default_path(
     return path
 
 
+SAVE_MODES = ["text", "json", "jsonl", "text.gz", "json.gz", "text.xz", "json.xz"]
+
+COMPRESSED_EXTS = {".gz": gzip.open, ".xz": lzma.open}
+
+
+def open_convo(path: str, mode: str = "r") -> IO[str]:
+    """Opens a saved conversation as text, transparently (de)compressing
+    .gz and .xz files as they are read or written"""
+    opener = COMPRESSED_EXTS.get(os.path.splitext(path)[1])
+    if opener is None:
+        return open(path, mode)
+    return opener(path, mode + "t", encoding="utf-8")
+
+
+def get_env_bool(name: str, default: bool = False) -> bool:
+    """Returns a boolean environment variable, accepting strings such as '1' or 'True'"""
+    return to_bool(XSH.env.get(name, default))
+
+
 def convert_to_sys(msgs: Union[str, dict, list]) -> list[dict]:
     """Returns a list of dicts from a string of python dict, json, or yaml.
     Calls itself recursively until the result is either a list[dict]
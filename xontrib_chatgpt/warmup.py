@@ -0,0 +1,129 @@
+"""Background warm-up of the lazily loaded dependencies"""
+
+import time
+import threading
+from typing import Callable, Optional
+
+from xonsh.built_ins import XonshSession
+from xonsh.ansi_colors import ansi_partial_color_format
+
+from xontrib_chatgpt.utils import get_env_bool
+
+
+def _load_openai() -> None:
+    from xontrib_chatgpt import chatgpt, transport
+
+    chatgpt.openai.ChatCompletion
+    transport.openai.requestssession
+
+
+def _load_tiktoken() -> None:
+    # The one copy of the encoding, every token count goes through it
+    from xontrib_chatgpt import tokens
+
+    tokens.tiktoken.encode("warm up")
+
+
+def _load_pygments() -> None:
+    from xontrib_chatgpt import utils
+
+    utils.format_markdown("`warm up`\n```python\nwarm = 'up'\n```\n")
+
+
+COMPONENTS: list[tuple[str, Callable[[], None]]] = [
+    ("openai", _load_openai),
+    ("tiktoken", _load_tiktoken),
+    ("pygments", _load_pygments),
+]
+
+
+class Warmup:
+    """Loads the LazyObjects used by the first chat on a daemon thread
+
+    Each component is loaded in the same way the first chat would, so the
+    LazyObjects are already replaced by the real objects when it happens.
+    A component failing to load, i.e. tiktoken without network access, is
+    recorded and left for the first chat to retry.
+    """
+
+    def __init__(self, components: Optional[list] = None):
+        self.components = components if components is not None else COMPONENTS
+        self.timings: dict[str, float] = {}
+        self.errors: dict[str, str] = {}
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def started(self) -> bool:
+        return self._thread is not None
+
+    @property
+    def done(self) -> bool:
+        return self._thread is not None and not self._thread.is_alive()
+
+    def start(self) -> bool:
+        """Starts the warm-up if it has not run yet, returns whether it started"""
+        if self._thread is not None:
+            return False
+
+        self._thread = threading.Thread(
+            target=self._run, name="chatgpt-warmup", daemon=True
+        )
+        self._thread.start()
+        return True
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Waits for the warm-up to finish, returns whether it did"""
+        if self._thread is None:
+            return False
+        self._thread.join(timeout)
+        return self.done
+
+    def _run(self) -> None:
+        for name, load in self.components:
+            start = time.perf_counter()
+            try:
+                load()
+            except Exception as e:
+                self.errors[name] = f"{type(e).__name__}: {e}"
+            self.timings[name] = time.perf_counter() - start
+
+    def report(self) -> str:
+        """Returns the status and time taken by each component"""
+        if not self.started:
+            return "Warm-up has not run. Set $CHATGPT_WARMUP = True to enable it."
+
+        lines = [
+            ansi_partial_color_format(
+                "{BOLD_WHITE}Warm-up:{RESET} " + ("done" if self.done else "running")
+            )
+        ]
+
+        for name, _ in self.components:
+            if name in self.errors:
+                status = ansi_partial_color_format(
+                    "{BOLD_RED}failed{RESET} " + self.errors[name]
+                )
+            elif name in self.timings:
+                status = f"{self.timings[name] * 1000:.0f}ms"
+            else:
+                status = "pending"
+            lines.append(f"  {name}: {status}")
+
+        return "\n".join(lines)
+
+
+warmup = Warmup()
+
+
+def _on_pre_prompt(**_) -> None:
+    """Starts the warm-up before the first prompt, if enabled"""
+    if not warmup.started and get_env_bool("CHATGPT_WARMUP"):
+        warmup.start()
+
+
+def add_warmup(xsh: XonshSession) -> None:
+    xsh.builtins.events.on_pre_prompt(_on_pre_prompt)
+
+
+def rm_warmup(xsh: XonshSession) -> None:
+    xsh.builtins.events.on_pre_prompt.discard(_on_pre_prompt)
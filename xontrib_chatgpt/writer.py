@@ -0,0 +1,136 @@
+"""Background writer for saved conversations"""
+
+import os
+import tempfile
+import threading
+from typing import Callable, Optional
+
+from xonsh.built_ins import XonshSession
+
+
+def atomic_write(path: str, write: Callable[[str], None]) -> None:
+    """Calls write with a temporary path next to path, then moves it over
+    path in one step, so a crash mid-write never leaves a truncated file.
+
+    The temporary file is hidden and keeps the extension of path, so it is
+    compressed the same way and skipped when listing saved chats. It takes
+    the permissions of the file it replaces, new files are only readable by
+    their owner.
+    """
+    dir_name, base_name = os.path.split(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(
+        dir=dir_name, prefix=f".{base_name}.", suffix=os.path.splitext(path)[1]
+    )
+    os.close(fd)
+
+    try:
+        write(tmp)
+        try:
+            os.chmod(tmp, os.stat(path).st_mode & 0o7777)
+        except FileNotFoundError:
+            pass
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+class BackgroundWriter:
+    """Writes files on a daemon thread, one at a time
+
+    Only the latest write submitted for a path is run, any earlier one that
+    has not started yet is dropped. Every callback of the dropped writes is
+    still called once the latest one is done. A failed write is recorded in
+    errors instead of being raised.
+    """
+
+    def __init__(self):
+        self.errors: dict[str, str] = {}
+        self._pending: dict[str, tuple[Callable[[str], None], list[Callable]]] = {}
+        self._cond = threading.Condition()
+        self._busy = False
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def pending(self) -> int:
+        """Number of writes queued or running"""
+        with self._cond:
+            return len(self._pending) + self._busy
+
+    def submit(
+        self,
+        path: str,
+        write: Callable[[str], None],
+        done: Optional[Callable[[Optional[str]], None]] = None,
+    ) -> None:
+        """Queues write to be called with a temporary path, which then
+        replaces path. done is called with None, or the error if it failed."""
+        key = os.path.abspath(path)
+
+        with self._cond:
+            callbacks = self._pending.pop(key, (None, []))[1]
+            if done is not None:
+                callbacks.append(done)
+            self._pending[key] = (write, callbacks)
+
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name="chatgpt-writer", daemon=True
+                )
+                self._thread.start()
+            self._cond.notify_all()
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Waits for every queued write, returns whether they all finished"""
+        with self._cond:
+            return self._cond.wait_for(
+                lambda: not self._pending and not self._busy, timeout
+            )
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                if not self._pending:
+                    # A new thread is started by the next submit
+                    self._thread = None
+                    return
+                path = next(iter(self._pending))
+                write, callbacks = self._pending.pop(path)
+                self._busy = True
+
+            error = None
+            try:
+                atomic_write(path, write)
+                self.errors.pop(path, None)
+            except Exception as e:
+                error = self.errors[path] = f"{type(e).__name__}: {e}"
+
+            for done in callbacks:
+                try:
+                    done(error)
+                except Exception:
+                    pass
+
+            with self._cond:
+                self._busy = False
+                self._cond.notify_all()
+
+
+writer = BackgroundWriter()
+
+
+def _on_exit(**_) -> None:
+    """Finishes any save still being written before the shell exits"""
+    writer.flush()
+
+
+def add_writer(xsh: XonshSession) -> None:
+    xsh.builtins.events.on_exit(_on_exit)
+
+
+def rm_writer(xsh: XonshSession) -> None:
+    xsh.builtins.events.on_exit.discard(_on_exit)
+    writer.flush()